@@ -0,0 +1,113 @@
+import pandas as pd
+
+#The Step 3 match of main_process for a whole report at once. The resolved rows are loaded into a DataFrame and the
+#NDC/RxCUI/SCD equality, ingredient, dose form and strength flags are worked out as column operations, once for every
+#distinct (eRxCUI, dRxCUI, NDCs equal) pair. The outcomes are the ones the row by row cascade in main_process gives, in
+#the same form as its MatchMemo: (match status, incorrect action 1 to 4), or None for a row dropped for missing details.
+#Fields that the cascade lowercases have to be strings, the others may also be None (the SCD keys are often missing).
+#Rows that do not fit (a missing TTY, a list of ingredients) are left out, main_process works those out row by row
+#like before. None is swapped for the missing marker so None == None still holds, the way it does in Python.
+
+#The row keys behind the single letter variables of main_process, a to t in order
+match_fields = ['eNDC', 'eRxCUI', 'eRxNorm TTY', 'eRxNorm Ingredient', 'eRxNorm Dose Form', 'eRxNorm Strength Details',
+                'eSCD RxCUI', 'eSCD RxNorm Ingredient', 'eSCD RxNorm Dose Form', 'eSCD RxNorm Strength Detail',
+                'dNDC', 'dRxCUI', 'dRxNorm TTY', 'dRxNorm Ingredient', 'dRxNorm Dose Form', 'dRxNorm Strength Details',
+                'dSCD RxCUI', 'dSCD RxNorm Ingredient', 'dSCD RxNorm Dose Form', 'dSCD RxNorm Strength Details']
+match_letters = 'abcdefghijklmnopqrst'
+lowercased_letters = 'cdfhnpr'  # Fields the cascade calls .lower() on
+missing = '\x00missing'  # Stands in for None, it never equals a real value or ''
+
+def _equivalent(column1, column2, truth_table):
+    #EquivalenceClasses.equivalent for two whole columns
+    class_ids = truth_table.class_ids
+    ids1 = column1.map(class_ids)
+    return ids1.notna() & (column1 != column2) & (ids1 == column2.map(class_ids))
+
+def _listed(column1, column2, special_case_truth_table):
+    #DirectedPairs.contains for two whole columns
+    if not special_case_truth_table.pairs:
+        return pd.Series(False, index=column1.index)
+    return pd.Series(pd.MultiIndex.from_arrays([column1, column2]).isin(list(special_case_truth_table.pairs)), index=column1.index)
+
+def _share_prefix(column1, column2, match_rules):
+    #MatchRules.share_prefix for one pair of lowercased columns
+    shared = pd.Series(False, index=column1.index)
+    for prefix in match_rules.ingredient_prefixes:
+        shared |= column1.str.startswith(prefix) & column2.str.startswith(prefix)
+    return shared
+
+def _strength_exempt(column1, column2, match_rules):
+    #MatchRules.strength_exempt for one pair of lowercased columns
+    return (column1 == column2) & column1.isin(match_rules.strength_exempt_ingredients)
+
+def _fits(value, letter):
+    return isinstance(value, str) or (value is None and letter not in lowercased_letters)
+
+def resolved_frame(rows):
+    """
+    Input: List of dictionaries (the non compound rows of main_process)
+    Output: DataFrame with one column per letter a to t (None swapped for missing), the match key (key_b, key_l,
+    ndc_equal), one row per distinct match key, holding only the rows the batch can work out
+    """
+    values = [[row.get(field) for field in match_fields] for row in rows]
+    values = [row for row in values if all(_fits(value, letter) for value, letter in zip(row, match_letters))]
+    frame = pd.DataFrame(values, columns=list(match_letters), dtype=object)
+    frame = frame.assign(key_b=frame['b'], key_l=frame['l'], ndc_equal=pd.Series(dtype=bool))
+    if frame.empty:
+        return frame
+    for letter in match_letters:
+        frame[letter] = frame[letter].map(lambda value: missing if value is None else value)
+    frame['ndc_equal'] = frame['a'] == frame['k']
+    return frame.drop_duplicates(subset=['key_b', 'key_l', 'ndc_equal']).reset_index(drop=True)
+
+def match_outcomes(rows, ing_truth_table, df_truth_table, special_case_truth_table, match_rules):
+    """
+    Input: List of dictionaries (the non compound rows of main_process), EquivalenceClasses (ingredients),
+    EquivalenceClasses (dose forms), DirectedPairs (special case dose forms), MatchRules (ingredient prefixes and
+    strength exempt ingredients, its dose form exceptions are not used)
+    Output: Dictionary (eRxCUI, dRxCUI, NDCs equal) -> outcome, for the rows the batch can work out
+    """
+    frame = resolved_frame(rows)
+    if frame.empty:
+        return {}
+    a, b, c, d, e, f, g, h, i, j, k, l, m, n, o, p, q, r, s, t = (frame[letter] for letter in match_letters)
+    dl, hl, nl, rl = d.str.lower(), h.str.lower(), n.str.lower(), r.str.lower()
+
+    rxcui_equal = ~frame['ndc_equal'] & (b == l)
+    branded = c.str.lower().str.contains('b', regex=False)
+    scd_equal = branded & (((b == q) & (q != '')) | ((g == l) & (q != '')) | ((g != '') & (g == q)))
+    compared = ~frame['ndc_equal'] & ~rxcui_equal & ~scd_equal
+    dropped = compared & ((d == '') | (e == '') | (f == '') | (n == '') | (o == '') | (p == ''))
+
+    #The branded rows also compare the SCD versions, the others only compare e to d
+    ingredient_equal = (dl == nl) | (branded & (((r != '') & (dl == rl)) | ((r != '') & (hl == rl)) | ((h != '') & (hl == nl))))
+    ingredient_equal |= (_equivalent(d, n, ing_truth_table) | _equivalent(d, r, ing_truth_table) |
+                         _equivalent(h, r, ing_truth_table) | _equivalent(h, n, ing_truth_table))
+    #Branded rows pass main_process all four ingredient pairs, the others only (d, n)
+    ingredient_equal |= _share_prefix(dl, nl, match_rules) | (branded & (_share_prefix(dl, rl, match_rules) |
+                                                                       _share_prefix(hl, nl, match_rules) | _share_prefix(hl, rl, match_rules)))
+    dose_form_equal = (e == o) | (branded & (((e != '') & (e == s)) | ((i != '') & (i == s)) | ((i != '') & (i == o))))
+    dose_form_equal |= (_equivalent(e, o, df_truth_table) | _equivalent(i, s, df_truth_table) |
+                        _equivalent(e, s, df_truth_table) | _equivalent(i, o, df_truth_table))
+    dose_form_equal |= (_listed(e, o, special_case_truth_table) | _listed(i, s, special_case_truth_table) |
+                        _listed(i, o, special_case_truth_table) | _listed(e, s, special_case_truth_table))
+    t_given = (t != '') & (t != missing)
+    strength_equal = (f.str.lower() == p.str.lower()) | (branded & ((t_given & (f == t)) | (t_given & (j == t)) | ((j != '') & (j == p))))
+    strength_equal |= _strength_exempt(dl, nl, match_rules) | (branded & (_strength_exempt(dl, rl, match_rules) |
+                                                                         _strength_exempt(hl, nl, match_rules) | _strength_exempt(hl, rl, match_rules)))
+    components_equal = ingredient_equal & dose_form_equal & strength_equal
+
+    outcomes = {}
+    for index, key in enumerate(zip(frame['key_b'], frame['key_l'], frame['ndc_equal'])):
+        if frame['ndc_equal'].iat[index] or rxcui_equal.iat[index]:
+            outcomes[key] = ("2", 0, 0, 0, 0)
+        elif scd_equal.iat[index]:
+            outcomes[key] = ("3", 0, 0, 0, 0)
+        elif dropped.iat[index]:
+            outcomes[key] = None
+        elif components_equal.iat[index]:
+            outcomes[key] = ("2", 0, 0, 0, 1)
+        else:
+            outcomes[key] = ("1", int(not ingredient_equal.iat[index]), int(not strength_equal.iat[index]),
+                             int(not dose_form_equal.iat[index]), '')
+    return outcomes
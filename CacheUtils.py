@@ -0,0 +1,292 @@
+import threading
+from collections import defaultdict, OrderedDict
+from concurrent.futures import Future
+
+#Caches shared by CachingProcessSaveRx, ProcessTysonData and ProcessBremoRetailData.
+
+class _NoRxCUI:
+    """
+    Cached answer for an NDC that RxNav has no RxCUI for. The caches use None to mean a miss, so a negative
+    answer needs a value of its own to be cached. There is only one, NO_RXCUI, so compare with "is".
+    """
+    def __repr__(self):
+        return 'NO_RXCUI'
+
+    def __bool__(self):
+        return False
+
+    def __reduce__(self):
+        return 'NO_RXCUI'
+
+NO_RXCUI = _NoRxCUI()
+
+class CacheStats:
+    """
+    Hit, miss and eviction counters kept by every cache so each lookup kind can be sized on its own.
+    """
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def stats(self):
+        """
+        Output: Dictionary with the name, policy, size, capacity, hits, misses, evictions and hit rate of the cache
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'policy': self.policy,
+                'size': len(self.cache),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+class LFUCache(CacheStats):
+    """
+    Least frequently used cache where get and put both run in constant time.
+    Keys are grouped into buckets by access frequency. Each bucket is an OrderedDict, so when
+    several keys share the lowest frequency the least recently used one is evicted first.
+    The cache is thread safe, since the NDC worker threads share it.
+    """
+    policy = 'lfu'
+
+    def __init__(self, capacity, name='lfu_cache'):
+        super().__init__(name, capacity)
+        self.cache = {}  # Dictionary to store API responses
+        self.frequency = {}  # Dictionary to store access frequencies
+        self.buckets = defaultdict(OrderedDict)  # Frequency -> keys with that frequency, oldest access first
+        self.min_frequency = 0  # Lowest frequency currently in the cache, the next eviction comes from this bucket
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def _touch(self, key):
+        # Move the key from its frequency bucket to the next one up
+        freq = self.frequency[key]
+        bucket = self.buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[freq]
+            if self.min_frequency == freq:
+                self.min_frequency = freq + 1
+        self.frequency[key] = freq + 1
+        self.buckets[freq + 1][key] = None
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.cache:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(key)
+            return self.cache[key]
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+
+        with self.lock:
+            if key in self.cache:
+                # Updating an existing key counts as an access
+                self.cache[key] = value
+                self._touch(key)
+                return
+
+            # Check if the cache is full and needs eviction
+            if len(self.cache) >= self.capacity:
+                # The first key in the lowest frequency bucket is the least recently used of the least frequently used
+                bucket = self.buckets[self.min_frequency]
+                lfu_key, _ = bucket.popitem(last=False)
+                if not bucket:
+                    del self.buckets[self.min_frequency]
+                del self.cache[lfu_key]
+                del self.frequency[lfu_key]
+                self.evictions += 1
+
+            # Add the new key-value pair with a frequency of 1
+            self.cache[key] = value
+            self.frequency[key] = 1
+            self.buckets[1][key] = None
+            self.min_frequency = 1
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.frequency.clear()
+            self.buckets.clear()
+            self.min_frequency = 0
+
+class LRUCache(CacheStats):
+    """
+    Least recently used cache, get and put run in constant time. Suits entries that are looked up in bursts,
+    like the RxNorm details of the drugs on the report that is being processed. Thread safe.
+    """
+    policy = 'lru'
+
+    def __init__(self, capacity, name='lru_cache'):
+        super().__init__(name, capacity)
+        self.cache = OrderedDict()  # Oldest access first
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.cache:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            elif len(self.cache) >= self.capacity:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+            self.cache[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+cache_policies = {'lfu': LFUCache, 'lru': LRUCache}
+
+def make_cache(policy, capacity, name):
+    """
+    Input: policy ('lfu' or 'lru'), the maximum number of entries and a name used in the statistics
+    Output: a new cache of that policy
+    """
+    if policy not in cache_policies:
+        raise ValueError(f"Unknown cache policy {policy}, expected one of {', '.join(cache_policies)}")
+    return cache_policies[policy](capacity, name=name)
+
+class SingleFlight:
+    """
+    Coalesces concurrent lookups of the same key. The first caller for a key runs the lookup, callers that ask for the
+    same key while it is running wait on its Future and get the same result (or the same exception) instead of
+    calling RxNav again. Once the lookup is done the key is forgotten, the caches keep the result after that.
+    """
+    def __init__(self, name='single_flight'):
+        self.name = name
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, function):
+        """
+        Input: key, Function (takes no arguments, does the lookup for key)
+        Output: What function returns, from this call or from the call already running for key
+        """
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                self.calls += 1
+                future = self.in_flight[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+class MatchMemo:
+    """
+    Match outcomes already worked out in this run, keyed on the (eRxCUI, dRxCUI, NDCs equal) of a row. The outcome of the
+    match step only depends on the RxNorm details of the two RxCUIs and on the rules (truth tables and lists), so rows
+    that repeat a pair reuse the outcome. The outcome is a tuple (match status, incorrect action 1 to 4), or None when
+    the row was dropped for missing RxNorm details. The memo is emptied whenever the rules fingerprint changes.
+    """
+    def __init__(self, name='match_memo'):
+        self.name = name
+        self.lock = threading.Lock()
+        self.outcomes = {}
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+
+    def use_rules(self, fingerprint):
+        """
+        Input: String (rules_fingerprint of the rules the coming rows are matched with)
+        """
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self.outcomes.clear()
+                self.fingerprint = fingerprint
+
+    def lookup(self, key):
+        """
+        Input: (eRxCUI, dRxCUI, NDCs equal)
+        Output: (found, outcome), read and counted as a hit or miss under one lock, so use_rules emptying the memo
+        cannot land between finding the key and reading its outcome (a remembered outcome can itself be None)
+        """
+        with self.lock:
+            if key in self.outcomes:
+                self.hits += 1
+                return True, self.outcomes[key]
+            self.misses += 1
+            return False, None
+
+    def get(self, key):
+        with self.lock:
+            return self.outcomes.get(key)
+
+    def put(self, key, outcome):
+        with self.lock:
+            self.outcomes[key] = outcome
+
+    def update(self, outcomes):
+        """
+        Input: Dictionary key -> outcome, worked out for many rows at once (BatchMatcher.match_outcomes)
+        """
+        with self.lock:
+            self.outcomes.update(outcomes)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'name': self.name, 'size': len(self.outcomes), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+def build_rxcui_index(rxcui_data):
+    """
+    Input: List of dictionaries from SaveRxCUIDetails.csv (each with an 'RxCUI' key)
+    Output: Dictionary of the same rows keyed by the RxCUI as a string. When an RxCUI shows up more than once
+    the first row is kept, the same one the old list search would have found.
+    """
+    rxcui_index = {}
+    for row in rxcui_data:
+        rxcui = row.get('RxCUI')
+        if rxcui is not None and rxcui != '':
+            rxcui_index.setdefault(str(rxcui), row)
+    return rxcui_index
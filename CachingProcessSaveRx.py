@@ -1,59 +1,56 @@
-import requests
+from RxNavClient import rxnav_client
 import csv
 import pprint
 from csv import DictWriter
 from timeit import default_timer as timer
 import pandas as pd
 import os
-from collections import defaultdict, OrderedDict
-from time import sleep
+from LocalRxStore import shared_ndc_store
+from CacheUtils import NO_RXCUI, make_cache, build_rxcui_index, SingleFlight, MatchMemo
+from RxConcept import extract_concept, as_concept
+from NDCUtils import canonical_ndc
+from TruthTables import EquivalenceClasses, DirectedPairs, rules_fingerprint
+from BatchMatcher import match_outcomes
+from MatchRules import match_rules
+from RxRecords import RxNormDetails, RxNormRow
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 #Add Natural Language Processing Info Specific to Med12)
 # nlp = spacy.load("en_med12_trf")
 #Set Pretty Print Rules to make the dictionaries look nice and easier to read when printed
 pp = pprint.PrettyPrinter(indent=2, sort_dicts=False, width=100)
 
-connect_timeout = 10
-read_timeout = 100
-
-class LFUCache:
-    def __init__(self, capacity):
-        self.capacity = capacity
-        self.cache = {}  # Dictionary to store API responses
-        self.frequency = defaultdict(int)  # Dictionary to store access frequencies
-        self.order = OrderedDict()  # Ordered dictionary to maintain LFU order
-
-    def get(self, key):
-        if key not in self.cache:
-            return None
-        # Update the access frequency
-        self.frequency[key] += 1
-        # Move the key to the end of the LFU order
-        self.order.move_to_end(key)
-        return self.cache[key]
-
-    def put(self, key, value):
-        if self.capacity == 0:
-            return
-
-        # Check if the cache is full and needs eviction
-        if len(self.cache) >= self.capacity:
-            # Find the least frequently used item
-            lfu_key = min(self.frequency, key=self.frequency.get)
-            # Remove the least frequently used item from the cache and frequency dictionary
-            del self.cache[lfu_key]
-            del self.frequency[lfu_key]
-            del self.order[lfu_key]
-
-        # Add the new key-value pair to the cache and update frequency
-        self.cache[key] = value
-        self.frequency[key] += 1
-        # Add the key to the end of the LFU order
-        self.order[key] = None
-
-capacity = 100  # Set the capacity according to your requirements
-lfu_cache = LFUCache(capacity)
+batch_match_rows = True  # Work out the match of every distinct RxCUI pair of a report at once with BatchMatcher before the row by row step
+ndc_workers = 8  # Number of worker threads used to resolve NDCs to RxCUIs, set to 1 to resolve one row at a time
+print_rows = False  # Print every row and its RxNorm details as main_process goes through them, for debugging
+
+#NDC -> RxCUI mappings are small and the same NDCs come back every month, so they get a large LFU cache.
+#RxCUI -> RxNorm details dictionaries are heavier and mostly reused within one report, so they get their own LRU cache.
+ndc_cache_policy = 'lfu'
+ndc_cache_capacity = 100000
+rxnorm_cache_policy = 'lru'
+rxnorm_cache_capacity = 5000
+ndc_cache = make_cache(ndc_cache_policy, ndc_cache_capacity, 'ndc_to_rxcui')
+ndc_store = None  # NDC -> RxCUI mappings saved between runs (NDCRxCUIStore), opened on first use by get_ndc_store
+no_rxcui_value = ''  # What fetch_data_from_api gives back for an NDC with no RxCUI: a blank RxCUI, the same thing RxNav's empty rxcui gave before
+rxnorm_cache = make_cache(rxnorm_cache_policy, rxnorm_cache_capacity, 'rxcui_to_details')
+#Lookups that are running right now, so two workers asking for the same NDC or RxCUI at once only call RxNav once
+ndc_flight = SingleFlight('ndc_to_rxcui')
+rxnorm_flight = SingleFlight('rxcui_to_details')
+match_memo = MatchMemo('match_outcomes')  # Match outcomes by (eRxCUI, dRxCUI, NDCs equal), kept for the whole run
+caching_match_rules = match_rules.without_dose_form_exceptions()  # The shared MatchRules.json prefixes and strength exempt ingredients, this match step has no dose form exceptions
+#historystatus.json documents, already read into RxConcepts, shared by get_name_tty and every TTY handler so linked
+#concepts (the SCD of an SBD, pack RxCUIs, remapped RxCUIs) are only downloaded and read once per run
+historystatus_cache_policy = 'lru'
+historystatus_cache_capacity = 20000
+historystatus_cache = make_cache(historystatus_cache_policy, historystatus_cache_capacity, 'rxcui_historystatus')
+
+def cache_stats():
+    """
+    Output: List with the statistics dictionary of each lookup cache (NDC -> RxCUI, RxCUI -> details and RxCUI -> historystatus)
+    """
+    return [ndc_cache.stats(), rxnorm_cache.stats(), historystatus_cache.stats()]
 
 def read_csv_to_dicts(filepath, encoding='utf-8', newline='', delimiter=','):
     """
@@ -83,158 +80,77 @@ def get_rxnorm_rxcui(ndc, count):
     """
     Takes an NDC number, looks it up at the endpoint url (an RxNorm API)
     and looks to see if the NDC number exists and what its corresponding rxcui is
-    Also has a clause for if the API doesn't work as expected
+    A failed call is retried by rxnav_client with backoff, if RxNav keeps failing the error is raised to the caller
     Accepts the count, an integer, which is only used if there is a Response Error. If so it reports
     out the count to let the user know which entry/row of data caused the error. 
 
     Inputs: Integer (11 digit number)
     Outputs: Integer (rxcui)
     """
-    if (len(ndc)) < 11:
-            #Add 0s to the left of the number to ensure it's 11 digits long and then replace the NDC with the padded one
-            padded_number = str(ndc).zfill(11)
-            #item['Product Code (NDC)'] == padded_number
-            connect_timeout = 10
-            read_timeout = 100
-            base_url = "https://rxnav.nlm.nih.gov/REST"
-            endpoint = f"{base_url}/ndcstatus.json?ndc={padded_number}"
-            max_try = 5
-            try_number = 1
-            while try_number <= max_try:
-                response = requests.get(endpoint, timeout=(connect_timeout, read_timeout))
-                if response.status_code == 200:
-                    data = response.json()
-                    #pp.pprint(data)
-                    if "ndcStatus" in data and data["ndcStatus"] == "noRxcui":
-                        print(f"No medication found for NDC: {ndc}")
-                    elif "ndcStatus" in data and data["ndcStatus"] != "noRxcui":
-                        rxcui = data["ndcStatus"]["rxcui"]
-                    else:
-                        print("Invalid response from API")
-                    return rxcui
-                else:
-                    print(f"API failed on {endpoint}, entry number {count}, Trying Again, attempt number {try_number} of 5")
-                    sleep(4)
-                    try_number +=1
+    #Turn the NDC into its 11 digit form, padding each part of a hyphenated 10 digit NDC the way its layout needs
+    padded_number = canonical_ndc(ndc)
+    base_url = "https://rxnav.nlm.nih.gov/REST"
+    endpoint = f"{base_url}/ndcstatus.json?ndc={padded_number}"
+    data = rxnav_client.get_json(endpoint, description=f"{endpoint}, entry number {count}")
+    #pp.pprint(data)
+    if "ndcStatus" in data and (data["ndcStatus"] == "noRxcui" or not data["ndcStatus"].get("rxcui")):
+        print(f"No medication found for NDC: {ndc}")
+        return NO_RXCUI
+    elif "ndcStatus" in data and data["ndcStatus"] != "noRxcui":
+        rxcui = data["ndcStatus"]["rxcui"]
     else:
-        ndc = ndc
-        base_url = "https://rxnav.nlm.nih.gov/REST"
-        endpoint = f"{base_url}/ndcstatus.json?ndc={ndc}"
-        connect_timeout = 10
-        read_timeout = 100
-        max_try = 5
-        try_number = 1
-        while try_number <= max_try:
-            response = requests.get(endpoint, timeout=(connect_timeout, read_timeout))
-            try:
-                if response.status_code == 200:
-                    data = response.json()
-                    #pp.pprint(data)
-                    if "ndcStatus" in data and data["ndcStatus"] == "noRxcui":
-                        print(f"No medication found for NDC: {ndc}")
-                    elif "ndcStatus" in data and data["ndcStatus"] != "noRxcui":
-                        rxcui = data["ndcStatus"]["rxcui"]
-                    else:
-                        print("Invalid response from API")
-                    return rxcui
-            except Exception as e:
-                print(f"API failed on {endpoint}, entry number {count}, Trying Again, attempt number {try_number} of 5")
-                sleep(4)
-                try_number +=1
+        print("Invalid response from API")
+        raise ValueError(f"Invalid response from API for NDC: {ndc}")
+    return rxcui
+
+def get_concept(rxcui):
+    """
+    Gets the historystatus.json document of an RxCUI from RxNav and reads it into an RxConcept with extract_concept.
+    Each document is downloaded and read once, then the RxConcept is served from historystatus_cache.
+
+    Input: RxCUI (string or integer)
+    Output: RxConcept
+    """
+    key = str(rxcui)
+    concept = historystatus_cache.get(key)
+    if concept is not None:
+        return concept
+    #Only successful answers are cached. rxnav_client retries a failed call, if it still fails the error is raised
+    #so the caller can report it
+    concept = extract_concept(rxnav_client.get_json(f"rxcui/{key}/historystatus.json"))
+    historystatus_cache.put(key, concept)
+    return concept
 
 def get_dose_forms(rxcui_data):
     """
-    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. The function adds the doseFormName
-    and information from the doseFormGroupConcept(s) to the list of dose form info. The try/except is incase the doseFormGroupConcept info
-    doesn't exist for a dictionary. Otherwise it counts the number of times doseFormGroupName is mentioned and then pulls the value from
-    that key each time.
+    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. Returns the doseFormName
+    followed by the doseFormGroupName(s) from the doseFormGroupConcept(s). The values are worked out once by extract_concept.
 
-    Inputs: Dictionary of Data from the Json the API pulled in
+    Inputs: Dictionary of Data from the Json the API pulled in (or the RxConcept already made from it)
     Outputs: List of Dose Form Information
     """
-    if 'doseFormConcept' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']:
-        dose_form_options = []
-        dose_form_options.append(rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName'])
-        if 'doseFormGroupName' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]:
-            try:
-                m = sum('doseFormGroupName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'])
-                n = 1
-                while n <= m:
-                    dose = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][n-1]['doseFormGroupName']
-                    dose_form_options.append(dose)
-                    n += 1
-            except:
-                pass
-        elif 'doseFormGroupName' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][0]:
-            try:
-                m = sum('doseFormGroupName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'])
-                n = 1
-                while n <= m:
-                    dose = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][n-1]['doseFormGroupName']
-                    dose_form_options.append(dose)
-                    n += 1
-            except:
-                pass
-    else:
-        dose_form_options = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][0]['doseFormGroupName']
-    return dose_form_options
+    return as_concept(rxcui_data).dose_forms
 
 def get_multiple_ingredients(rxcui_data):
     """
-    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. The function adds the Ingredient
-    information from the activeIngredientName(s) to the list of ingredient info. This function is used when we know there is more than one
-    ingredient for the medication.
+    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. Returns the
+    activeIngredientName(s) of the medication. This function is used when we know there is more than one ingredient for the medication.
 
-    Inputs: Dictionary of Data from the Json the API pulled in
+    Inputs: Dictionary of Data from the Json the API pulled in (or the RxConcept already made from it)
     Outputs: List of Ingredients
     """
-    if 'ingredientAndStrength' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']:
-        ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
-        n = 1
-        ingredients = []
-        while n <= ingredient_count:
-            ingredients.append(rxcui_data["rxcuiStatusHistory"]["definitionalFeatures"]["ingredientAndStrength"][n-1]["activeIngredientName"])
-            n += 1
-    elif 'ingredientName' in rxcui_data["rxcuiStatusHistory"]["derivedConcepts"]["ingredientConcept"][0]:
-            ingredients = rxcui_data["rxcuiStatusHistory"]["derivedConcepts"]["ingredientConcept"][0]['ingredientName']
-
-    else:
-            ingredients = ""
-    return ingredients
+    return as_concept(rxcui_data).ingredients
 
 def get_multiple_strengths(rxcui_data):
     """
-    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. The function adds the strength
-    information from the numerator and denominator values and units to the list of ingredient info. This function is used when we know there is more than one
-    ingredient for the medication, so therefore more than one set of strength information.
+    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. Returns the strength
+    of every ingredient as "numeratorValue numeratorUnit/denominatorValue denominatorUnit". This function is used when we know there
+    is more than one ingredient for the medication, so therefore more than one set of strength information.
 
-    Inputs: Dictionary of Data from the Json the API pulled in
+    Inputs: Dictionary of Data from the Json the API pulled in (or the RxConcept already made from it)
     Outputs: List of Strength Details
     """
-    if 'ingredientAndStrength' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']:
-        ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
-        n = 1
-        strength_numerators = []
-        strength_denominators = []
-        while n <= ingredient_count:
-            x = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorValue']
-            y = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorUnit']
-            a = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorValue']
-            b = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorUnit']
-            strength_numerators.append(f"{x} {y}")
-            strength_denominators.append(f"{a} {b}")
-            n += 1
-
-        m = 0
-        Strength_Details = []
-        while m <= len(strength_numerators) - 1:
-            numerator = strength_numerators[m]
-            denominator = strength_denominators[m]
-            Strength_Details.append(f"{numerator}/{denominator}")
-            m += 1
-    else:
-        Strength_Details = ['N/A']
-    return Strength_Details
+    return as_concept(rxcui_data).strengths
 
 def get_ingredient_strength_doseform(rxcui):
     """
@@ -245,52 +161,25 @@ def get_ingredient_strength_doseform(rxcui):
     RxNorm Dose Form, Remapped RxNorm Strength Details. The values come from the RxCui given as the input.
     """
     rx_norm_info = {}
-    url_rxcui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/historystatus.json'
-    response = requests.get(url_rxcui, timeout=(connect_timeout, read_timeout))
-    rxcui_data = response.json()
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    concept = get_concept(rxcui)
+    name = concept.name
     rx_norm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rx_norm_info['RxNorm TTY'] = tty
-    if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-        ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-        dose_form = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName']
-        status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
-        source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-        strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-        strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-        strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-        strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+    if concept.is_multiple_ingredient == "NO":
+        ingredient = concept.ingredient
+        dose_form = concept.dose_form
+        status = concept.status
+        source = concept.source
         rx_norm_info["RxNorm Ingredient"] = ingredient
         rx_norm_info["RxNorm Dose Form"] = dose_form
-        rx_norm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+        rx_norm_info["RxNorm Strength Details"] = concept.strength
     else:
-        ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
-        dose_form = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName']
-        # print(f"Ingredient Count: {ingredient_count}")
-        n = 1
-        ingredients = []
-        strength_numerators = []
-        strength_denominators = []
-        while n <= ingredient_count:
-            ingredients.append(rxcui_data["rxcuiStatusHistory"]["definitionalFeatures"]["ingredientAndStrength"][n-1]["activeIngredientName"])
-            x = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorValue']
-            y = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorUnit']
-            a = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorValue']
-            b = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorUnit']
-            strength_numerators.append(f"{x} {y}")
-            strength_denominators.append(f"{a} {b}")
-            n += 1
-        rx_norm_info["RxNorm Ingredient"] = ingredients
+        ingredient_count = concept.ingredient_count
+        dose_form = concept.dose_form
+        rx_norm_info["RxNorm Ingredient"] = concept.ingredients
         rx_norm_info["RxNorm Dose Form"] = dose_form
-        m = 0
-        Strength_Details = []
-        while m <= len(strength_numerators) - 1:
-            numerator = strength_numerators[m]
-            denominator = strength_denominators[m]
-            Strength_Details.append(f"{numerator}/{denominator}")
-            m += 1
-        rx_norm_info["RxNorm Strength Details"] = Strength_Details
+        rx_norm_info["RxNorm Strength Details"] = concept.strengths
 
     return(rx_norm_info)
 
@@ -303,55 +192,46 @@ def scd_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+    status = concept.status
     if status != "NotCurrent" and status != "Remapped":
         #If the tty is an SCD, and there is only 1 ingredient to this product -
-        if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            dose_form = get_dose_forms(rxcui_data)
+        if concept.is_multiple_ingredient == "NO":
+            ingredient = concept.ingredient
+            dose_form = concept.dose_forms
             # print(f"Dose Form: {dose_form}")
-            source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-            strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+            source = concept.source
             rxnorm_info["RxNorm Ingredient"] = ingredient
             rxnorm_info["RxNorm Dose Form"] = dose_form
-            rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+            rxnorm_info["RxNorm Strength Details"] = concept.strength
         #If the tty is an SCD, and has multiple ingredients
         else:
-            ingredients = get_multiple_ingredients(rxcui_data)
-            dose_form = get_dose_forms(rxcui_data)
-            Strength_Details = get_multiple_strengths(rxcui_data)
+            ingredients = concept.ingredients
+            dose_form = concept.dose_forms
+            Strength_Details = concept.strengths
             rxnorm_info["RxNorm Ingredient"] = ingredients
             rxnorm_info["RxNorm Dose Form"] = dose_form
             rxnorm_info["RxNorm Strength Details"] = Strength_Details
     elif status == "Remapped":
-        remapped_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['remappedConcept'][0]['remappedRxCui']
-        remapped_url = f'https://rxnav.nlm.nih.gov/REST/rxcui/{remapped_rxcui}/historystatus.json'
-        response3 = requests.get(remapped_url, timeout=(connect_timeout, read_timeout))
-        remapped_rxcui_data = response3.json()
-        remapped_tty = remapped_rxcui_data['rxcuiStatusHistory']['attributes']['tty']
-        if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            dose_form = get_dose_forms(remapped_rxcui_data)
-            strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        remapped_rxcui = concept.remapped_rxcui
+        remapped_concept = get_concept(remapped_rxcui)
+        remapped_tty = remapped_concept.tty
+        if remapped_concept.is_multiple_ingredient == "NO":
+            ingredient = remapped_concept.ingredient
+            dose_form = remapped_concept.dose_forms
             rxnorm_info["RxNorm Ingredient"] = ingredient
             rxnorm_info["RxNorm Dose Form"] = dose_form
-            rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+            rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
         #If the remappped_tty is an SCD has more than 1 ingredient
-        elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
-            ingredients = get_multiple_ingredients(remapped_rxcui_data)
-            dose_form = get_dose_forms(remapped_rxcui_data)
-            Strength_Details = get_multiple_strengths(remapped_rxcui_data)
+        elif remapped_concept.is_multiple_ingredient == "YES":
+            ingredients = remapped_concept.ingredients
+            dose_form = remapped_concept.dose_forms
+            Strength_Details = remapped_concept.strengths
             rxnorm_info["RxNorm Ingredient"] = ingredients
             rxnorm_info["RxNorm Dose Form"] = dose_form
             rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -376,80 +256,71 @@ def sbd_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
 
-    status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+    status = concept.status
     if status != 'NotCurrent':
     # source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
     #If the Rxcui of the SBD isn't remapped
         if status != "Remapped":
         #If the SBD has only 1 ingredient
-            if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
+            if concept.is_multiple_ingredient == "NO":
                 #Get all the original rxcui info
-                ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                dose_form = get_dose_forms(rxcui_data)
-                strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                ingredient = concept.ingredient
+                dose_form = concept.dose_forms
                 rxnorm_info["RxNorm Ingredient"] = ingredient
                 rxnorm_info["RxNorm Dose Form"] = dose_form
-                rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                rxnorm_info["RxNorm Strength Details"] = concept.strength
             #If the SBD has more than 1 ingredient
-            elif rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+            elif concept.is_multiple_ingredient == "YES":
                 #Get all the original rxcui info
-                ingredients = get_multiple_ingredients(rxcui_data)
-                dose_form = get_dose_forms(rxcui_data)
-                Strength_Details = get_multiple_strengths(rxcui_data)
+                ingredients = concept.ingredients
+                dose_form = concept.dose_forms
+                Strength_Details = concept.strengths
                 rxnorm_info["RxNorm Ingredient"] = ingredients
                 rxnorm_info["RxNorm Dose Form"] = dose_form
                 rxnorm_info["RxNorm Strength Details"] = Strength_Details
-            scd_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['scdConcept']['scdConceptRxcui']
+            scd_rxcui = concept.scd_rxcui
             #Now find the RXNorm info from the SCD RxCui
-            url_scd_cui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{scd_rxcui}/historystatus.json'
-            response2 = requests.get(url_scd_cui, timeout=(connect_timeout, read_timeout))
-            scd_cui_data = response2.json()
+            scd_concept = get_concept(scd_rxcui)
             #If the SCD CUI isn't remapped:
-            if scd_cui_data['rxcuiStatusHistory']['metaData']['status'] != "Remapped":
+            if scd_concept.status != "Remapped":
                 #Get the tty of this data. We expect it to be an SCD
-                scd_tty = scd_cui_data["rxcuiStatusHistory"]["attributes"]["tty"]
+                scd_tty = scd_concept.tty
                 #Get the name of the drug from this info
-                scd_name = scd_cui_data["rxcuiStatusHistory"]["attributes"]["name"]
+                scd_name = scd_concept.name
                 #Get info from scd rx cui
                 rxnorm_info["C RxNorm Name"] = scd_name
                 rxnorm_info['C RxNorm TTY'] = scd_tty
                 rxnorm_info["C RxNorm RxCUI"] = scd_rxcui
                 #The scd cui only has one ingredient
-                if scd_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                    scd_ingredient = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                    scd_dose_form = get_dose_forms(scd_cui_data)
-                    scd_status = scd_cui_data["rxcuiStatusHistory"]['metaData']['status']
-                    scd_source = scd_cui_data["rxcuiStatusHistory"]['metaData']['source']
-                    scd_strength_numerator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                    scd_strength_numeratorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                    scd_strength_denominator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                    scd_strength_denominatorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                if scd_concept.is_multiple_ingredient == "NO":
+                    scd_ingredient = scd_concept.ingredient
+                    scd_dose_form = scd_concept.dose_forms
+                    scd_status = scd_concept.status
+                    scd_source = scd_concept.source
                     rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
                     rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-                    rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+                    rxnorm_info["C RxNorm Strength Details"] = scd_concept.strength
                 #If the scd cui has more than one ingredient
                 else:
                     #Get info from scd rx cui
-                    scd_ingredients = get_multiple_ingredients(scd_cui_data)
-                    scd_dose_form = get_dose_forms(scd_cui_data)
-                    SCD_Strength_Details = get_multiple_strengths(scd_cui_data)
+                    scd_ingredients = scd_concept.ingredients
+                    scd_dose_form = scd_concept.dose_forms
+                    SCD_Strength_Details = scd_concept.strengths
                     rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
                     rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
                     rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
             #If the scd_cui is remapped, get that information
-            elif scd_cui_data['rxcuiStatusHistory']['status'] == "Remapped":
+            elif scd_concept.history_status == "Remapped":
                 rxnorm_info["C RxNorm RxCUI"] = scd_rxcui
                 #Get the new rxcui of the remapped scd rxcui
-                remapped_scd_cui = scd_cui_data['rxcuiStatusHistory']['derivedConcepts']['remappedConcept'][0]['remappedRxCui']
+                remapped_scd_cui = scd_concept.remapped_rxcui
                 details = get_ingredient_strength_doseform(remapped_scd_cui)
                 rxnorm_info['C RxNorm Name'] = details.get('Remapped RxNorm Name')
                 rxnorm_info['C RxNorm TTY'] = details.get('Remapped RxNorm TTY')
@@ -458,104 +329,84 @@ def sbd_info(rxcui_data):
                 rxnorm_info['C RxNorm Strength Details'] = details.get('Remapped RxNorm Strength Details')
                     #If the original rxcui remaps
         elif status == "Remapped":
-            remapped_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['remappedConcept'][0]['remappedRxCui']
-            remapped_url = f'https://rxnav.nlm.nih.gov/REST/rxcui/{remapped_rxcui}/historystatus.json'
-            response3 = requests.get(remapped_url, timeout=(connect_timeout, read_timeout))
-            remapped_rxcui_data = response3.json()
-            remapped_tty = remapped_rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+            remapped_rxcui = concept.remapped_rxcui
+            remapped_concept = get_concept(remapped_rxcui)
+            remapped_tty = remapped_concept.tty
             # print(remapped_tty)
             if remapped_tty == "SBD":
                 #if the remapped_tty is an SBD with 1 ingredient
-                if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                    ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                    dose_form = get_dose_forms(remapped_rxcui_data)
-                    strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                    strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                    strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                    strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                if remapped_concept.is_multiple_ingredient == "NO":
+                    ingredient = remapped_concept.ingredient
+                    dose_form = remapped_concept.dose_forms
                     rxnorm_info["RxNorm Ingredient"] = ingredient
                     rxnorm_info["RxNorm Dose Form"] = dose_form
-                    rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                    rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
                 #If the remappped_tty is an SBD has more than 1 ingredient
-                elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+                elif remapped_concept.is_multiple_ingredient == "YES":
                     #Get all the original rxcui info
-                    ingredients = get_multiple_ingredients(rxcui_data)
-                    dose_form = get_dose_forms(rxcui_data)
-                    Strength_Details = get_multiple_strengths(rxcui_data)
+                    ingredients = concept.ingredients
+                    dose_form = concept.dose_forms
+                    Strength_Details = concept.strengths
                     rxnorm_info["RxNorm Ingredient"] = ingredients
                     rxnorm_info["RxNorm Dose Form"] = dose_form
                     rxnorm_info["RxNorm Strength Details"] = Strength_Details
                     # get the SCD from the remapped SBD no matter the number of ingredients
-                    scd_cui =  remapped_rxcui_data['rxcuiStatusHistory']['derivedConcepts']['scdConcept']['scdConceptRxcui']
-                    scd_cui_url = f'https://rxnav.nlm.nih.gov/REST/rxcui/{scd_cui}/historystatus.json'
-                    response4 = requests.get(scd_cui_url, timeout=(connect_timeout, read_timeout))
-                    remapped_scd_cui_data = response4.json()
-                    verify_tty = remapped_scd_cui_data['rxcuiStatusHistory']['attributes']['tty']
-                    scd_status = remapped_scd_cui_data["rxcuiStatusHistory"]['metaData']['status']
+                    scd_cui =  remapped_concept.scd_rxcui
+                    remapped_scd_concept = get_concept(scd_cui)
+                    verify_tty = remapped_scd_concept.tty
+                    scd_status = remapped_scd_concept.status
                     rxnorm_info["C RxNorm RxCUI"] = scd_rxcui
                     # print(verify_tty)
                     #If the scd cui data has only 1 ingredient
-                    if remapped_scd_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                        scd_ingredient = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                        scd_dose_form = get_dose_forms(remapped_scd_cui_data)
-                        scd_source = remapped_scd_cui_data["rxcuiStatusHistory"]['metaData']['source']
-                        scd_strength_numerator = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                        scd_strength_numeratorUnit = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                        scd_strength_denominator = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                        scd_strength_denominatorUnit = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                    if remapped_scd_concept.is_multiple_ingredient == "NO":
+                        scd_ingredient = remapped_scd_concept.ingredient
+                        scd_dose_form = remapped_scd_concept.dose_forms
+                        scd_source = remapped_scd_concept.source
                         rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
                         rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-                        rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+                        rxnorm_info["C RxNorm Strength Details"] = remapped_scd_concept.strength
                     #If the scd cui has more than one ingredient
                     else:
                         #Get info from scd rx cui
-                        scd_ingredients = get_multiple_ingredients(remapped_scd_cui_data)
-                        scd_dose_form = get_dose_forms(remapped_scd_cui_data)
-                        SCD_Strength_Details = get_multiple_strengths(remapped_scd_cui_data)
+                        scd_ingredients = remapped_scd_concept.ingredients
+                        scd_dose_form = remapped_scd_concept.dose_forms
+                        SCD_Strength_Details = remapped_scd_concept.strengths
                         rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
                         rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
                         rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
             elif remapped_tty == "SCD":
-                scd_status = remapped_rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+                scd_status = remapped_concept.status
                 if scd_status != "Obsolete":
                     #If the remapped_tty is an SCD with 1 ingredient
-                    if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                        ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                        dose_form = get_dose_forms(remapped_rxcui_data)
-                        strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                        strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                        strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                        strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                    if remapped_concept.is_multiple_ingredient == "NO":
+                        ingredient = remapped_concept.ingredient
+                        dose_form = remapped_concept.dose_forms
                         rxnorm_info["RxNorm Ingredient"] = ingredient
                         rxnorm_info["RxNorm Dose Form"] = dose_form
-                        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                        rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
                     #If the remappped_tty is an SCD has more than 1 ingredient
-                    elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+                    elif remapped_concept.is_multiple_ingredient == "YES":
                         #Get all the original rxcui info
-                        ingredients = get_multiple_ingredients(rxcui_data)
-                        dose_form = get_dose_forms(rxcui_data)
-                        Strength_Details = get_multiple_strengths(rxcui_data)
+                        ingredients = concept.ingredients
+                        dose_form = concept.dose_forms
+                        Strength_Details = concept.strengths
                         rxnorm_info["RxNorm Ingredient"] = ingredients
                         rxnorm_info["RxNorm Dose Form"] = dose_form
                         rxnorm_info["RxNorm Strength Details"] = Strength_Details
                 elif scd_status == "Obsolete":
                     #If the remapped_tty is an SCD with 1 ingredient
-                    if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                        ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                        dose_form = get_dose_forms(remapped_rxcui_data)
-                        strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                        strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                        strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                        strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                    if remapped_concept.is_multiple_ingredient == "NO":
+                        ingredient = remapped_concept.ingredient
+                        dose_form = remapped_concept.dose_forms
                         rxnorm_info["RxNorm Ingredient"] = ingredient
                         rxnorm_info["RxNorm Dose Form"] = dose_form
-                        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                        rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
                     #If the remappped_tty is an SCD has more than 1 ingredient
-                    elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+                    elif remapped_concept.is_multiple_ingredient == "YES":
                         #Get all the original rxcui info
-                        ingredients = get_multiple_ingredients(remapped_rxcui_data)
-                        dose_form = get_dose_forms(remapped_rxcui_data)
-                        Strength_Details = get_multiple_strengths(remapped_rxcui_data)
+                        ingredients = remapped_concept.ingredients
+                        dose_form = remapped_concept.dose_forms
+                        Strength_Details = remapped_concept.strengths
                         rxnorm_info["RxNorm Ingredient"] = ingredients
                         rxnorm_info["RxNorm Dose Form"] = dose_form
                         rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -595,68 +446,59 @@ def gpck_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
     #If the TTY is GPCK and has 1 ingredient
-    if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-        ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-        dose_form = get_dose_forms(rxcui_data)
+    if concept.is_multiple_ingredient == "NO":
+        ingredient = concept.ingredient
+        dose_form = concept.dose_forms
         #print(f"Dose Form: {dose_form}")
         # status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
-        source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-        strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-        strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-        strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-        strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        source = concept.source
         rxnorm_info["RxNorm Ingredient"] = ingredient
         rxnorm_info["RxNorm Dose Form"] = dose_form
-        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+        rxnorm_info["RxNorm Strength Details"] = concept.strength
     else:
         #If the TTY is GPCK and has multiple ingredients
-        ingredients = get_multiple_ingredients(rxcui_data)
-        dose_form = get_dose_forms(rxcui_data)
-        Strength_Details = get_multiple_strengths(rxcui_data)
+        ingredients = concept.ingredients
+        dose_form = concept.dose_forms
+        Strength_Details = concept.strengths
         rxnorm_info["RxNorm Ingredient"] = ingredients
         rxnorm_info["RxNorm Dose Form"] = dose_form
         rxnorm_info["RxNorm Strength Details"] = Strength_Details
     #No matter the number of ingredients, get the pack_cui which is an SCD and get the scd info for this drug product
-    pack_cui = rxcui_data['rxcuiStatusHistory']['pack']['packConcept'][0]["packRxcui"]
+    pack_cui = concept.pack_rxcui
     #Now find the RXNorm info from the SCD RxCui
-    url_scd_cui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{pack_cui}/historystatus.json'
-    response2 = requests.get(url_scd_cui, timeout=(connect_timeout, read_timeout))
-    pack_cui_data = response2.json()
+    pack_concept = get_concept(pack_cui)
     #If the SCD CUI isn't remapped:
-    if pack_cui_data['rxcuiStatusHistory']['metaData']['status'] != "Remapped":
+    if pack_concept.status != "Remapped":
         #Get the tty of this data. We expect it to be an SCD
-        scd_tty = pack_cui_data["rxcuiStatusHistory"]["attributes"]["tty"]
+        scd_tty = pack_concept.tty
         #Get the name of the drug from this info
-        scd_name = pack_cui_data["rxcuiStatusHistory"]["attributes"]["name"]
+        scd_name = pack_concept.name
         #Get info from scd rx cui
         rxnorm_info["C RxNorm Name"] = scd_name
         rxnorm_info["C RxNorm TTY"] = scd_tty
         rxnorm_info["C RxNorm RxCUI"] = pack_cui
         #The scd cui only has one ingredient
-        if pack_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            scd_ingredient = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            scd_dose_form = get_dose_forms(pack_cui_data)
-            scd_status = pack_cui_data["rxcuiStatusHistory"]['metaData']['status']
-            scd_source = pack_cui_data["rxcuiStatusHistory"]['metaData']['source']
-            scd_strength_numerator = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            scd_strength_numeratorUnit = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            scd_strength_denominator = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            scd_strength_denominatorUnit = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        if pack_concept.is_multiple_ingredient == "NO":
+            scd_ingredient = pack_concept.ingredient
+            scd_dose_form = pack_concept.dose_forms
+            scd_status = pack_concept.status
+            scd_source = pack_concept.source
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-            rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+            rxnorm_info["C RxNorm Strength Details"] = pack_concept.strength
         #If the scd cui has more than one ingredient
         else:
             #Get info from scd rx cui
-            scd_ingredients = get_multiple_ingredients(pack_cui_data)
-            scd_dose_form = get_dose_forms(pack_cui_data)
-            SCD_Strength_Details = get_multiple_strengths(pack_cui_data)
+            scd_ingredients = pack_concept.ingredients
+            scd_dose_form = pack_concept.dose_forms
+            SCD_Strength_Details = pack_concept.strengths
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
             rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
@@ -671,68 +513,59 @@ def bpck_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
     #If the BPCK has 1 Ingredient find the info
-    if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-        ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-        dose_form = get_dose_forms(rxcui_data)
+    if concept.is_multiple_ingredient == "NO":
+        ingredient = concept.ingredient
+        dose_form = concept.dose_forms
         # print(f"Dose Form: {dose_form}")
         # status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
-        source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-        strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-        strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-        strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-        strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        source = concept.source
         rxnorm_info["RxNorm Ingredient"] = ingredient
         rxnorm_info["RxNorm Dose Form"] = dose_form
-        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+        rxnorm_info["RxNorm Strength Details"] = concept.strength
     #If the BPCK has more than one ingredient, find the info
     else:
-        ingredients = get_multiple_ingredients(rxcui_data)
-        dose_form = get_dose_forms(rxcui_data)
-        Strength_Details = get_multiple_strengths(rxcui_data)
+        ingredients = concept.ingredients
+        dose_form = concept.dose_forms
+        Strength_Details = concept.strengths
         rxnorm_info["RxNorm Ingredient"] = ingredients
         rxnorm_info["RxNorm Dose Form"] = dose_form
         rxnorm_info["RxNorm Strength Details"] = Strength_Details
     #Find the SCD Info for this medication
-    pack_cui = rxcui_data['rxcuiStatusHistory']['pack']['packConcept'][0]["packRxcui"]
+    pack_cui = concept.pack_rxcui
     #Now find the RXNorm info from the SCD RxCui
-    url_scd_cui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{pack_cui}/historystatus.json'
-    response2 = requests.get(url_scd_cui, timeout=(connect_timeout, read_timeout))
-    scd_cui_data = response2.json()
+    scd_concept = get_concept(pack_cui)
     #If the SCD CUI isn't remapped:
-    if scd_cui_data['rxcuiStatusHistory']['metaData']['status'] != "Remapped":
+    if scd_concept.status != "Remapped":
         #Get the tty of this data. We expect it to be an SCD
-        scd_tty = scd_cui_data["rxcuiStatusHistory"]["attributes"]["tty"]
+        scd_tty = scd_concept.tty
         #Get the name of the drug from this info
-        scd_name = scd_cui_data["rxcuiStatusHistory"]["attributes"]["name"]
+        scd_name = scd_concept.name
         #Get info from scd rx cui
         rxnorm_info["C RxNorm Name"] = scd_name
         rxnorm_info["C RxNorm TTY"] = scd_tty
         rxnorm_info["C RxNorm RxCUI"] = pack_cui
         #The scd cui only has one ingredient
-        if scd_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            scd_ingredient = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            scd_dose_form = get_dose_forms(scd_cui_data)
-            scd_status = scd_cui_data["rxcuiStatusHistory"]['metaData']['status']
-            scd_source = scd_cui_data["rxcuiStatusHistory"]['metaData']['source']
-            scd_strength_numerator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            scd_strength_numeratorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            scd_strength_denominator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            scd_strength_denominatorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        if scd_concept.is_multiple_ingredient == "NO":
+            scd_ingredient = scd_concept.ingredient
+            scd_dose_form = scd_concept.dose_forms
+            scd_status = scd_concept.status
+            scd_source = scd_concept.source
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-            rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+            rxnorm_info["C RxNorm Strength Details"] = scd_concept.strength
         #If the scd cui has more than one ingredient
         else:
             #Get info from scd rx cui
-            scd_ingredients = get_multiple_ingredients(scd_cui_data)
-            scd_dose_form = get_dose_forms(scd_cui_data)
-            SCD_Strength_Details = get_multiple_strengths(scd_cui_data)
+            scd_ingredients = scd_concept.ingredients
+            scd_dose_form = scd_concept.dose_forms
+            SCD_Strength_Details = scd_concept.strengths
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
             rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
@@ -747,12 +580,13 @@ def in_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredient = rxcui_data["rxcuiStatusHistory"]["attributes"]["name"]
+    ingredient = concept.name
     dose_form = " "
     strength = " "
     rxnorm_info["RxNorm Ingredient"] = ingredient
@@ -775,14 +609,15 @@ def min_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredients = get_multiple_ingredients(rxcui_data)
-    dose_form = get_dose_forms(rxcui_data)
-    Strength_Details = get_multiple_strengths(rxcui_data)
+    ingredients = concept.ingredients
+    dose_form = concept.dose_forms
+    Strength_Details = concept.strengths
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
     rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -803,14 +638,15 @@ def scdg_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredients = get_multiple_ingredients(rxcui_data)
-    dose_form = get_dose_forms(rxcui_data)
-    Strength_Details = get_multiple_strengths(rxcui_data)
+    ingredients = concept.ingredients
+    dose_form = concept.dose_forms
+    Strength_Details = concept.strengths
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
     rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -831,19 +667,16 @@ def scdc_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']["ingredientAndStrength"][0]["baseName"]
-    strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-    strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-    strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-    strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+    ingredient = concept.base_name
     rxnorm_info["RxNorm Ingredient"] = ingredient
     rxnorm_info["RxNorm Dose Form"] = ""
-    rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+    rxnorm_info["RxNorm Strength Details"] = concept.strength
     rxnorm_info['C RxNorm Name'] = ""
     rxnorm_info['C RxNorm TTY'] = ""
     rxnorm_info["C RxNorm RxCUI"] = ""
@@ -861,15 +694,16 @@ def sbdc_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']["ingredientAndStrength"][0]["baseName"]
-    ingredients = get_multiple_ingredients(rxcui_data)
-    dose_form = get_dose_forms(rxcui_data)
-    Strength_Details = get_multiple_strengths(rxcui_data)
+    ingredient = concept.base_name
+    ingredients = concept.ingredients
+    dose_form = concept.dose_forms
+    Strength_Details = concept.strengths
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
     rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -890,13 +724,14 @@ def scdf_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredients = rxcui_data["rxcuiStatusHistory"]['derivedConcepts']["ingredientConcept"][0]['ingredientName']
-    dose_form = get_dose_forms(rxcui_data)
+    ingredients = concept.ingredient_name
+    dose_form = concept.dose_forms
     Strength_Details = ""
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
@@ -918,64 +753,55 @@ def get_name_tty(rxcui):
     RxNorm Dose Form, Remapped RxNorm Strength Details. The values come from the RxCui given as the input.
     """
     rx_norm_info = {}
-    max_try = 5
-    try_number = 1
-    while try_number <= max_try:
-        url_rxcui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/historystatus.json'
-        response = requests.get(url_rxcui, timeout=(connect_timeout, read_timeout))
-        try:
-            if response.status_code == 200:
-                rxcui_data = response.json()
-                name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
-                rx_norm_info['RxNorm Name'] = name
-                tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
-                rx_norm_info['RxNorm TTY'] = tty
-                if tty == "SCD":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = scd_info(rxcui_data)
-                elif tty == "SBD":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = sbd_info(rxcui_data)
-                elif tty == "GPCK":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = gpck_info(rxcui_data)
-                elif tty == "BPCK":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = bpck_info(rxcui_data)
-                elif tty == "IN" or tty == "PIN":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = in_info(rxcui_data)
-                elif tty == "MIN":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = min_info(rxcui_data)
-                elif tty == "SCDG" or tty == "SBDG":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = scdg_info(rxcui_data)
-                elif tty == "SCDC":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = scdc_info(rxcui_data)
-                elif tty == "SBDC":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = sbdc_info(rxcui_data)
-                elif tty == "SCDF":
-                    rx_norm_info = scdf_info(rxcui_data)
-                elif tty ==  "OCD" or tty == '':
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info["RxNorm Ingredient"] = ""
-                    rx_norm_info["RxNorm Dose Form"] = ""
-                    rx_norm_info["RxNorm Strength Details"] = ""
-                    rx_norm_info['C RxNorm Name'] = ""
-                    rx_norm_info['C RxNorm TTY'] = ""
-                    rx_norm_info["C RxNorm RxCUI"] = ""
-                    rx_norm_info['C RxNorm Ingredient'] = ""
-                    rx_norm_info['C RxNorm Dose Form'] = ""
-                    rx_norm_info['C RxNorm Strength Details'] = ""
-        # print(rx_norm_info)
-            return rx_norm_info
-        except:
-            print(f'API failed on {url_rxcui}, Trying Again, attempt number {try_number} of 5')
-            sleep(4)
-            try_numner +=1
+    #get_concept retries RxNav with backoff, anything that still fails is raised to the caller
+    concept = get_concept(rxcui)
+    if concept is not None:
+        name = concept.name
+        rx_norm_info['RxNorm Name'] = name
+        tty = concept.tty
+        rx_norm_info['RxNorm TTY'] = tty
+        if tty == "SCD":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = scd_info(concept)
+        elif tty == "SBD":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = sbd_info(concept)
+        elif tty == "GPCK":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = gpck_info(concept)
+        elif tty == "BPCK":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = bpck_info(concept)
+        elif tty == "IN" or tty == "PIN":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = in_info(concept)
+        elif tty == "MIN":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = min_info(concept)
+        elif tty == "SCDG" or tty == "SBDG":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = scdg_info(concept)
+        elif tty == "SCDC":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = scdc_info(concept)
+        elif tty == "SBDC":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = sbdc_info(concept)
+        elif tty == "SCDF":
+            rx_norm_info = scdf_info(concept)
+        elif tty ==  "OCD" or tty == '':
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info["RxNorm Ingredient"] = ""
+            rx_norm_info["RxNorm Dose Form"] = ""
+            rx_norm_info["RxNorm Strength Details"] = ""
+            rx_norm_info['C RxNorm Name'] = ""
+            rx_norm_info['C RxNorm TTY'] = ""
+            rx_norm_info["C RxNorm RxCUI"] = ""
+            rx_norm_info['C RxNorm Ingredient'] = ""
+            rx_norm_info['C RxNorm Dose Form'] = ""
+            rx_norm_info['C RxNorm Strength Details'] = ""
+    # print(rx_norm_info)
+    return rx_norm_info
 
 def clean_string(input_string):
     try:
@@ -987,21 +813,57 @@ def clean_string(input_string):
             cleaned_string = lstring.replace("'", '')
             return cleaned_string
 
+def get_ndc_store():
+    """
+    Output: ndc_store, the NDCRxCUIStore shared by every pipeline (LocalRxStore.shared_ndc_store), opened the first time
+    an NDC is looked up. Set ndc_store before that to use a different store.
+    """
+    global ndc_store
+    if ndc_store is None:
+        ndc_store = shared_ndc_store()
+    return ndc_store
+
 def fetch_data_from_api(key, count):
     """
     Pass in the NDC as the key (and 11 digit integer) and the count of which row of data this came from
-    Spit back out the RxCUI, a multi digit integer
+    Spit back out the RxCUI, a multi digit integer (or no_rxcui_value if RxNav has no RxCUI for the NDC)
+    Callers asking for the same NDC at the same time share one lookup_ndc_rxcui call.
+    """
+    #Every NDC is cached under its canonical 11 digit form, so the same product is only looked up once however it was written
+    key = canonical_ndc(key)
+    if key == '':
+        return no_rxcui_value
+    return ndc_flight.do(key, lambda: lookup_ndc_rxcui(key, count))
+
+def lookup_ndc_rxcui(key, count):
+    """
+    Looks the NDC up in ndc_cache, then ndc_store, then RxNav, for fetch_data_from_api
     """
     # Check if the data is in the cache
-    cached_data = lfu_cache.get(key)
+    cached_data = ndc_cache.get(key)
+    if cached_data is NO_RXCUI:
+        return no_rxcui_value
     if cached_data is not None:
         return cached_data
 
+    # Then check the NDCs saved by earlier runs that have not expired yet
+    saved_rxcui = get_ndc_store().get(key)
+    if saved_rxcui is NO_RXCUI:
+        ndc_cache.put(key, NO_RXCUI)
+        return no_rxcui_value
+    if saved_rxcui is not None:
+        ndc_cache.put(key, saved_rxcui)
+        return saved_rxcui
+
     # If not in the cache, make the API request
     api_data = get_rxnorm_rxcui(key, count)
 
-    # Store the API response in the cache
-    lfu_cache.put(key, api_data)
+    # Store the API response in the cache, and save it for later runs
+    ndc_cache.put(key, api_data)
+    if api_data is not None:
+        get_ndc_store().put(key, api_data)
+    if api_data is NO_RXCUI:
+        return no_rxcui_value
 
     return api_data
 
@@ -1010,9 +872,16 @@ def fetch_rxnorm_data_from_api(key):
     Input: Pass in the RxCUI (an integer) as the key,
     Output: Dictionary with the keys Remapped RxNorm Name, Remapped RxNorm TTY, Remapped RxNorm Ingredient, Remapped
     RxNorm Dose Form, Remapped RxNorm Strength Details. The values come from the RxCui given as the input.
+    Callers asking for the same RxCUI at the same time share one lookup_rxnorm_details call.
+    """
+    return rxnorm_flight.do(key, lambda: lookup_rxnorm_details(key))
+
+def lookup_rxnorm_details(key):
+    """
+    Looks the RxCUI up in rxnorm_cache, then RxNav, for fetch_rxnorm_data_from_api
     """
     # Check if the data is in the cache
-    rx_cached_data = lfu_cache.get(key)
+    rx_cached_data = rxnorm_cache.get(key)
     if rx_cached_data is not None:
         return rx_cached_data
 
@@ -1020,26 +889,157 @@ def fetch_rxnorm_data_from_api(key):
     api_rx_data = get_name_tty(key)
 
     # Store the API response in the cache
-    lfu_cache.put(key, api_rx_data)
+    rxnorm_cache.put(key, api_rx_data)
 
     return api_rx_data
 
-# Function to check if entries exist in the truth table
+def distinct_keys(values):
+    """
+    Takes a list of NDCs or RxCUIs and returns each distinct one once, in the order they were first seen.
+    Blank values ('' or None) are left out since they never need a lookup.
+
+    Input: List of keys
+    Output: List of distinct keys
+    """
+    return list(dict.fromkeys(value for value in values if value != '' and value is not None))
+
+def resolve_distinct_keys(keys, resolver, max_workers=None):
+    """
+    Calls resolver once for every distinct key using a pool of worker threads, so the number of lookups
+    scales with the number of distinct keys and not with the number of rows. If the lookup for a key
+    raised an error, the exception is stored in place of the result so the caller can report it for
+    every row that uses that key.
+
+    Input: List of distinct keys, Function (takes one key), Integer (number of worker threads, defaults to ndc_workers)
+    Output: Dictionary {key: result or Exception}
+    """
+    if max_workers is None:
+        max_workers = ndc_workers
+    results = {}
+    if max_workers <= 1 or len(keys) <= 1:
+        for key in keys:
+            try:
+                results[key] = resolver(key)
+            except Exception as e:
+                results[key] = e
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: executor.submit(resolver, key) for key in keys}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+    return results
+
+def linked_rxcuis(rxcui_data):
+    """
+    Finds the RxCUIs a historystatus document points to, which the TTY handlers look up next: the SCD of an SBD
+    (scdConceptRxcui), the packs of a GPCK/BPCK (packRxcui) and the concepts a retired RxCUI was remapped to (remappedRxCui).
+
+    Input: Dictionary (parsed historystatus json) or the RxConcept made from it
+    Output: List of RxCUIs (strings)
+    """
+    return as_concept(rxcui_data).links
+
+def resolve_linked_concepts(rxcuis, fetch_concept=None, max_workers=None):
+    """
+    Downloads the historystatus documents of the RxCUIs and of every concept they link to, breadth first.
+    Each wave fetches all the outstanding RxCUIs at once on the worker pool, then the links found in those
+    documents become the next wave, until there is nothing new. The concepts end up in historystatus_cache,
+    so the TTY handlers that run afterwards find every linked concept already there and the time taken
+    follows the depth of the link chains instead of the total number of calls.
+
+    Input: List of RxCUIs, Function (fetches one historystatus document or its RxConcept, defaults to get_concept),
+    Integer (number of worker threads, defaults to ndc_workers)
+    Output: Dictionary {RxCUI: RxConcept (or document) or Exception} for every concept that was fetched
+    """
+    if fetch_concept is None:
+        fetch_concept = get_concept
+    documents = {}
+    wave = distinct_keys(str(rxcui) for rxcui in rxcuis)
+    while wave:
+        fetched = resolve_distinct_keys(wave, fetch_concept, max_workers)
+        documents.update(fetched)
+        next_wave = []
+        for rxcui_data in fetched.values():
+            if isinstance(rxcui_data, Exception):
+                continue
+            next_wave.extend(link for link in linked_rxcuis(rxcui_data) if link not in documents)
+        wave = distinct_keys(next_wave)
+    return documents
+
+def concept_failures(rxcuis, concepts):
+    """
+    Finds the RxCUIs whose concept, or a concept it links to, could not be fetched by resolve_linked_concepts.
+    rxnav_client already retried those calls, so the RxNorm details of these RxCUIs are not looked up again
+    (the TTY handlers would fetch the same concepts and go through all the retries a second time).
+
+    Input: List of RxCUIs, Dictionary (returned by resolve_linked_concepts)
+    Output: Dictionary {RxCUI (string): Exception} with the first failed concept found for each RxCUI
+    """
+    failures = {}
+    for rxcui in distinct_keys(str(rxcui) for rxcui in rxcuis):
+        seen = set()
+        outstanding = [rxcui]
+        while outstanding:
+            key = outstanding.pop()
+            if key in seen:
+                continue
+            seen.add(key)
+            concept = concepts.get(key)
+            if isinstance(concept, Exception):
+                failures[rxcui] = concept
+                break
+            if concept is not None:
+                outstanding.extend(linked_rxcuis(concept))
+    return failures
+
+def prefetch_ndcs(ndcs, rxcui_index=None, max_workers=None):
+    """
+    Warms the lookup caches for NDCs that are about to be processed, so the main_process calls that follow are
+    (almost) all cache hits. Each distinct NDC is resolved to its RxCUI once on the worker pool, then every RxCUI that is
+    not in rxcui_index has its concept, the concepts it links to and its RxNorm details fetched. Errors are only counted
+    here, main_process looks the failed NDCs up again and reports them for the rows that use them. RxCUIs whose concepts
+    could not be fetched are counted once and their details are not asked for.
+
+    Input: List of NDCs (any form, blanks are skipped), Dictionary (the saved RxCUI details, like main_process's
+    rxcui_index), Integer (number of worker threads, defaults to ndc_workers)
+    Output: Dictionary with the number of distinct NDCs, NDCs resolved and NDCs whose lookup failed, distinct RxCUIs found,
+    new RxCUIs whose details were fetched and new RxCUIs whose lookup failed, and all the errors
+    """
+    keys = distinct_keys(canonical_ndc(ndc) for ndc in ndcs)
+    ndc_rxcuis = resolve_distinct_keys(keys, lambda ndc: fetch_data_from_api(ndc, 'prefetch'), max_workers)
+    rxcuis = distinct_keys(rxcui for rxcui in ndc_rxcuis.values() if not isinstance(rxcui, Exception))
+    if rxcui_index is None:
+        rxcui_index = {}
+    missing_rxcuis = [rxcui for rxcui in rxcuis if rxcui_index.get(str(rxcui)) is None]
+    failed_rxcuis = concept_failures(missing_rxcuis, resolve_linked_concepts(missing_rxcuis, max_workers=max_workers))
+    fetched_details = resolve_distinct_keys([rxcui for rxcui in missing_rxcuis if str(rxcui) not in failed_rxcuis], fetch_rxnorm_data_from_api, max_workers)
+    #Lookups that raised (including the ones the circuit breaker failed straight away) left nothing in the caches
+    ndc_errors = sum(isinstance(rxcui, Exception) for rxcui in ndc_rxcuis.values())
+    rxcui_errors = sum(isinstance(details, Exception) for details in fetched_details.values()) + len(failed_rxcuis)
+    return {'ndcs': len(keys), 'resolved': len(keys) - ndc_errors, 'ndc_errors': ndc_errors, 'rxcuis': len(rxcuis),
+            'fetched': len(missing_rxcuis) - rxcui_errors, 'rxcui_errors': rxcui_errors, 'errors': ndc_errors + rxcui_errors}
+
+def rxnorm_detail_row(rxcui, rx_info):
+    """
+    Builds the row that is saved to SaveRxCUIDetails.csv from the RxNorm info found for an RxCUI.
+
+    Input: RxCUI, Dictionary (returned by fetch_rxnorm_data_from_api)
+    Output: Dictionary with the RxCUI and the 11 RxNorm detail keys
+    """
+    return RxNormDetails.from_row(rx_info, rxcui).to_row()
+
+# Function to check if entries exist in the truth table (an EquivalenceClasses, so this is a dictionary lookup)
 def entries_are_true(entry1, entry2, truth_table):
-    for row in truth_table:
-        for key, value in row.items():
-            if (entry1 == key and entry2 == value) or (entry1 == value and entry2 == key):
-                return True
-    return False
+    return truth_table.equivalent(entry1, entry2)
 
 def check_entries_in_special_case_truth_table(entry1, entry2, special_case_truth_table):
-    for row in special_case_truth_table:
-        for key, value in row.items():
-            if entry1 == key and entry2 == value:
-                return True
-    return False
+    return special_case_truth_table.contains(entry1, entry2)
 
-def main_process(file, redcap_process, name, rxcui_data):
+def main_process(file, redcap_process, name, rxcui_data, max_workers=None, rxcui_index=None):
 # ############################################################################################################################################################################################################
     ###This section of code gets the RxCuis' from the e and dscript NDCs###
     brenmo_data = file
@@ -1050,11 +1050,23 @@ def main_process(file, redcap_process, name, rxcui_data):
     new_rxcui_data = [] #This is where new RxCUI Api call info will be kept to send back and append the SavedRxCUIDetails.csv
     #Record the Start Time for this process
     start_time1 = time.time()
+    #Plan the NDC lookups: every distinct Escript/Dispensed NDC is resolved once on the worker pool
+    #The NDCs are keyed on their canonical 11 digit form, so one NDC written two ways is still one lookup.
+    #Values like 'nan' have no canonical form and get no_rxcui_value, the same as fetch_data_from_api gives for them
+    first_rows = {}
+    for row_number, entry in enumerate(brenmo_data):
+        first_rows.setdefault(canonical_ndc(entry.get('Escript NDC')), row_number)
+        first_rows.setdefault(canonical_ndc(entry.get('Dispensed NDC')), row_number)
+    ndc_rxcuis = resolve_distinct_keys(distinct_keys(first_rows), lambda ndc: fetch_data_from_api(ndc, first_rows[ndc]), max_workers)
+    #Join the RxCUIs back onto the rows in row order
     for entry in brenmo_data:
-        print(entry)
+        if print_rows:
+            print(entry)
         try:
             if entry.get('Escript NDC') != '':
-                e_rxcui = fetch_data_from_api(entry.get('Escript NDC'), count)
+                e_rxcui = ndc_rxcuis.get(canonical_ndc(entry.get('Escript NDC')), no_rxcui_value)
+                if isinstance(e_rxcui, Exception):
+                    raise e_rxcui
             else:
                 e_rxcui = ""
             # if entry.get('Prescribed NDC') != '':
@@ -1062,7 +1074,9 @@ def main_process(file, redcap_process, name, rxcui_data):
             # else:
             #     p_rxcui = ""
             if entry.get('Dispensed NDC') != '':
-                d_rxcui = fetch_data_from_api(entry.get('Dispensed NDC'),count)
+                d_rxcui = ndc_rxcuis.get(canonical_ndc(entry.get('Dispensed NDC')), no_rxcui_value)
+                if isinstance(d_rxcui, Exception):
+                    raise d_rxcui
             else:
                 d_rxcui = ""
             entry['e_rxcui'] = e_rxcui
@@ -1090,7 +1104,8 @@ def main_process(file, redcap_process, name, rxcui_data):
         }
         addition.append(new_dict)
         count += 1
-        print(f"Found RxCUI for entry number {count}")
+        if print_rows:
+            print(f"Found RxCUI for entry number {count}")
         # print(new_dict)
     #Record the stop time for this process
     stop_time1 = time.time()
@@ -1117,175 +1132,90 @@ def main_process(file, redcap_process, name, rxcui_data):
     start_time2 = time.time()
     e_matching_info = []
     d_matching_info = []
+    #Plan the RxNorm lookups: every distinct RxCUI is looked up once, first in the saved rxcui_data and
+    #then from the API for the ones we have not seen before. Each one becomes a single RxNormDetails that every row using it shares
+    if rxcui_index is None:
+        rxcui_index = build_rxcui_index(rxcui_data)
+    rxnorm_details = {}
+    missing_rxcuis = []
+    for rxcui in distinct_keys(rxcui for item in addition for rxcui in (item.get('E_rxcui'), item.get('D_rxcui'))):
+        # Check if the RxCUI is in 'RxCUI' values in rxcui_data
+        matching_item = rxcui_index.get(str(rxcui))
+        if matching_item is not None:
+            rxnorm_details[rxcui] = RxNormDetails.from_row(matching_item)
+        else:
+            missing_rxcuis.append(rxcui)
+    #Download the concepts and everything they link to in waves first, so the lookups below only read from historystatus_cache
+    concepts = resolve_linked_concepts(missing_rxcuis, max_workers=max_workers)
+    #RxCUIs whose concepts could not be downloaded keep that error, their rows are reported without asking RxNav again
+    failed_rxcuis = concept_failures(missing_rxcuis, concepts)
+    # If information is not found, call the fetch_rxnorm_data_from_api function once per RxCUI
+    fetched_details = resolve_distinct_keys([rxcui for rxcui in missing_rxcuis if str(rxcui) not in failed_rxcuis], fetch_rxnorm_data_from_api, max_workers)
+    fetched_details.update({rxcui: failed_rxcuis[str(rxcui)] for rxcui in missing_rxcuis if str(rxcui) in failed_rxcuis})
+    for rxcui in missing_rxcuis:
+        rx_info = fetched_details[rxcui]
+        if not isinstance(rx_info, Exception):
+            try:
+                #Append the New info to new_rxcui_data for updating the CSV file, and to the index for the next file
+                rx_info = RxNormDetails.from_row(rx_info, rxcui)
+                new_row = rx_info.to_row()
+                new_rxcui_data.append(new_row)
+                rxcui_index[str(rxcui)] = new_row
+            except Exception as e:
+                rx_info = e
+        rxnorm_details[rxcui] = rx_info
+    #Rows with no Escript or Dispensed RxCUI share one blank set of details
+    blank_details = RxNormDetails()
+    #Join the RxNorm info back onto the rows
     for item in addition:
         if item.get('E_rxcui') != '' and item.get('E_rxcui') != None:
             #get the rxcui from the eprescription and use that to get drug info from rxnorm
             eRxCUI = item.get('E_rxcui')
-            try:
-                # Check if eRxCUI is in 'RxCUI' values in rxcui_data
-                matching_items = [data for data in rxcui_data if data.get('RxCUI') == eRxCUI]
-                # If there are matching items, add them to the result
-                if matching_items:
-                    #print(matching_items)
-                    e_info = matching_items[0]
-                    print(e_info)
-                    # e_info.append(matching_items)
-                    # e_matching_info.extend(matching_items)
-                    # print(e_matching_info)
-                else:
-                    # If information is not found, call the fetch_rxnorm_data_from_api function
-                    e_info = fetch_rxnorm_data_from_api(eRxCUI)
-                    print(e_info)
-                    #Append the New info to new_rxcui_data for updating the CSV file.
-                    new_rxcui_data.append({
-                        'RxCUI': eRxCUI,
-                        'RxNorm Name': e_info["RxNorm Name"],
-                        'RxNorm TTY': e_info["RxNorm TTY"],
-                        'RxNorm Ingredient': e_info["RxNorm Ingredient"],
-                        'RxNorm Dose Form': e_info["RxNorm Dose Form"],
-                        'RxNorm Strength Details': e_info["RxNorm Strength Details"],
-                        'C RxNorm Name': e_info['C RxNorm Name'],
-                        'C RxNorm TTY': e_info['C RxNorm TTY'],
-                        'C RxNorm RxCUI': e_info['C RxNorm RxCUI'],
-                        'C RxNorm Ingredient': e_info['C RxNorm Ingredient'],
-                        'C RxNorm Dose Form': e_info['C RxNorm Dose Form'],
-                        'C RxNorm Strength Details': e_info['C RxNorm Strength Details']
-                    })
-
-                # #get the prescribed drug name and tty and RxNorm Drug Information
-                # e_info = fetch_rxnorm_data_from_api(eRxCUI) #This is a dictionary with name and tty
-                # #note the url in case I have any questions about why something didn't work
-                # url_rxcui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{eRxCUI}/historystatus.json'
-                # # print(f"eRxCUI is {url_rxcui}")
-                # # pp.pprint(f"eRxCui_info: {count} is {e_info}")
-            except:
+            e_info = rxnorm_details[eRxCUI]
+            if isinstance(e_info, Exception):
                 second_error_message = f"An error occured for RxCUI {item['E_rxcui']} at {item['rowID']}"
                 print(second_error_message)
                 second_set_error_messages.append(second_error_message)
                 continue
+            if print_rows:
+                print(e_info)
 
         else:
-            e_info = {}
+            e_info = blank_details
             eRxCUI = "NA"
-            e_info["RxNorm Name"] = ""
-            e_info["RxNorm TTY"] = ""
-            e_info["RxNorm Ingredient"] = ""
-            e_info["RxNorm Dose Form"] = ""
-            e_info["RxNorm Strength Details"] = ""
-            e_info['C RxNorm Name'] = ""
-            e_info['C RxNorm TTY'] = ""
-            e_info['C RxNorm RxCUI'] = ""
-            e_info['C RxNorm Ingredient'] = ""
-            e_info['C RxNorm Dose Form'] = ""
-            e_info['C RxNorm Strength Details'] = ""
 
         if item.get('D_rxcui') != ''and item.get('D_rxcui') != None:
-            #get the rxcui from the eprescription and use that to get drug info from rxnorm
+            #get the rxcui from the dispensed medication and use that to get drug info from rxnorm
             dRxCUI = item.get('D_rxcui')
-            try:
-                # Check if dRxCUI is in 'RxCUI' values in rxcui_data
-                matching_items = [data for data in rxcui_data if data.get('RxCUI') == dRxCUI]
-                # If there are matching items, add them to the result
-                if matching_items:
-                    #print(matching_items)
-                    d_info = matching_items[0]
-                    print(d_info)
-                elif not matching_items:
-                    matching_items_new_rxcui_data = [data for data in new_rxcui_data if data.get('RxCUI') == dRxCUI]
-                    if matching_items_new_rxcui_data:
-                        d_info = matching_items_new_rxcui_data[0]
-                    else:
-                        # If information is not found, call the fetch_rxnorm_data_from_api function
-                        d_info = fetch_rxnorm_data_from_api(dRxCUI)
-                        #Append the New info to new_rxcui_data for updating the CSV file. if it wasn't just added with e_info above...
-                        # if d_info.get('RxCUI') not in [data.get('RxCUI') for data in new_rxcui_data]:
-                        new_rxcui_data.append({
-                            'RxCUI': dRxCUI,
-                            'RxNorm Name': d_info["RxNorm Name"],
-                            'RxNorm TTY': d_info["RxNorm TTY"],
-                            'RxNorm Ingredient': d_info["RxNorm Ingredient"],
-                            'RxNorm Dose Form': d_info["RxNorm Dose Form"],
-                            'RxNorm Strength Details': d_info["RxNorm Strength Details"],
-                            'C RxNorm Name': d_info['C RxNorm Name'],
-                            'C RxNorm TTY': d_info['C RxNorm TTY'],
-                            'C RxNorm RxCUI': d_info['C RxNorm RxCUI'],
-                            'C RxNorm Ingredient': d_info['C RxNorm Ingredient'],
-                            'C RxNorm Dose Form': d_info['C RxNorm Dose Form'],
-                            'C RxNorm Strength Details': d_info['C RxNorm Strength Details']
-                        })
-
-            except:
+            d_info = rxnorm_details[dRxCUI]
+            if isinstance(d_info, Exception):
                 second_error_message = f"An error occured for RxCUI {item['E_rxcui']} at {item['rowID']}"
                 print(second_error_message)
                 second_set_error_messages.append(second_error_message)
                 continue
+            if print_rows:
+                print(d_info)
 
-            # #get the rxcui from the dispensed medication and use tht to get the drug info from rxnorm
-            # dRxCUI = item.get('D_rxcui')
-            # #get the dispensed drug name and tty
-            # d_info = fetch_rxnorm_data_from_api(dRxCUI) #This is a dictionary with name and tty
-            # #note the url in case I have any questions about why something didn't work
-            # url_rxcui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{dRxCUI}/historystatus.json'
-            # # print(f"dRxCUI is {url_rxcui}")
-            # # pp.pprint(f"dRxCui_info: {count} is {d_info}")
         else:
-            d_info = {}
+            d_info = blank_details
             dRxCUI = "NA"
-            d_info["RxNorm Name"] = ""
-            d_info["RxNorm TTY"] = ""
-            d_info["RxNorm Ingredient"] = ""
-            d_info["RxNorm Dose Form"] = ""
-            d_info["RxNorm Strength Details"] = ""
-            d_info['C RxNorm Name'] = ""
-            d_info['C RxNorm TTY'] = ""
-            d_info['C RxNorm RxCUI'] = ""
-            d_info['C RxNorm Ingredient'] = ""
-            d_info['C RxNorm Dose Form'] = ""
-            d_info['C RxNorm Strength Details'] = ""
         count += 1
-        print(count)
-        print(e_info["C RxNorm RxCUI"])
-        added_rxnorm.append({
-            "uniqueID": item.get('uniqueID'),
-            "rowID": item.get('rowID'),
-            "reportID": item.get('reportID'),
-            "eNDC": item.get('Escript NDC'),
-            "eRxCUI": item.get('E_rxcui'),
-            "original_erx_med_name": item.get('Escript prescribed item'),
-            "dNDC": item.get("Dispensed NDC"),
-            "dRxCUI": item.get('D_rxcui'),
-            "pharm_Dispensed_med": item.get('Dispensed Item'),
-            "GCN": item.get('GCN'),
-            "eRxNorm Name": e_info["RxNorm Name"],
-            "eRxNorm TTY": e_info["RxNorm TTY"],
-            "eRxNorm Ingredient": e_info["RxNorm Ingredient"],
-            "eRxNorm Dose Form": e_info["RxNorm Dose Form"],
-            "eRxNorm Strength Details": e_info["RxNorm Strength Details"],
-            "eSCD RxNorm Name": e_info["C RxNorm Name"],
-            "eSCD RxNorm TTY": e_info["C RxNorm TTY"],
-            "eSCD RxCUI": e_info["C RxNorm RxCUI"],
-            "eSCD RxNorm Ingredient": e_info["C RxNorm Ingredient"],
-            "eSCD RxNorm Dose Form": e_info["C RxNorm Dose Form"],
-            "eSCD RxNorm Strength Details": e_info["C RxNorm Strength Details"],
-            "dRxNorm Name": d_info["RxNorm Name"],
-            "dRxNorm TTY": d_info["RxNorm TTY"],
-            "dRxNorm Ingredient": d_info["RxNorm Ingredient"],
-            "dRxNorm Dose Form": d_info["RxNorm Dose Form"],
-            "dRxNorm Strength Details": d_info["RxNorm Strength Details"],
-            "dSCD RxNorm Name": d_info["C RxNorm Name"],
-            "dSCD RxNorm TTY": d_info["C RxNorm TTY"],
-            "dSCD RXCUI": d_info["C RxNorm RxCUI"],
-            "dSCD RxNorm Ingredient": d_info["C RxNorm Ingredient"],
-            "dSCD RxNorm Dose Form": d_info["C RxNorm Dose Form"],
-            "dSCD RxNorm Strength Details": d_info["C RxNorm Strength Details"]
-        }) #32 keys
+        if print_rows:
+            print(count)
+            print(e_info.c_rxcui)
+        added_rxnorm.append(RxNormRow(item.get('uniqueID'), item.get('rowID'), item.get('reportID'), item.get('Escript NDC'), item.get('E_rxcui'),
+                                      item.get('Escript prescribed item'), item.get("Dispensed NDC"), item.get('D_rxcui'), item.get('Dispensed Item'),
+                                      item.get('GCN'), e_info, d_info))
 
     #Record the stop time for this process
     stop_time2 = time.time()
-    pp.pprint(added_rxnorm)
+    if print_rows:
+        pp.pprint([row.to_dict() for row in added_rxnorm])
     print("Finished Getting RxCUIs")
     elapsed_time2 = stop_time2 - start_time2
     print(f"The Time it took to get {len(addition)} rxnorm info is {elapsed_time2}")
+    for stats in cache_stats():
+        print(f"Cache {stats['name']}: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, {stats['size']} of {stats['capacity']} entries")
     # pp.pprint(added_rxnorm)
 
     # myFile = open(f'{name}RxNorm_data.csv', 'w')
@@ -1306,19 +1236,19 @@ def main_process(file, redcap_process, name, rxcui_data):
 
     # bremo =read_csv_to_dicts(f'{directory}compiled_data_withRxCUI_RxNormCUIS.csv')
 
+    #The details are shared between rows, so each set is cleaned once however many rows use it
+    cleaned_details = set()
     for item in added_rxnorm:
-        item['eRxNorm Ingredient'] = clean_string(item.get('eRxNorm Ingredient'))
-        item['eRxNorm Dose Form'] = clean_string(item.get('eRxNorm Dose Form'))
-        item['eRxNorm Strength Details'] = clean_string(item.get('eRxNorm Strength Details'))
-        item['eSCD RxNorm Ingredient'] = clean_string(item.get('eSCD RxNorm Ingredient'))
-        item['eSCD RxNorm Dose Form'] = clean_string(item.get('eSCD RxNorm Dose Form'))
-        item['eSC DRxNorm Strength Detail'] = clean_string(item.get('eSCD RxNorm Strength Detail'))
-        item['dRxNorm Ingredient'] = clean_string(item.get('dRxNorm Ingredient'))
-        item['dRxNorm Dose Form'] = clean_string(item.get('dRxNorm Dose Form'))
-        item['dRxNorm Strength Details'] = clean_string(item.get('dRxNorm Strength Details'))
-        item['dSCD RxNorm Ingredient'] = clean_string(item.get('dSCD RxNorm Ingredient'))
-        item['dSCD RxNorm Dose Form'] = clean_string(item.get('dSCD RxNorm Dose Form'))
-        item['dSCD RxNorm Strength Details'] = clean_string(item.get('dSCD RxNorm Strength Details'))
+        for details in (item.e, item.d):
+            if id(details) in cleaned_details:
+                continue
+            cleaned_details.add(id(details))
+            details.ingredient = clean_string(details.ingredient)
+            details.dose_form = clean_string(details.dose_form)
+            details.strength = clean_string(details.strength)
+            details.c_ingredient = clean_string(details.c_ingredient)
+            details.c_dose_form = clean_string(details.c_dose_form)
+            details.c_strength = clean_string(details.c_strength)
         # pp.pprint(item)
 
     #myFile = open('/Users/meganwhitaker/Documents/Megan/umich/SaveRx/TestingFolder/Fitchburg_completed_data.csv', 'w', encoding='utf-8')
@@ -1359,13 +1289,13 @@ def main_process(file, redcap_process, name, rxcui_data):
     non_compounds = [item for item in has_eNDCtoo if item not in compounds]
 
     ### Step 2.5 Add truth table of values for equivalent dose forms, and salt forms
-    ing_truth_table = [
+    ing_truth_table = EquivalenceClasses([
         {"hydroxyzine pamoate": "hydroxyzine hydrochloride"},
         {"doxycycline hyclate": "doxycycline monohydrate"},
         {"desvenlafaxine": "devenlafaxine succinate"}
-    ]
+    ])
 
-    df_truth_table = [
+    df_truth_table = EquivalenceClasses([
         {"Auto-Injector, Injectable Product": "Cartridge, Injectable Product"},
         {"Delayed Release Oral Tablet, Oral Product, Pill": "Delayed Release Oral Capsule, Oral Product, Pill"},
         {"Extended Release Oral Tablet, Oral Product, Pill": "Extended Release Oral Capsule, Oral Product, Pill"},
@@ -1392,16 +1322,20 @@ def main_process(file, redcap_process, name, rxcui_data):
         {"Topical Foam, Topical Product": "Topical Gel, Topical Product"},
         {"Topical Lotion, Topical Product": "Topical Cream, Topical Product"},
         {"Topical Solution, Topical Product": "Topical Cream, Topical Product"}
-                      ]
+                      ])
 
-    special_case_truth_table = [
+    special_case_truth_table = DirectedPairs([
         {"Otic Solution, Otic Product": "Ophthalmic Solution, Ophthalmic Product"},
         {"Otic Solution, Otic Product": "Ophthalmic Suspension, Ophthalmic Product"},
         {"Otic Suspension, Otic Product": "Ophthalmic Solution, Ophthalmic Product"},
         {"Otic Suspension, Otic Product": "Ophthalmic Suspension, Ophthalmic Product"}
-    ]
+    ])
 
 #Step 3 Get keys that we will to make matches with
+    #Rows that repeat an (eRxCUI, dRxCUI) pair reuse the outcome worked out for the first one
+    match_memo.use_rules(rules_fingerprint(ing_truth_table, df_truth_table, special_case_truth_table, caching_match_rules))
+    if batch_match_rows:
+        match_memo.update(match_outcomes(non_compounds, ing_truth_table, df_truth_table, special_case_truth_table, caching_match_rules))
     filtered_for_redcap_withSCDS = []
     for item in non_compounds:
         a = item.get('eNDC')
@@ -1430,7 +1364,14 @@ def main_process(file, redcap_process, name, rxcui_data):
         incorrect_action2 = ''
         incorrect_action3 = ''
         incorrect_action4 = ''
-        if a == k: #If NDC's match, rxcuis match
+        match_key = (b, l, a == k)
+        found, outcome = match_memo.lookup(match_key)
+        if found:
+            if outcome is None:
+                non_compounds.remove(item)
+                continue
+            match_details, incorrect_action1, incorrect_action2, incorrect_action3, incorrect_action4 = outcome
+        elif a == k: #If NDC's match, rxcuis match
             incorrect_action1 = 0
             incorrect_action2 = 0
             incorrect_action3 = 0
@@ -1465,13 +1406,18 @@ def main_process(file, redcap_process, name, rxcui_data):
             else:
                 match_details = "1" #If none of the above matches, compare e to d Rx Ing, DF and Strength
                 if d == '' or e == '' or f == '' or n == '' or o == '' or p == '':
+                    match_memo.put(match_key, None)
                     non_compounds.remove(item)
                     continue
                 else:
+                    #The (prescribed, dispensed) pairs compared with the shared MatchRules
+                    ingredient_pairs = [(d, n), (d, r), (h, n), (h, r)]
                     if  (d.lower() == n.lower()) or (r != "" and d.lower() == r.lower()) or (r != "" and h.lower() == r.lower()) or (h != "" and h.lower() == n.lower()): #Compare erxNorm Ing to dRxNorm Ing, if not equal, then show 1 (wrong drug)
                         incorrect_action1 = 0 #if the ingredients match in any of the e/d esc/d, e/dscd, escd/dscd ways
                     elif entries_are_true(d, n, ing_truth_table) or entries_are_true(d, r, ing_truth_table) or entries_are_true(h, r, ing_truth_table) or entries_are_true(h, n, ing_truth_table):
                         incorrect_action1 = 0
+                    elif caching_match_rules.share_prefix(ingredient_pairs):
+                        incorrect_action1 = 0
                     else:
                         incorrect_action1 = 1 #if there is no ingredient match
 
@@ -1486,6 +1432,8 @@ def main_process(file, redcap_process, name, rxcui_data):
 
                     if f.lower() == p.lower() or (t != "" and t is not None and f == t) or (t != "" and t is not None and j == t) or (j != "" and j == p): #If the erxnorm strength doesn't equal the drxnorm strength, then show 2 (wrong strength)
                         incorrect_action2 = 0 #if the strengths match in any of the e/d esc/d, e/dscd, escd/dscd ways
+                    elif caching_match_rules.strength_exempt(ingredient_pairs):
+                        incorrect_action2 = 0
                     else:
                         incorrect_action2 = 1 #if there is no strength match
 
@@ -1496,13 +1444,18 @@ def main_process(file, redcap_process, name, rxcui_data):
         elif "b" not in c.lower(): #IF the TTY is not branded
             match_details = "1" #If neither eNDC = dNDC or eRxCUI = dRxCUI and its not branded, compare e to d Rx Ing, DF and Strength
             if d == '' or e == '' or f == '' or n == '' or o == '' or p == '':
+                match_memo.put(match_key, None)
                 non_compounds.remove(item)
                 continue
             else:
+                #The (prescribed, dispensed) pairs compared with the shared MatchRules
+                ingredient_pairs = [(d, n)]
                 if  (d.lower() == n.lower()) : #Compare erxNorm Ing to dRxNorm Ing, if not equal, then show 1 (wrong drug)
                     incorrect_action1 = 0 #if the ingredients match in any of the e/d esc/d, e/dscd, escd/dscd ways
                 elif entries_are_true(d, n, ing_truth_table) or entries_are_true(d, r, ing_truth_table) or entries_are_true(h, r, ing_truth_table) or entries_are_true(h, n, ing_truth_table):
                     incorrect_action1 = 0
+                elif caching_match_rules.share_prefix(ingredient_pairs):
+                    incorrect_action1 = 0
                 else:
                     incorrect_action1 = 1 #if there is no ingredient match
 
@@ -1517,6 +1470,8 @@ def main_process(file, redcap_process, name, rxcui_data):
 
                 if f.lower() == p.lower(): #If the erxnorm strength doesn't equal the drxnorm strength, then show 2 (wrong strength)
                     incorrect_action2 = 0 #if the strengths match in any of the e/d esc/d, e/dscd, escd/dscd ways
+                elif caching_match_rules.strength_exempt(ingredient_pairs):
+                    incorrect_action2 = 0
                 else:
                     incorrect_action2 = 1 #if there is no strength match
 
@@ -1525,6 +1480,7 @@ def main_process(file, redcap_process, name, rxcui_data):
                         match_details = "2"
 
         ###Step 4: Create the list of items with necessary keys to go to REDCAP
+        match_memo.put(match_key, (match_details, incorrect_action1, incorrect_action2, incorrect_action3, incorrect_action4))
         filtered_for_redcap_withSCDS.append({
                 'record_id': item.get('uniqueID'),
                 'report_id': item.get('reportID'),
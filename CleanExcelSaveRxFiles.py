@@ -3,6 +3,7 @@ import csv
 import pprint
 import re
 import numpy as np
+from NDCUtils import canonicalize_ndc_columns
 
 #Set Pretty Print Rules to make the dictionaries look nice and easier to read when printed
 pp = pprint.PrettyPrinter(indent=2, sort_dicts=False, width=100)
@@ -220,13 +221,17 @@ def main_process(file):
     # Remove completely blank columns
     df = remove_blank_columns_from_dataframe(df)
 
+    # Put every NDC column in its canonical 11 digit form, one whole column at a time
+    df = canonicalize_ndc_columns(df, ['Escript NDC', 'Prescribed NDC', 'Dispensed NDC'])
+
     # Convert the DataFrame to a list of dictionaries
     raw_data = df.to_dict(orient='records')
 
     for row in raw_data:
-        row['Escript NDC'] = parse_number(row.get('Escript NDC'))
-        row['Prescribed NDC'] = parse_number(row.get('Prescribed NDC'))
-        row['Dispensed NDC'] = parse_number(row.get('Dispensed NDC'))
+        # NDC columns that were dropped as completely blank are still blank NDCs
+        row.setdefault('Escript NDC', '')
+        row.setdefault('Prescribed NDC', '')
+        row.setdefault('Dispensed NDC', '')
         row['GCN'] = parse_number(row.get('GCN'))
 
     # print(len(raw_data))
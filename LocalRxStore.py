@@ -0,0 +1,269 @@
+import os
+import csv
+import sqlite3
+import threading
+import time
+from io import StringIO
+from CacheUtils import NO_RXCUI
+
+#Local copy of SaveRxCUIDetails.csv kept in SQLite so the watcher does not have to download, parse and re-upload the whole
+#file for every processed report. Dropbox only gets synced once, at the end of a run. Each row remembers whether Dropbox
+#already has it, so a sync can send just the new details as a small journal file (see compact_journal).
+#The same database also keeps the NDC -> RxCUI mappings between runs (NDCRxCUIStore), each with the time it was fetched.
+
+detail_fields = ['RxCUI', 'RxNorm Name', 'RxNorm TTY', 'RxNorm Ingredient', 'RxNorm Dose Form', 'RxNorm Strength Details',
+                 'C RxNorm Name', 'C RxNorm TTY', 'C RxNorm RxCUI', 'C RxNorm Ingredient', 'C RxNorm Dose Form', 'C RxNorm Strength Details']
+
+default_store_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SaveRxCUIDetails.sqlite')
+
+def _quote(field):
+    return '"' + field.replace('"', '""') + '"'
+
+class RxCUIDetailStore:
+    """
+    RxCUI -> RxNorm details rows, with the RxCUI (as a string) as the primary key.
+    Works like the rxcui_index dictionary main_process expects: get(rxcui) to read a row and
+    store[rxcui] = row to save a new one, so it can be passed to main_process as rxcui_index.
+    """
+    def __init__(self, path=default_store_path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets a write commit without rewriting the database file
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{_quote(field)} TEXT" for field in detail_fields[1:])
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS rxcui_details ({_quote('RxCUI')} TEXT PRIMARY KEY, {columns}, synced INTEGER NOT NULL DEFAULT 1)")
+        # Stores made before the synced column existed were always fully uploaded
+        existing_columns = [row[1] for row in self.conn.execute("PRAGMA table_info(rxcui_details)")]
+        if 'synced' not in existing_columns:
+            self.conn.execute("ALTER TABLE rxcui_details ADD COLUMN synced INTEGER NOT NULL DEFAULT 1")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS rxcui_details_unsynced ON rxcui_details (synced) WHERE synced = 0")
+        self.conn.commit()
+        self._select_columns = ", ".join(_quote(field) for field in detail_fields)
+        self._insert_columns = self._select_columns + ", synced"
+        self._placeholders = ", ".join("?" for _ in detail_fields) + ", ?"
+        self._updates = ", ".join(f"{_quote(field)} = excluded.{_quote(field)}" for field in detail_fields[1:])
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rxcui_details").fetchone()[0]
+
+    def __contains__(self, rxcui):
+        return self.get(rxcui) is not None
+
+    def __getitem__(self, rxcui):
+        row = self.get(rxcui)
+        if row is None:
+            raise KeyError(rxcui)
+        return row
+
+    def __setitem__(self, rxcui, row):
+        self.upsert([dict(row, RxCUI=str(rxcui))])
+
+    def get(self, rxcui, default=None):
+        """
+        Input: RxCUI (string or integer)
+        Output: Dictionary with the detail_fields keys, or default if the RxCUI is not saved
+        """
+        with self.lock:
+            found = self.conn.execute(f"SELECT {self._select_columns} FROM rxcui_details WHERE RxCUI = ?", (str(rxcui),)).fetchone()
+        if found is None:
+            return default
+        return dict(found)
+
+    def _values(self, row, synced):
+        values = [str(row.get('RxCUI'))]
+        for field in detail_fields[1:]:
+            value = row.get(field)
+            values.append('' if value is None else str(value))
+        values.append(1 if synced else 0)
+        return values
+
+    @property
+    def changed(self):
+        """
+        True when the store has details that have not been synced to Dropbox yet
+        """
+        return self.unsynced_count() > 0
+
+    def unsynced_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rxcui_details WHERE synced = 0").fetchone()[0]
+
+    def upsert(self, rows):
+        """
+        Saves the rows, replacing the details of RxCUIs that are already in the store. The rows are marked as
+        not synced until mark_synced is called.
+        Input: List of dictionaries with the detail_fields keys
+        """
+        values = [self._values(row, synced=False) for row in rows if row.get('RxCUI') not in ('', None)]
+        if not values:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(f"INSERT INTO rxcui_details ({self._insert_columns}) VALUES ({self._placeholders}) "
+                                      f"ON CONFLICT(RxCUI) DO UPDATE SET {self._updates}, synced = 0", values)
+
+    def seed(self, rows, replace=False):
+        """
+        Loads rows that came from Dropbox, so they are marked as synced. By default RxCUIs already in the store are
+        left alone (the first row wins, like the old list search). With replace=True the rows overwrite what is
+        there, which is how journal files are applied on top of the base file.
+        Input: List of dictionaries with the detail_fields keys
+        """
+        values = [self._values(row, synced=True) for row in rows if row.get('RxCUI') not in ('', None)]
+        conflict = "REPLACE" if replace else "IGNORE"
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(f"INSERT OR {conflict} INTO rxcui_details ({self._insert_columns}) VALUES ({self._placeholders})", values)
+
+    def unsynced_rows(self):
+        """
+        Output: List of the rows saved since the last sync, ordered by RxCUI
+        """
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(f"SELECT {self._select_columns} FROM rxcui_details WHERE synced = 0 ORDER BY RxCUI")]
+
+    def mark_synced(self, rows=None):
+        """
+        Marks rows as uploaded to Dropbox. Pass the rows that were uploaded so details saved in the meantime stay unsynced,
+        or leave it out to mark everything.
+        """
+        with self.lock:
+            with self.conn:
+                if rows is None:
+                    self.conn.execute("UPDATE rxcui_details SET synced = 1 WHERE synced = 0")
+                else:
+                    self.conn.executemany("UPDATE rxcui_details SET synced = 1 WHERE RxCUI = ?", [(str(row.get('RxCUI')),) for row in rows])
+
+    def rows(self):
+        """
+        Output: List of every saved row as a dictionary, ordered by RxCUI
+        """
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(f"SELECT {self._select_columns} FROM rxcui_details ORDER BY RxCUI")]
+
+    def to_csv(self, rows=None):
+        """
+        Output: String with the whole store (or just the rows given) in the SaveRxCUIDetails.csv layout, ready to upload
+        """
+        return rows_to_csv(self.rows() if rows is None else rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def rows_to_csv(rows):
+    """
+    Input: List of dictionaries with the detail_fields keys
+    Output: String in the SaveRxCUIDetails.csv layout
+    """
+    csv_buffer = StringIO()
+    csv_writer = csv.DictWriter(csv_buffer, fieldnames=detail_fields, extrasaction='ignore')
+    csv_writer.writeheader()
+    csv_writer.writerows(rows)
+    return csv_buffer.getvalue()
+
+def compact_journal(base_rows, journal_files):
+    """
+    Merges the journal files into the base file so each RxCUI shows up once.
+    Input: base_rows, the rows of SaveRxCUIDetails.csv, and journal_files, a list with the rows of each journal file
+    from oldest to newest
+    Output: List of rows. The first row of an RxCUI in the base file is kept, and a journal row replaces it since it is newer.
+    """
+    compacted = {}
+    for row in base_rows:
+        rxcui = row.get('RxCUI')
+        if rxcui not in ('', None):
+            compacted.setdefault(str(rxcui), row)
+    for journal_rows in journal_files:
+        for row in journal_rows:
+            rxcui = row.get('RxCUI')
+            if rxcui not in ('', None):
+                compacted[str(rxcui)] = row
+    return list(compacted.values())
+
+ndc_cache_ttl_days = 90  # NDC -> RxCUI mappings are trusted for about three months before they are looked up again
+no_rxcui_ttl_days = 14  # NDCs RxNav had no RxCUI for are asked about again sooner, in case they were added
+
+class NDCRxCUIStore:
+    """
+    Durable NDC -> RxCUI cache kept in SQLite (by default in the same file as the RxCUI details). Every entry keeps the time it
+    was fetched, and entries older than ttl_days count as missing so the NDC is looked up again.
+    NDCs with no RxCUI are saved too (as NO_RXCUI, a NULL rxcui in the table) and expire after no_rxcui_ttl_days.
+    Nothing is loaded up front, each get is a single primary key read.
+    """
+    def __init__(self, path=default_store_path, ttl_days=ndc_cache_ttl_days, no_rxcui_ttl_days=no_rxcui_ttl_days):
+        self.path = path
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.no_rxcui_ttl_seconds = no_rxcui_ttl_days * 24 * 60 * 60
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS ndc_rxcui (ndc TEXT PRIMARY KEY, rxcui TEXT, fetched_at REAL NOT NULL)")
+        self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM ndc_rxcui").fetchone()[0]
+
+    def get(self, ndc):
+        """
+        Input: NDC (string)
+        Output: The saved RxCUI (string), NO_RXCUI if RxNav had no RxCUI for it, or None if the NDC was never saved
+        or its entry has expired
+        """
+        with self.lock:
+            found = self.conn.execute("SELECT rxcui, fetched_at FROM ndc_rxcui WHERE ndc = ?", (str(ndc),)).fetchone()
+        if found is None:
+            return None
+        rxcui, fetched_at = found
+        ttl_seconds = self.ttl_seconds if rxcui is not None else self.no_rxcui_ttl_seconds
+        if fetched_at < time.time() - ttl_seconds:
+            return None
+        return rxcui if rxcui is not None else NO_RXCUI
+
+    def put(self, ndc, rxcui):
+        """
+        Saves (or refreshes) the RxCUI of an NDC, or NO_RXCUI, with the current time.
+        """
+        saved_rxcui = None if rxcui is NO_RXCUI else str(rxcui)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO ndc_rxcui (ndc, rxcui, fetched_at) VALUES (?, ?, ?)",
+                                  (str(ndc), saved_rxcui, time.time()))
+
+    def purge_expired(self):
+        """
+        Deletes the entries older than their TTL.
+        Output: Number of entries deleted
+        """
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                deleted = self.conn.execute("DELETE FROM ndc_rxcui WHERE (rxcui IS NOT NULL AND fetched_at < ?) OR (rxcui IS NULL AND fetched_at < ?)",
+                                            (now - self.ttl_seconds, now - self.no_rxcui_ttl_seconds)).rowcount
+        return deleted
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_ndc_stores = {}  # Path -> NDCRxCUIStore, opened by shared_ndc_store the first time a pipeline needs it
+_ndc_stores_lock = threading.Lock()
+
+def shared_ndc_store(path=default_store_path):
+    """
+    Opens the NDCRxCUIStore at path the first time it is asked for and gives every later caller the same one, so importing
+    a pipeline does not create the database and the pipelines running in one process share one connection.
+    Input: String (path of the SQLite file)
+    Output: NDCRxCUIStore
+    """
+    with _ndc_stores_lock:
+        store = _ndc_stores.get(path)
+        if store is None:
+            store = _ndc_stores[path] = NDCRxCUIStore(path)
+        return store
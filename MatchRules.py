@@ -0,0 +1,98 @@
+import json
+import os
+
+#Ingredient specific exceptions of the match step, read from MatchRules.json and compiled into lookup tables:
+#dose form exceptions (enteric coated aspirin, ondansetron disintegrating tablets, chewables) keyed by ingredient and by
+#(rule, prescribed dose form, dispensed dose form), ingredients whose strengths are not compared (melatonin) and
+#ingredient prefixes that count as the same drug (influenza A vaccines). The pipelines pass the pairs of values they
+#compare, (eRxNorm, dRxNorm) and for branded drugs their SCD versions too, and each check is a few dictionary lookups.
+#The ingredient and dose form pairs are passed in the same order, so a rule with paired_dose_forms (chewables) only
+#looks at the dose forms of the same two drugs whose ingredients matched it.
+
+default_rules_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MatchRules.json')
+
+def _lowered_pairs(pairs):
+    #Values that are not strings (a missing SCD detail) are never a match
+    return [(value1.lower(), value2.lower()) for value1, value2 in pairs if isinstance(value1, str) and isinstance(value2, str)]
+
+class MatchRules:
+    """
+    Parameters:
+        rules (dict): The contents of MatchRules.json
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.rule_names = []
+        self.ingredient_rules = {}  # Lowercase ingredient -> numbers of every dose form exception that lists it
+        self.paired_rules = set()  # Numbers of the exceptions that only compare the dose forms paired with the ingredients
+        self.dose_form_pairs = set()  # (rule number, prescribed dose form, dispensed dose form)
+        for number, rule in enumerate(rules.get('dose_form_exceptions', [])):
+            self.rule_names.append(rule['name'])
+            for ingredient in rule['ingredients']:
+                self.ingredient_rules[ingredient.lower()] = self.ingredient_rules.get(ingredient.lower(), ()) + (number,)
+            if rule.get('paired_dose_forms'):
+                self.paired_rules.add(number)
+            for prescribed, dispensed in rule['dose_forms']:
+                self.dose_form_pairs.add((number, prescribed, dispensed))
+                if rule.get('both_ways'):
+                    self.dose_form_pairs.add((number, dispensed, prescribed))
+        self.ingredient_prefixes = tuple(prefix.lower() for prefix in rules.get('ingredient_prefixes', []))
+        self.strength_exempt_ingredients = frozenset(ingredient.lower() for ingredient in rules.get('strength_exempt_ingredients', []))
+
+    @classmethod
+    def load(cls, path=default_rules_path):
+        with open(path, encoding='utf-8') as rules_file:
+            return cls(json.load(rules_file))
+
+    def without_dose_form_exceptions(self):
+        """
+        Output: MatchRules with the same ingredient prefixes and strength exempt ingredients and no dose form exceptions,
+        for CachingProcessSaveRx, whose match step never had them
+        """
+        return MatchRules(dict(self.rules, dose_form_exceptions=[]))
+
+    def dose_form_exception(self, ingredient_pairs, dose_form_pairs):
+        """
+        Input: List of (prescribed, dispensed) ingredient pairs, List of (prescribed, dispensed) dose form pairs in the
+        same order (the dose form pair at each position belongs to the same two drugs as the ingredient pair there)
+        Output: None if no exception covers the ingredients, True if any exception that does lists one of the dose form
+        pairs it looks at (all of them, or with paired_dose_forms only the one at the position of the matching
+        ingredients), False if none does
+        """
+        covered = False
+        for position, (ingredient1, ingredient2) in enumerate(ingredient_pairs):
+            if not isinstance(ingredient1, str) or not isinstance(ingredient2, str) or ingredient1.lower() != ingredient2.lower():
+                continue
+            for number in self.ingredient_rules.get(ingredient1.lower(), ()):
+                covered = True
+                if number in self.paired_rules:
+                    pairs = dose_form_pairs[position:position + 1]
+                else:
+                    pairs = dose_form_pairs
+                if any((number, prescribed, dispensed) in self.dose_form_pairs for prescribed, dispensed in pairs):
+                    return True
+        return False if covered else None
+
+    def share_prefix(self, ingredient_pairs):
+        """
+        Input: List of (prescribed, dispensed) ingredient pairs
+        Output: True if both ingredients of a pair start with the same listed prefix
+        """
+        return any(ingredient1.startswith(prefix) and ingredient2.startswith(prefix)
+                   for ingredient1, ingredient2 in _lowered_pairs(ingredient_pairs) for prefix in self.ingredient_prefixes)
+
+    def strength_exempt(self, ingredient_pairs):
+        """
+        Input: List of (prescribed, dispensed) ingredient pairs
+        Output: True if both ingredients of a pair are the same ingredient, one whose strength is not compared
+        """
+        return any(ingredient1 == ingredient2 and ingredient1 in self.strength_exempt_ingredients
+                   for ingredient1, ingredient2 in _lowered_pairs(ingredient_pairs))
+
+    def signature(self):
+        #Used by TruthTables.rules_fingerprint
+        return (tuple(self.rule_names), tuple(sorted(self.ingredient_rules.items())), tuple(sorted(self.paired_rules)),
+                tuple(sorted(self.dose_form_pairs)), self.ingredient_prefixes, tuple(sorted(self.strength_exempt_ingredients)))
+
+#Loaded once, every pipeline matches with the same compiled rules
+match_rules = MatchRules.load()
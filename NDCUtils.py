@@ -0,0 +1,84 @@
+import re
+import math
+import pandas as pd
+
+#One canonical form for every NDC: the 11 digit 5-4-2 form RxNav and RxNorm use, as a string.
+#Pharmacy files give the same NDC in many shapes: a float from tabula or openpyxl (1234567890.0), an int that lost its
+#leading zeros, a string with a '.0' suffix, or a hyphenated 10 digit NDC in the 4-4-2, 5-3-2 or 5-4-1 layout. Padding
+#the whole number with zfill(11) is only right for 4-4-2, so the hyphenated layouts are padded one segment at a time
+#(labeler to 5, product to 4, package to 2). Plain digit strings of 11 digits or less are padded on the left, like before.
+#canonicalize_ndcs does a whole column at once with pandas string methods, canonical_ndc does a single value the same way.
+
+ndc_columns = ['Escript NDC', 'Prescribed NDC', 'Dispensed NDC']  # NDC columns of the cleaned pharmacy reports
+blank_values = ['', 'nan', 'none', 'null', '<na>']  # Values (lowercase) that mean there is no NDC
+
+hyphenated_pattern = re.compile(r'^(\d{4,5})-(\d{3,4})-(\d{1,2})$')
+digits_pattern = re.compile(r'^\d{1,11}$')
+float_suffix_pattern = re.compile(r'\.0+$')
+
+def canonical_ndc(value):
+    """
+    Input: NDC as a string, int or float (or a blank value)
+    Output: 11 digit NDC string, '' for a blank value, or the trimmed text when it does not look like an NDC
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = float_suffix_pattern.sub('', str(value).strip()).replace(',', '')
+    if text.lower() in blank_values:
+        return ''
+    found = hyphenated_pattern.match(text)
+    if found is not None:
+        labeler, product, package = found.groups()
+        if len(labeler) + len(product) + len(package) in (10, 11):
+            return labeler.zfill(5) + product.zfill(4) + package.zfill(2)
+        return text
+    if digits_pattern.match(text):
+        return text.zfill(11)
+    return text
+
+def _whole_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def canonicalize_ndcs(values):
+    """
+    Vectorized canonical_ndc for a whole column.
+
+    Input: pandas Series or list of NDCs
+    Output: pandas Series of canonical NDC strings, with the same index as the input
+    """
+    column = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    #Whole number floats print without the .0 once they are ints, missing values print as 'nan' and count as blank
+    text = column.map(_whole_number, na_action='ignore').astype(str).str.strip()
+    text = text.str.replace(float_suffix_pattern.pattern, '', regex=True).str.replace(',', '', regex=False)
+    blank = text.str.lower().isin(blank_values)
+    parts = text.str.extract(hyphenated_pattern.pattern)
+    lengths = parts[0].str.len() + parts[1].str.len() + parts[2].str.len()
+    hyphenated = parts[0].notna() & lengths.isin([10, 11])
+    digits = text.str.match(digits_pattern.pattern)
+    canonical = text.mask(digits, text.str.zfill(11))
+    canonical = canonical.mask(hyphenated, parts[0].str.zfill(5) + parts[1].str.zfill(4) + parts[2].str.zfill(2))
+    return canonical.mask(blank, '')
+
+def canonicalize_ndc_columns(data, columns=ndc_columns):
+    """
+    Replaces the NDC columns of a report with their canonical form.
+
+    Input: pandas DataFrame or list of dictionaries, List of column names (columns that are not there are skipped)
+    Output: The same DataFrame or list, with its NDC columns canonicalized
+    """
+    if isinstance(data, pd.DataFrame):
+        for column in columns:
+            if column in data.columns:
+                data[column] = canonicalize_ndcs(data[column])
+        return data
+    for column in columns:
+        if any(column in row for row in data):
+            canonical = canonicalize_ndcs([row.get(column) for row in data])
+            for row, value in zip(data, canonical):
+                if column in row:
+                    row[column] = value
+    return data
@@ -24,13 +24,19 @@ import tempfile
 import PyPDF2
 import numpy as np
 import math
-import requests
+from RxNavClient import rxnav_client
 import csv
 import pprint
 from csv import DictWriter
 from timeit import default_timer as timer
-from collections import defaultdict, OrderedDict
-from time import sleep
+from LocalRxStore import shared_ndc_store
+from RxCUIJournal import read_saved_rxcui_details, upload_rxcui_journal, is_not_found, is_conflict
+from CacheUtils import NO_RXCUI, make_cache, build_rxcui_index, SingleFlight, MatchMemo
+from RxConcept import extract_concept, as_concept
+from NDCUtils import canonical_ndc, canonicalize_ndc_columns
+from TruthTables import EquivalenceClasses, DirectedPairs, rules_fingerprint
+from MatchRules import match_rules
+from StrengthParser import compare_medication_strengths
 import time
 import re
 
@@ -99,46 +105,32 @@ def list_files_in_folder(folder_path,dbx):
         print(f'Error listing folder contents: {e}')
         return []
 
-connect_timeout = 10
-read_timeout = 100
-
-class LFUCache:
-    def __init__(self, capacity):
-        self.capacity = capacity
-        self.cache = {}  # Dictionary to store API responses
-        self.frequency = defaultdict(int)  # Dictionary to store access frequencies
-        self.order = OrderedDict()  # Ordered dictionary to maintain LFU order
-
-    def get(self, key):
-        if key not in self.cache:
-            return None
-        # Update the access frequency
-        self.frequency[key] += 1
-        # Move the key to the end of the LFU order
-        self.order.move_to_end(key)
-        return self.cache[key]
-
-    def put(self, key, value):
-        if self.capacity == 0:
-            return
-
-        # Check if the cache is full and needs eviction
-        if len(self.cache) >= self.capacity:
-            # Find the least frequently used item
-            lfu_key = min(self.frequency, key=self.frequency.get)
-            # Remove the least frequently used item from the cache and frequency dictionary
-            del self.cache[lfu_key]
-            del self.frequency[lfu_key]
-            del self.order[lfu_key]
-
-        # Add the new key-value pair to the cache and update frequency
-        self.cache[key] = value
-        self.frequency[key] += 1
-        # Add the key to the end of the LFU order
-        self.order[key] = None
-
-capacity = 100  # Set the capacity according to your requirements
-lfu_cache = LFUCache(capacity)
+
+#NDC -> RxCUI mappings are small and the same NDCs come back every month, so they get a large LFU cache.
+#RxCUI -> RxNorm details dictionaries are heavier and mostly reused within one report, so they get their own LRU cache.
+ndc_cache_policy = 'lfu'
+ndc_cache_capacity = 100000
+rxnorm_cache_policy = 'lru'
+rxnorm_cache_capacity = 5000
+ndc_cache = make_cache(ndc_cache_policy, ndc_cache_capacity, 'ndc_to_rxcui')
+ndc_store = None  # NDC -> RxCUI mappings saved between runs (NDCRxCUIStore), opened on first use by get_ndc_store
+no_rxcui_value = None  # What fetch_data_from_api gives back for an NDC with no RxCUI: None, the same thing the lookup gave before once it gave up on the blank rxcui
+rxnorm_cache = make_cache(rxnorm_cache_policy, rxnorm_cache_capacity, 'rxcui_to_details')
+#Lookups that are running right now, so two workers asking for the same NDC or RxCUI at once only call RxNav once
+ndc_flight = SingleFlight('ndc_to_rxcui')
+rxnorm_flight = SingleFlight('rxcui_to_details')
+match_memo = MatchMemo('match_outcomes')  # Match outcomes by (eRxCUI, dRxCUI, NDCs equal), kept for the whole run
+#historystatus.json documents, already read into RxConcepts, shared by get_name_tty and every TTY handler so linked
+#concepts (the SCD of an SBD, pack RxCUIs, remapped RxCUIs) are only downloaded and read once per run
+historystatus_cache_policy = 'lru'
+historystatus_cache_capacity = 20000
+historystatus_cache = make_cache(historystatus_cache_policy, historystatus_cache_capacity, 'rxcui_historystatus')
+
+def cache_stats():
+    """
+    Output: List with the statistics dictionary of each lookup cache (NDC -> RxCUI, RxCUI -> details and RxCUI -> historystatus)
+    """
+    return [ndc_cache.stats(), rxnorm_cache.stats(), historystatus_cache.stats()]
 
 def read_csv_to_dicts(filepath, encoding='utf-8-sig', newline='', delimiter=','):
     """
@@ -173,158 +165,77 @@ def get_rxnorm_rxcui(ndc, count):
     """
     Takes an NDC number, looks it up at the endpoint url (an RxNorm API)
     and looks to see if the NDC number exists and what its corresponding rxcui is
-    Also has a clause for if the API doesn't work as expected
+    A failed call is retried by rxnav_client with backoff, if RxNav keeps failing the error is raised to the caller
     Accepts the count, an integer, which is only used if there is a Response Error. If so it reports
     out the count to let the user know which entry/row of data caused the error. 
 
     Inputs: Integer (11 digit number)
     Outputs: Integer (rxcui)
     """
-    if (len(ndc)) < 11:
-            #Add 0s to the left of the number to ensure it's 11 digits long and then replace the NDC with the padded one
-            padded_number = str(ndc).zfill(11)
-            #item['Product Code (NDC)'] == padded_number
-            connect_timeout = 10
-            read_timeout = 100
-            base_url = "https://rxnav.nlm.nih.gov/REST"
-            endpoint = f"{base_url}/ndcstatus.json?ndc={padded_number}"
-            max_try = 5
-            try_number = 1
-            while try_number <= max_try:
-                response = requests.get(endpoint, timeout=(connect_timeout, read_timeout))
-                if response.status_code == 200:
-                    data = response.json()
-                    #pp.pprint(data)
-                    if "ndcStatus" in data and data["ndcStatus"] == "noRxcui":
-                        print(f"No medication found for NDC: {ndc}")
-                    elif "ndcStatus" in data and data["ndcStatus"] != "noRxcui":
-                        rxcui = int(data["ndcStatus"]["rxcui"])
-                    else:
-                        print("Invalid response from API")
-                    return rxcui
-                else:
-                    print(f"API failed on {endpoint}, entry number {count}, Trying Again, attempt number {try_number} of 5")
-                    sleep(4)
-                    try_number +=1
+    #Turn the NDC into its 11 digit form, padding each part of a hyphenated 10 digit NDC the way its layout needs
+    padded_number = canonical_ndc(ndc)
+    base_url = "https://rxnav.nlm.nih.gov/REST"
+    endpoint = f"{base_url}/ndcstatus.json?ndc={padded_number}"
+    data = rxnav_client.get_json(endpoint, description=f"{endpoint}, entry number {count}")
+    #pp.pprint(data)
+    if "ndcStatus" in data and (data["ndcStatus"] == "noRxcui" or not data["ndcStatus"].get("rxcui")):
+        print(f"No medication found for NDC: {ndc}")
+        return NO_RXCUI
+    elif "ndcStatus" in data and data["ndcStatus"] != "noRxcui":
+        rxcui = int(data["ndcStatus"]["rxcui"])
     else:
-        ndc = ndc
-        base_url = "https://rxnav.nlm.nih.gov/REST"
-        endpoint = f"{base_url}/ndcstatus.json?ndc={ndc}"
-        connect_timeout = 10
-        read_timeout = 100
-        max_try = 5
-        try_number = 1
-        while try_number <= max_try:
-            response = requests.get(endpoint, timeout=(connect_timeout, read_timeout))
-            try:
-                if response.status_code == 200:
-                    data = response.json()
-                    #pp.pprint(data)
-                    if "ndcStatus" in data and data["ndcStatus"] == "noRxcui":
-                        print(f"No medication found for NDC: {ndc}")
-                    elif "ndcStatus" in data and data["ndcStatus"] != "noRxcui":
-                        rxcui = int(data["ndcStatus"]["rxcui"])
-                    else:
-                        print("Invalid response from API")
-                    return rxcui
-            except Exception as e:
-                print(f"API failed on {endpoint}, entry number {count}, Trying Again, attempt number {try_number} of 5")
-                sleep(4)
-                try_number +=1
+        print("Invalid response from API")
+        raise ValueError(f"Invalid response from API for NDC: {ndc}")
+    return rxcui
+
+def get_concept(rxcui):
+    """
+    Gets the historystatus.json document of an RxCUI from RxNav and reads it into an RxConcept with extract_concept.
+    Each document is downloaded and read once, then the RxConcept is served from historystatus_cache.
+
+    Input: RxCUI (string or integer)
+    Output: RxConcept
+    """
+    key = str(rxcui)
+    concept = historystatus_cache.get(key)
+    if concept is not None:
+        return concept
+    #Only successful answers are cached. rxnav_client retries a failed call, if it still fails the error is raised
+    #so the caller can report it
+    concept = extract_concept(rxnav_client.get_json(f"rxcui/{key}/historystatus.json"))
+    historystatus_cache.put(key, concept)
+    return concept
 
 def get_dose_forms(rxcui_data):
     """
-    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. The function adds the doseFormName
-    and information from the doseFormGroupConcept(s) to the list of dose form info. The try/except is incase the doseFormGroupConcept info
-    doesn't exist for a dictionary. Otherwise it counts the number of times doseFormGroupName is mentioned and then pulls the value from
-    that key each time.
+    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. Returns the doseFormName
+    followed by the doseFormGroupName(s) from the doseFormGroupConcept(s). The values are worked out once by extract_concept.
 
-    Inputs: Dictionary of Data from the Json the API pulled in
+    Inputs: Dictionary of Data from the Json the API pulled in (or the RxConcept already made from it)
     Outputs: List of Dose Form Information
     """
-    if 'doseFormConcept' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']:
-        dose_form_options = []
-        dose_form_options.append(rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName'])
-        if 'doseFormGroupName' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]:
-            try:
-                m = sum('doseFormGroupName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'])
-                n = 1
-                while n <= m:
-                    dose = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][n-1]['doseFormGroupName']
-                    dose_form_options.append(dose)
-                    n += 1
-            except:
-                pass
-        elif 'doseFormGroupName' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][0]:
-            try:
-                m = sum('doseFormGroupName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'])
-                n = 1
-                while n <= m:
-                    dose = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][n-1]['doseFormGroupName']
-                    dose_form_options.append(dose)
-                    n += 1
-            except:
-                pass
-    else:
-        dose_form_options = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept'][0]['doseFormGroupName']
-    return dose_form_options
+    return as_concept(rxcui_data).dose_forms
 
 def get_multiple_ingredients(rxcui_data):
     """
-    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. The function adds the Ingredient
-    information from the activeIngredientName(s) to the list of ingredient info. This function is used when we know there is more than one
-    ingredient for the medication.
+    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. Returns the
+    activeIngredientName(s) of the medication. This function is used when we know there is more than one ingredient for the medication.
 
-    Inputs: Dictionary of Data from the Json the API pulled in
+    Inputs: Dictionary of Data from the Json the API pulled in (or the RxConcept already made from it)
     Outputs: List of Ingredients
     """
-    if 'ingredientAndStrength' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']:
-        ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
-        n = 1
-        ingredients = []
-        while n <= ingredient_count:
-            ingredients.append(rxcui_data["rxcuiStatusHistory"]["definitionalFeatures"]["ingredientAndStrength"][n-1]["activeIngredientName"])
-            n += 1
-    elif 'ingredientName' in rxcui_data["rxcuiStatusHistory"]["derivedConcepts"]["ingredientConcept"][0]:
-            ingredients = rxcui_data["rxcuiStatusHistory"]["derivedConcepts"]["ingredientConcept"][0]['ingredientName']
-
-    else:
-            ingredients = ""
-    return ingredients
+    return as_concept(rxcui_data).ingredients
 
 def get_multiple_strengths(rxcui_data):
     """
-    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. The function adds the strength
-    information from the numerator and denominator values and units to the list of ingredient info. This function is used when we know there is more than one
-    ingredient for the medication, so therefore more than one set of strength information.
+    Takes in the rxcui_data of information from the json pulled in from the RxNorm API using the RxCUI. Returns the strength
+    of every ingredient as "numeratorValue numeratorUnit/denominatorValue denominatorUnit". This function is used when we know there
+    is more than one ingredient for the medication, so therefore more than one set of strength information.
 
-    Inputs: Dictionary of Data from the Json the API pulled in
+    Inputs: Dictionary of Data from the Json the API pulled in (or the RxConcept already made from it)
     Outputs: List of Strength Details
     """
-    if 'ingredientAndStrength' in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']:
-        ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
-        n = 1
-        strength_numerators = []
-        strength_denominators = []
-        while n <= ingredient_count:
-            x = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorValue']
-            y = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorUnit']
-            a = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorValue']
-            b = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorUnit']
-            strength_numerators.append(f"{x} {y}")
-            strength_denominators.append(f"{a} {b}")
-            n += 1
-
-        m = 0
-        Strength_Details = []
-        while m <= len(strength_numerators) - 1:
-            numerator = strength_numerators[m]
-            denominator = strength_denominators[m]
-            Strength_Details.append(f"{numerator}/{denominator}")
-            m += 1
-    else:
-        Strength_Details = ['N/A']
-    return Strength_Details
+    return as_concept(rxcui_data).strengths
 
 def get_ingredient_strength_doseform(rxcui):
     """
@@ -335,52 +246,25 @@ def get_ingredient_strength_doseform(rxcui):
     RxNorm Dose Form, Remapped RxNorm Strength Details. The values come from the RxCui given as the input.
     """
     rx_norm_info = {}
-    url_rxcui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/historystatus.json'
-    response = requests.get(url_rxcui, timeout=(connect_timeout, read_timeout))
-    rxcui_data = response.json()
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    concept = get_concept(rxcui)
+    name = concept.name
     rx_norm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rx_norm_info['RxNorm TTY'] = tty
-    if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-        ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-        dose_form = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName']
-        status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
-        source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-        strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-        strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-        strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-        strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+    if concept.is_multiple_ingredient == "NO":
+        ingredient = concept.ingredient
+        dose_form = concept.dose_form
+        status = concept.status
+        source = concept.source
         rx_norm_info["RxNorm Ingredient"] = ingredient
         rx_norm_info["RxNorm Dose Form"] = dose_form
-        rx_norm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+        rx_norm_info["RxNorm Strength Details"] = concept.strength
     else:
-        ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
-        dose_form = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName']
-        # print(f"Ingredient Count: {ingredient_count}")
-        n = 1
-        ingredients = []
-        strength_numerators = []
-        strength_denominators = []
-        while n <= ingredient_count:
-            ingredients.append(rxcui_data["rxcuiStatusHistory"]["definitionalFeatures"]["ingredientAndStrength"][n-1]["activeIngredientName"])
-            x = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorValue']
-            y = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['numeratorUnit']
-            a = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorValue']
-            b = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n-1]['denominatorUnit']
-            strength_numerators.append(f"{x} {y}")
-            strength_denominators.append(f"{a} {b}")
-            n += 1
-        rx_norm_info["RxNorm Ingredient"] = ingredients
+        ingredient_count = concept.ingredient_count
+        dose_form = concept.dose_form
+        rx_norm_info["RxNorm Ingredient"] = concept.ingredients
         rx_norm_info["RxNorm Dose Form"] = dose_form
-        m = 0
-        Strength_Details = []
-        while m <= len(strength_numerators) - 1:
-            numerator = strength_numerators[m]
-            denominator = strength_denominators[m]
-            Strength_Details.append(f"{numerator}/{denominator}")
-            m += 1
-        rx_norm_info["RxNorm Strength Details"] = Strength_Details
+        rx_norm_info["RxNorm Strength Details"] = concept.strengths
 
     return(rx_norm_info)
 
@@ -393,55 +277,46 @@ def scd_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+    status = concept.status
     if status != "NotCurrent" and status != "Remapped":
         #If the tty is an SCD, and there is only 1 ingredient to this product -
-        if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            dose_form = get_dose_forms(rxcui_data)
+        if concept.is_multiple_ingredient == "NO":
+            ingredient = concept.ingredient
+            dose_form = concept.dose_forms
             # print(f"Dose Form: {dose_form}")
-            source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-            strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+            source = concept.source
             rxnorm_info["RxNorm Ingredient"] = ingredient
             rxnorm_info["RxNorm Dose Form"] = dose_form
-            rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+            rxnorm_info["RxNorm Strength Details"] = concept.strength
         #If the tty is an SCD, and has multiple ingredients
         else:
-            ingredients = get_multiple_ingredients(rxcui_data)
-            dose_form = get_dose_forms(rxcui_data)
-            Strength_Details = get_multiple_strengths(rxcui_data)
+            ingredients = concept.ingredients
+            dose_form = concept.dose_forms
+            Strength_Details = concept.strengths
             rxnorm_info["RxNorm Ingredient"] = ingredients
             rxnorm_info["RxNorm Dose Form"] = dose_form
             rxnorm_info["RxNorm Strength Details"] = Strength_Details
     elif status == "Remapped":
-        remapped_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['remappedConcept'][0]['remappedRxCui']
-        remapped_url = f'https://rxnav.nlm.nih.gov/REST/rxcui/{remapped_rxcui}/historystatus.json'
-        response3 = requests.get(remapped_url, timeout=(connect_timeout, read_timeout))
-        remapped_rxcui_data = response3.json()
-        remapped_tty = remapped_rxcui_data['rxcuiStatusHistory']['attributes']['tty']
-        if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            dose_form = get_dose_forms(remapped_rxcui_data)
-            strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        remapped_rxcui = concept.remapped_rxcui
+        remapped_concept = get_concept(remapped_rxcui)
+        remapped_tty = remapped_concept.tty
+        if remapped_concept.is_multiple_ingredient == "NO":
+            ingredient = remapped_concept.ingredient
+            dose_form = remapped_concept.dose_forms
             rxnorm_info["RxNorm Ingredient"] = ingredient
             rxnorm_info["RxNorm Dose Form"] = dose_form
-            rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+            rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
         #If the remappped_tty is an SCD has more than 1 ingredient
-        elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
-            ingredients = get_multiple_ingredients(remapped_rxcui_data)
-            dose_form = get_dose_forms(remapped_rxcui_data)
-            Strength_Details = get_multiple_strengths(remapped_rxcui_data)
+        elif remapped_concept.is_multiple_ingredient == "YES":
+            ingredients = remapped_concept.ingredients
+            dose_form = remapped_concept.dose_forms
+            Strength_Details = remapped_concept.strengths
             rxnorm_info["RxNorm Ingredient"] = ingredients
             rxnorm_info["RxNorm Dose Form"] = dose_form
             rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -466,80 +341,71 @@ def sbd_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
 
-    status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+    status = concept.status
     if status != 'NotCurrent':
     # source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
     #If the Rxcui of the SBD isn't remapped
         if status != "Remapped":
         #If the SBD has only 1 ingredient
-            if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
+            if concept.is_multiple_ingredient == "NO":
                 #Get all the original rxcui info
-                ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                dose_form = get_dose_forms(rxcui_data)
-                strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                ingredient = concept.ingredient
+                dose_form = concept.dose_forms
                 rxnorm_info["RxNorm Ingredient"] = ingredient
                 rxnorm_info["RxNorm Dose Form"] = dose_form
-                rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                rxnorm_info["RxNorm Strength Details"] = concept.strength
             #If the SBD has more than 1 ingredient
-            elif rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+            elif concept.is_multiple_ingredient == "YES":
                 #Get all the original rxcui info
-                ingredients = get_multiple_ingredients(rxcui_data)
-                dose_form = get_dose_forms(rxcui_data)
-                Strength_Details = get_multiple_strengths(rxcui_data)
+                ingredients = concept.ingredients
+                dose_form = concept.dose_forms
+                Strength_Details = concept.strengths
                 rxnorm_info["RxNorm Ingredient"] = ingredients
                 rxnorm_info["RxNorm Dose Form"] = dose_form
                 rxnorm_info["RxNorm Strength Details"] = Strength_Details
-            scd_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['scdConcept']['scdConceptRxcui']
+            scd_rxcui = concept.scd_rxcui
             #Now find the RXNorm info from the SCD RxCui
-            url_scd_cui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{scd_rxcui}/historystatus.json'
-            response2 = requests.get(url_scd_cui, timeout=(connect_timeout, read_timeout))
-            scd_cui_data = response2.json()
+            scd_concept = get_concept(scd_rxcui)
             #If the SCD CUI isn't remapped:
-            if scd_cui_data['rxcuiStatusHistory']['metaData']['status'] != "Remapped":
+            if scd_concept.status != "Remapped":
                 #Get the tty of this data. We expect it to be an SCD
-                scd_tty = scd_cui_data["rxcuiStatusHistory"]["attributes"]["tty"]
+                scd_tty = scd_concept.tty
                 #Get the name of the drug from this info
-                scd_name = scd_cui_data["rxcuiStatusHistory"]["attributes"]["name"]
+                scd_name = scd_concept.name
                 #Get info from scd rx cui
                 rxnorm_info["C RxNorm Name"] = scd_name
                 rxnorm_info['C RxNorm TTY'] = scd_tty
                 rxnorm_info["C RxNorm RxCUI"] = scd_rxcui
                 #The scd cui only has one ingredient
-                if scd_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                    scd_ingredient = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                    scd_dose_form = get_dose_forms(scd_cui_data)
-                    scd_status = scd_cui_data["rxcuiStatusHistory"]['metaData']['status']
-                    scd_source = scd_cui_data["rxcuiStatusHistory"]['metaData']['source']
-                    scd_strength_numerator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                    scd_strength_numeratorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                    scd_strength_denominator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                    scd_strength_denominatorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                if scd_concept.is_multiple_ingredient == "NO":
+                    scd_ingredient = scd_concept.ingredient
+                    scd_dose_form = scd_concept.dose_forms
+                    scd_status = scd_concept.status
+                    scd_source = scd_concept.source
                     rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
                     rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-                    rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+                    rxnorm_info["C RxNorm Strength Details"] = scd_concept.strength
                 #If the scd cui has more than one ingredient
                 else:
                     #Get info from scd rx cui
-                    scd_ingredients = get_multiple_ingredients(scd_cui_data)
-                    scd_dose_form = get_dose_forms(scd_cui_data)
-                    SCD_Strength_Details = get_multiple_strengths(scd_cui_data)
+                    scd_ingredients = scd_concept.ingredients
+                    scd_dose_form = scd_concept.dose_forms
+                    SCD_Strength_Details = scd_concept.strengths
                     rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
                     rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
                     rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
             #If the scd_cui is remapped, get that information
-            elif scd_cui_data['rxcuiStatusHistory']['status'] == "Remapped":
+            elif scd_concept.history_status == "Remapped":
                 rxnorm_info["C RxNorm RxCUI"] = scd_rxcui
                 #Get the new rxcui of the remapped scd rxcui
-                remapped_scd_cui = scd_cui_data['rxcuiStatusHistory']['derivedConcepts']['remappedConcept'][0]['remappedRxCui']
+                remapped_scd_cui = scd_concept.remapped_rxcui
                 details = get_ingredient_strength_doseform(remapped_scd_cui)
                 rxnorm_info['C RxNorm Name'] = details.get('Remapped RxNorm Name')
                 rxnorm_info['C RxNorm TTY'] = details.get('Remapped RxNorm TTY')
@@ -548,104 +414,84 @@ def sbd_info(rxcui_data):
                 rxnorm_info['C RxNorm Strength Details'] = details.get('Remapped RxNorm Strength Details')
                     #If the original rxcui remaps
         elif status == "Remapped":
-            remapped_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['remappedConcept'][0]['remappedRxCui']
-            remapped_url = f'https://rxnav.nlm.nih.gov/REST/rxcui/{remapped_rxcui}/historystatus.json'
-            response3 = requests.get(remapped_url, timeout=(connect_timeout, read_timeout))
-            remapped_rxcui_data = response3.json()
-            remapped_tty = remapped_rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+            remapped_rxcui = concept.remapped_rxcui
+            remapped_concept = get_concept(remapped_rxcui)
+            remapped_tty = remapped_concept.tty
             # print(remapped_tty)
             if remapped_tty == "SBD":
                 #if the remapped_tty is an SBD with 1 ingredient
-                if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                    ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                    dose_form = get_dose_forms(remapped_rxcui_data)
-                    strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                    strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                    strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                    strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                if remapped_concept.is_multiple_ingredient == "NO":
+                    ingredient = remapped_concept.ingredient
+                    dose_form = remapped_concept.dose_forms
                     rxnorm_info["RxNorm Ingredient"] = ingredient
                     rxnorm_info["RxNorm Dose Form"] = dose_form
-                    rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                    rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
                 #If the remappped_tty is an SBD has more than 1 ingredient
-                elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+                elif remapped_concept.is_multiple_ingredient == "YES":
                     #Get all the original rxcui info
-                    ingredients = get_multiple_ingredients(rxcui_data)
-                    dose_form = get_dose_forms(rxcui_data)
-                    Strength_Details = get_multiple_strengths(rxcui_data)
+                    ingredients = concept.ingredients
+                    dose_form = concept.dose_forms
+                    Strength_Details = concept.strengths
                     rxnorm_info["RxNorm Ingredient"] = ingredients
                     rxnorm_info["RxNorm Dose Form"] = dose_form
                     rxnorm_info["RxNorm Strength Details"] = Strength_Details
                     # get the SCD from the remapped SBD no matter the number of ingredients
-                    scd_cui =  remapped_rxcui_data['rxcuiStatusHistory']['derivedConcepts']['scdConcept']['scdConceptRxcui']
-                    scd_cui_url = f'https://rxnav.nlm.nih.gov/REST/rxcui/{scd_cui}/historystatus.json'
-                    response4 = requests.get(scd_cui_url, timeout=(connect_timeout, read_timeout))
-                    remapped_scd_cui_data = response4.json()
-                    verify_tty = remapped_scd_cui_data['rxcuiStatusHistory']['attributes']['tty']
-                    scd_status = remapped_scd_cui_data["rxcuiStatusHistory"]['metaData']['status']
+                    scd_cui =  remapped_concept.scd_rxcui
+                    remapped_scd_concept = get_concept(scd_cui)
+                    verify_tty = remapped_scd_concept.tty
+                    scd_status = remapped_scd_concept.status
                     rxnorm_info["C RxNorm RxCUI"] = scd_rxcui
                     # print(verify_tty)
                     #If the scd cui data has only 1 ingredient
-                    if remapped_scd_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                        scd_ingredient = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                        scd_dose_form = get_dose_forms(remapped_scd_cui_data)
-                        scd_source = remapped_scd_cui_data["rxcuiStatusHistory"]['metaData']['source']
-                        scd_strength_numerator = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                        scd_strength_numeratorUnit = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                        scd_strength_denominator = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                        scd_strength_denominatorUnit = remapped_scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                    if remapped_scd_concept.is_multiple_ingredient == "NO":
+                        scd_ingredient = remapped_scd_concept.ingredient
+                        scd_dose_form = remapped_scd_concept.dose_forms
+                        scd_source = remapped_scd_concept.source
                         rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
                         rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-                        rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+                        rxnorm_info["C RxNorm Strength Details"] = remapped_scd_concept.strength
                     #If the scd cui has more than one ingredient
                     else:
                         #Get info from scd rx cui
-                        scd_ingredients = get_multiple_ingredients(remapped_scd_cui_data)
-                        scd_dose_form = get_dose_forms(remapped_scd_cui_data)
-                        SCD_Strength_Details = get_multiple_strengths(remapped_scd_cui_data)
+                        scd_ingredients = remapped_scd_concept.ingredients
+                        scd_dose_form = remapped_scd_concept.dose_forms
+                        SCD_Strength_Details = remapped_scd_concept.strengths
                         rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
                         rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
                         rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
             elif remapped_tty == "SCD":
-                scd_status = remapped_rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+                scd_status = remapped_concept.status
                 if scd_status != "Obsolete":
                     #If the remapped_tty is an SCD with 1 ingredient
-                    if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                        ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                        dose_form = get_dose_forms(remapped_rxcui_data)
-                        strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                        strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                        strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                        strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                    if remapped_concept.is_multiple_ingredient == "NO":
+                        ingredient = remapped_concept.ingredient
+                        dose_form = remapped_concept.dose_forms
                         rxnorm_info["RxNorm Ingredient"] = ingredient
                         rxnorm_info["RxNorm Dose Form"] = dose_form
-                        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                        rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
                     #If the remappped_tty is an SCD has more than 1 ingredient
-                    elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+                    elif remapped_concept.is_multiple_ingredient == "YES":
                         #Get all the original rxcui info
-                        ingredients = get_multiple_ingredients(rxcui_data)
-                        dose_form = get_dose_forms(rxcui_data)
-                        Strength_Details = get_multiple_strengths(rxcui_data)
+                        ingredients = concept.ingredients
+                        dose_form = concept.dose_forms
+                        Strength_Details = concept.strengths
                         rxnorm_info["RxNorm Ingredient"] = ingredients
                         rxnorm_info["RxNorm Dose Form"] = dose_form
                         rxnorm_info["RxNorm Strength Details"] = Strength_Details
                 elif scd_status == "Obsolete":
                     #If the remapped_tty is an SCD with 1 ingredient
-                    if remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-                        ingredient = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-                        dose_form = get_dose_forms(remapped_rxcui_data)
-                        strength_numerator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-                        strength_numeratorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-                        strength_denominator = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-                        strength_denominatorUnit = remapped_rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+                    if remapped_concept.is_multiple_ingredient == "NO":
+                        ingredient = remapped_concept.ingredient
+                        dose_form = remapped_concept.dose_forms
                         rxnorm_info["RxNorm Ingredient"] = ingredient
                         rxnorm_info["RxNorm Dose Form"] = dose_form
-                        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+                        rxnorm_info["RxNorm Strength Details"] = remapped_concept.strength
                     #If the remappped_tty is an SCD has more than 1 ingredient
-                    elif remapped_rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "YES":
+                    elif remapped_concept.is_multiple_ingredient == "YES":
                         #Get all the original rxcui info
-                        ingredients = get_multiple_ingredients(remapped_rxcui_data)
-                        dose_form = get_dose_forms(remapped_rxcui_data)
-                        Strength_Details = get_multiple_strengths(remapped_rxcui_data)
+                        ingredients = remapped_concept.ingredients
+                        dose_form = remapped_concept.dose_forms
+                        Strength_Details = remapped_concept.strengths
                         rxnorm_info["RxNorm Ingredient"] = ingredients
                         rxnorm_info["RxNorm Dose Form"] = dose_form
                         rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -685,68 +531,59 @@ def gpck_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
     #If the TTY is GPCK and has 1 ingredient
-    if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-        ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-        dose_form = get_dose_forms(rxcui_data)
+    if concept.is_multiple_ingredient == "NO":
+        ingredient = concept.ingredient
+        dose_form = concept.dose_forms
         #print(f"Dose Form: {dose_form}")
         # status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
-        source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-        strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-        strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-        strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-        strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        source = concept.source
         rxnorm_info["RxNorm Ingredient"] = ingredient
         rxnorm_info["RxNorm Dose Form"] = dose_form
-        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+        rxnorm_info["RxNorm Strength Details"] = concept.strength
     else:
         #If the TTY is GPCK and has multiple ingredients
-        ingredients = get_multiple_ingredients(rxcui_data)
-        dose_form = get_dose_forms(rxcui_data)
-        Strength_Details = get_multiple_strengths(rxcui_data)
+        ingredients = concept.ingredients
+        dose_form = concept.dose_forms
+        Strength_Details = concept.strengths
         rxnorm_info["RxNorm Ingredient"] = ingredients
         rxnorm_info["RxNorm Dose Form"] = dose_form
         rxnorm_info["RxNorm Strength Details"] = Strength_Details
     #No matter the number of ingredients, get the pack_cui which is an SCD and get the scd info for this drug product
-    pack_cui = rxcui_data['rxcuiStatusHistory']['pack']['packConcept'][0]["packRxcui"]
+    pack_cui = concept.pack_rxcui
     #Now find the RXNorm info from the SCD RxCui
-    url_scd_cui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{pack_cui}/historystatus.json'
-    response2 = requests.get(url_scd_cui, timeout=(connect_timeout, read_timeout))
-    pack_cui_data = response2.json()
+    pack_concept = get_concept(pack_cui)
     #If the SCD CUI isn't remapped:
-    if pack_cui_data['rxcuiStatusHistory']['metaData']['status'] != "Remapped":
+    if pack_concept.status != "Remapped":
         #Get the tty of this data. We expect it to be an SCD
-        scd_tty = pack_cui_data["rxcuiStatusHistory"]["attributes"]["tty"]
+        scd_tty = pack_concept.tty
         #Get the name of the drug from this info
-        scd_name = pack_cui_data["rxcuiStatusHistory"]["attributes"]["name"]
+        scd_name = pack_concept.name
         #Get info from scd rx cui
         rxnorm_info["C RxNorm Name"] = scd_name
         rxnorm_info["C RxNorm TTY"] = scd_tty
         rxnorm_info["C RxNorm RxCUI"] = pack_cui
         #The scd cui only has one ingredient
-        if pack_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            scd_ingredient = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            scd_dose_form = get_dose_forms(pack_cui_data)
-            scd_status = pack_cui_data["rxcuiStatusHistory"]['metaData']['status']
-            scd_source = pack_cui_data["rxcuiStatusHistory"]['metaData']['source']
-            scd_strength_numerator = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            scd_strength_numeratorUnit = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            scd_strength_denominator = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            scd_strength_denominatorUnit = pack_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        if pack_concept.is_multiple_ingredient == "NO":
+            scd_ingredient = pack_concept.ingredient
+            scd_dose_form = pack_concept.dose_forms
+            scd_status = pack_concept.status
+            scd_source = pack_concept.source
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-            rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+            rxnorm_info["C RxNorm Strength Details"] = pack_concept.strength
         #If the scd cui has more than one ingredient
         else:
             #Get info from scd rx cui
-            scd_ingredients = get_multiple_ingredients(pack_cui_data)
-            scd_dose_form = get_dose_forms(pack_cui_data)
-            SCD_Strength_Details = get_multiple_strengths(pack_cui_data)
+            scd_ingredients = pack_concept.ingredients
+            scd_dose_form = pack_concept.dose_forms
+            SCD_Strength_Details = pack_concept.strengths
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
             rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
@@ -761,68 +598,59 @@ def bpck_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
     #If the BPCK has 1 Ingredient find the info
-    if rxcui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-        ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-        dose_form = get_dose_forms(rxcui_data)
+    if concept.is_multiple_ingredient == "NO":
+        ingredient = concept.ingredient
+        dose_form = concept.dose_forms
         # print(f"Dose Form: {dose_form}")
         # status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
-        source = rxcui_data["rxcuiStatusHistory"]['metaData']['source']
-        strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-        strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-        strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-        strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        source = concept.source
         rxnorm_info["RxNorm Ingredient"] = ingredient
         rxnorm_info["RxNorm Dose Form"] = dose_form
-        rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+        rxnorm_info["RxNorm Strength Details"] = concept.strength
     #If the BPCK has more than one ingredient, find the info
     else:
-        ingredients = get_multiple_ingredients(rxcui_data)
-        dose_form = get_dose_forms(rxcui_data)
-        Strength_Details = get_multiple_strengths(rxcui_data)
+        ingredients = concept.ingredients
+        dose_form = concept.dose_forms
+        Strength_Details = concept.strengths
         rxnorm_info["RxNorm Ingredient"] = ingredients
         rxnorm_info["RxNorm Dose Form"] = dose_form
         rxnorm_info["RxNorm Strength Details"] = Strength_Details
     #Find the SCD Info for this medication
-    pack_cui = rxcui_data['rxcuiStatusHistory']['pack']['packConcept'][0]["packRxcui"]
+    pack_cui = concept.pack_rxcui
     #Now find the RXNorm info from the SCD RxCui
-    url_scd_cui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{pack_cui}/historystatus.json'
-    response2 = requests.get(url_scd_cui, timeout=(connect_timeout, read_timeout))
-    scd_cui_data = response2.json()
+    scd_concept = get_concept(pack_cui)
     #If the SCD CUI isn't remapped:
-    if scd_cui_data['rxcuiStatusHistory']['metaData']['status'] != "Remapped":
+    if scd_concept.status != "Remapped":
         #Get the tty of this data. We expect it to be an SCD
-        scd_tty = scd_cui_data["rxcuiStatusHistory"]["attributes"]["tty"]
+        scd_tty = scd_concept.tty
         #Get the name of the drug from this info
-        scd_name = scd_cui_data["rxcuiStatusHistory"]["attributes"]["name"]
+        scd_name = scd_concept.name
         #Get info from scd rx cui
         rxnorm_info["C RxNorm Name"] = scd_name
         rxnorm_info["C RxNorm TTY"] = scd_tty
         rxnorm_info["C RxNorm RxCUI"] = pack_cui
         #The scd cui only has one ingredient
-        if scd_cui_data["rxcuiStatusHistory"]["attributes"]["isMultipleIngredient"] == "NO":
-            scd_ingredient = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]["activeIngredientName"]
-            scd_dose_form = get_dose_forms(scd_cui_data)
-            scd_status = scd_cui_data["rxcuiStatusHistory"]['metaData']['status']
-            scd_source = scd_cui_data["rxcuiStatusHistory"]['metaData']['source']
-            scd_strength_numerator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-            scd_strength_numeratorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-            scd_strength_denominator = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-            scd_strength_denominatorUnit = scd_cui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+        if scd_concept.is_multiple_ingredient == "NO":
+            scd_ingredient = scd_concept.ingredient
+            scd_dose_form = scd_concept.dose_forms
+            scd_status = scd_concept.status
+            scd_source = scd_concept.source
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredient
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
-            rxnorm_info["C RxNorm Strength Details"] = f"{scd_strength_numerator} {scd_strength_numeratorUnit}/{scd_strength_denominator} {scd_strength_denominatorUnit}"
+            rxnorm_info["C RxNorm Strength Details"] = scd_concept.strength
         #If the scd cui has more than one ingredient
         else:
             #Get info from scd rx cui
-            scd_ingredients = get_multiple_ingredients(scd_cui_data)
-            scd_dose_form = get_dose_forms(scd_cui_data)
-            SCD_Strength_Details = get_multiple_strengths(scd_cui_data)
+            scd_ingredients = scd_concept.ingredients
+            scd_dose_form = scd_concept.dose_forms
+            SCD_Strength_Details = scd_concept.strengths
             rxnorm_info["C RxNorm Ingredient"] = scd_ingredients
             rxnorm_info["C RxNorm Dose Form"] = scd_dose_form
             rxnorm_info["C RxNorm Strength Details"] = SCD_Strength_Details
@@ -837,12 +665,13 @@ def in_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredient = rxcui_data["rxcuiStatusHistory"]["attributes"]["name"]
+    ingredient = concept.name
     dose_form = " "
     strength = " "
     rxnorm_info["RxNorm Ingredient"] = ingredient
@@ -865,14 +694,15 @@ def min_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredients = get_multiple_ingredients(rxcui_data)
-    dose_form = get_dose_forms(rxcui_data)
-    Strength_Details = get_multiple_strengths(rxcui_data)
+    ingredients = concept.ingredients
+    dose_form = concept.dose_forms
+    Strength_Details = concept.strengths
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
     rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -893,14 +723,15 @@ def scdg_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredients = get_multiple_ingredients(rxcui_data)
-    dose_form = get_dose_forms(rxcui_data)
-    Strength_Details = get_multiple_strengths(rxcui_data)
+    ingredients = concept.ingredients
+    dose_form = concept.dose_forms
+    Strength_Details = concept.strengths
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
     rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -921,19 +752,16 @@ def scdc_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']["ingredientAndStrength"][0]["baseName"]
-    strength_numerator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorValue']
-    strength_numeratorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['numeratorUnit']
-    strength_denominator = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorValue']
-    strength_denominatorUnit = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][0]['denominatorUnit']
+    ingredient = concept.base_name
     rxnorm_info["RxNorm Ingredient"] = ingredient
     rxnorm_info["RxNorm Dose Form"] = ""
-    rxnorm_info["RxNorm Strength Details"] = f"{strength_numerator} {strength_numeratorUnit}/{strength_denominator} {strength_denominatorUnit}"
+    rxnorm_info["RxNorm Strength Details"] = concept.strength
     rxnorm_info['C RxNorm Name'] = ""
     rxnorm_info['C RxNorm TTY'] = ""
     rxnorm_info["C RxNorm RxCUI"] = ""
@@ -951,15 +779,16 @@ def sbdc_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredient = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']["ingredientAndStrength"][0]["baseName"]
-    ingredients = get_multiple_ingredients(rxcui_data)
-    dose_form = get_dose_forms(rxcui_data)
-    Strength_Details = get_multiple_strengths(rxcui_data)
+    ingredient = concept.base_name
+    ingredients = concept.ingredients
+    dose_form = concept.dose_forms
+    Strength_Details = concept.strengths
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
     rxnorm_info["RxNorm Strength Details"] = Strength_Details
@@ -980,13 +809,14 @@ def scdf_info(rxcui_data):
     Output: Dictionary {rx_info} with the keys RxNorm Ingredient, RxNorm Dose Form, RxNorm Strength Details
     and the values coming from the api call with information about the given rxcui
     """
+    concept = as_concept(rxcui_data)
     rxnorm_info = {}
-    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    name = concept.name
     rxnorm_info['RxNorm Name'] = name
-    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    tty = concept.tty
     rxnorm_info['RxNorm TTY'] = tty
-    ingredients = rxcui_data["rxcuiStatusHistory"]['derivedConcepts']["ingredientConcept"][0]['ingredientName']
-    dose_form = get_dose_forms(rxcui_data)
+    ingredients = concept.ingredient_name
+    dose_form = concept.dose_forms
     Strength_Details = ""
     rxnorm_info["RxNorm Ingredient"] = ingredients
     rxnorm_info["RxNorm Dose Form"] = dose_form
@@ -1008,64 +838,55 @@ def get_name_tty(rxcui):
     RxNorm Dose Form, Remapped RxNorm Strength Details. The values come from the RxCui given as the input.
     """
     rx_norm_info = {}
-    max_try = 5
-    try_number = 1
-    while try_number <= max_try:
-        url_rxcui = f'https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/historystatus.json'
-        response = requests.get(url_rxcui, timeout=(connect_timeout, read_timeout))
-        try:
-            if response.status_code == 200:
-                rxcui_data = response.json()
-                name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
-                rx_norm_info['RxNorm Name'] = name
-                tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
-                rx_norm_info['RxNorm TTY'] = tty
-                if tty == "SCD":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = scd_info(rxcui_data)
-                elif tty == "SBD":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = sbd_info(rxcui_data)
-                elif tty == "GPCK":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = gpck_info(rxcui_data)
-                elif tty == "BPCK":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = bpck_info(rxcui_data)
-                elif tty == "IN" or tty == "PIN":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = in_info(rxcui_data)
-                elif tty == "MIN":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = min_info(rxcui_data)
-                elif tty == "SCDG" or tty == "SBDG":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = scdg_info(rxcui_data)
-                elif tty == "SCDC":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = scdc_info(rxcui_data)
-                elif tty == "SBDC":
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info = sbdc_info(rxcui_data)
-                elif tty == "SCDF":
-                    rx_norm_info = scdf_info(rxcui_data)
-                elif tty ==  "OCD" or tty == '':
-                    #Do This to get Ingredient, Dose Form and Strength Details
-                    rx_norm_info["RxNorm Ingredient"] = ""
-                    rx_norm_info["RxNorm Dose Form"] = ""
-                    rx_norm_info["RxNorm Strength Details"] = ""
-                    rx_norm_info['C RxNorm Name'] = ""
-                    rx_norm_info['C RxNorm TTY'] = ""
-                    rx_norm_info["C RxNorm RxCUI"] = ""
-                    rx_norm_info['C RxNorm Ingredient'] = ""
-                    rx_norm_info['C RxNorm Dose Form'] = ""
-                    rx_norm_info['C RxNorm Strength Details'] = ""
-        # print(rx_norm_info)
-            return rx_norm_info
-        except:
-            print(f'API failed on {url_rxcui}, Trying Again, attempt number {try_number} of 5')
-            sleep(4)
-            try_numner +=1
+    #get_concept retries RxNav with backoff, anything that still fails is raised to the caller
+    concept = get_concept(rxcui)
+    if concept is not None:
+        name = concept.name
+        rx_norm_info['RxNorm Name'] = name
+        tty = concept.tty
+        rx_norm_info['RxNorm TTY'] = tty
+        if tty == "SCD":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = scd_info(concept)
+        elif tty == "SBD":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = sbd_info(concept)
+        elif tty == "GPCK":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = gpck_info(concept)
+        elif tty == "BPCK":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = bpck_info(concept)
+        elif tty == "IN" or tty == "PIN":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = in_info(concept)
+        elif tty == "MIN":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = min_info(concept)
+        elif tty == "SCDG" or tty == "SBDG":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = scdg_info(concept)
+        elif tty == "SCDC":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = scdc_info(concept)
+        elif tty == "SBDC":
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info = sbdc_info(concept)
+        elif tty == "SCDF":
+            rx_norm_info = scdf_info(concept)
+        elif tty ==  "OCD" or tty == '':
+            #Do This to get Ingredient, Dose Form and Strength Details
+            rx_norm_info["RxNorm Ingredient"] = ""
+            rx_norm_info["RxNorm Dose Form"] = ""
+            rx_norm_info["RxNorm Strength Details"] = ""
+            rx_norm_info['C RxNorm Name'] = ""
+            rx_norm_info['C RxNorm TTY'] = ""
+            rx_norm_info["C RxNorm RxCUI"] = ""
+            rx_norm_info['C RxNorm Ingredient'] = ""
+            rx_norm_info['C RxNorm Dose Form'] = ""
+            rx_norm_info['C RxNorm Strength Details'] = ""
+    # print(rx_norm_info)
+    return rx_norm_info
 
 def clean_string(input_string):
     try:
@@ -1077,21 +898,57 @@ def clean_string(input_string):
             cleaned_string = lstring.replace("'", '')
             return cleaned_string
 
+def get_ndc_store():
+    """
+    Output: ndc_store, the NDCRxCUIStore shared by every pipeline (LocalRxStore.shared_ndc_store), opened the first time
+    an NDC is looked up. Set ndc_store before that to use a different store.
+    """
+    global ndc_store
+    if ndc_store is None:
+        ndc_store = shared_ndc_store()
+    return ndc_store
+
 def fetch_data_from_api(key, count):
     """
     Pass in the NDC as the key (and 11 digit integer) and the count of which row of data this came from
-    Spit back out the RxCUI, a multi digit integer
+    Spit back out the RxCUI, a multi digit integer (or no_rxcui_value if RxNav has no RxCUI for the NDC)
+    Callers asking for the same NDC at the same time share one lookup_ndc_rxcui call.
+    """
+    #Every NDC is cached under its canonical 11 digit form, so the same product is only looked up once however it was written
+    key = canonical_ndc(key)
+    if key == '':
+        return no_rxcui_value
+    return ndc_flight.do(key, lambda: lookup_ndc_rxcui(key, count))
+
+def lookup_ndc_rxcui(key, count):
+    """
+    Looks the NDC up in ndc_cache, then ndc_store, then RxNav, for fetch_data_from_api
     """
     # Check if the data is in the cache
-    cached_data = lfu_cache.get(key)
+    cached_data = ndc_cache.get(key)
+    if cached_data is NO_RXCUI:
+        return no_rxcui_value
     if cached_data is not None:
         return cached_data
 
+    # Then check the NDCs saved by earlier runs that have not expired yet
+    saved_rxcui = get_ndc_store().get(key)
+    if saved_rxcui is NO_RXCUI:
+        ndc_cache.put(key, NO_RXCUI)
+        return no_rxcui_value
+    if saved_rxcui is not None:
+        ndc_cache.put(key, int(saved_rxcui))
+        return int(saved_rxcui)
+
     # If not in the cache, make the API request
     api_data = get_rxnorm_rxcui(key, count)
 
-    # Store the API response in the cache
-    lfu_cache.put(key, api_data)
+    # Store the API response in the cache, and save it for later runs
+    ndc_cache.put(key, api_data)
+    if api_data is not None:
+        get_ndc_store().put(key, api_data)
+    if api_data is NO_RXCUI:
+        return no_rxcui_value
 
     return api_data
 
@@ -1100,9 +957,16 @@ def fetch_rxnorm_data_from_api(key):
     Input: Pass in the RxCUI (an integer) as the key,
     Output: Dictionary with the keys Remapped RxNorm Name, Remapped RxNorm TTY, Remapped RxNorm Ingredient, Remapped
     RxNorm Dose Form, Remapped RxNorm Strength Details. The values come from the RxCui given as the input.
+    Callers asking for the same RxCUI at the same time share one lookup_rxnorm_details call.
+    """
+    return rxnorm_flight.do(key, lambda: lookup_rxnorm_details(key))
+
+def lookup_rxnorm_details(key):
+    """
+    Looks the RxCUI up in rxnorm_cache, then RxNav, for fetch_rxnorm_data_from_api
     """
     # Check if the data is in the cache
-    rx_cached_data = lfu_cache.get(key)
+    rx_cached_data = rxnorm_cache.get(key)
     if rx_cached_data is not None:
         return rx_cached_data
 
@@ -1110,73 +974,17 @@ def fetch_rxnorm_data_from_api(key):
     api_rx_data = get_name_tty(key)
 
     # Store the API response in the cache
-    lfu_cache.put(key, api_rx_data)
+    rxnorm_cache.put(key, api_rx_data)
 
     return api_rx_data
 
-# Function to check if entries exist in the truth table
+# Function to check if entries exist in the truth table (an EquivalenceClasses, so this is a dictionary lookup)
 def entries_are_true(entry1, entry2, truth_table):
-    for row in truth_table:
-        for key, value in row.items():
-            if (entry1 == key and entry2 == value) or (entry1 == value and entry2 == key):
-                return True
-    return False
+    return truth_table.equivalent(entry1, entry2)
 
 def check_entries_in_special_case_truth_table(entry1, entry2, special_case_truth_table):
-    for row in special_case_truth_table:
-        for key, value in row.items():
-            if entry1 == key and entry2 == value:
-                return True
-    return False
-
-def compare_medication_strengths(f, t):
-    # Define regular expression pattern to extract numbers, units, and '/'
-    pattern = r'(\d+(\.\d+)?)\s*(\w+)\s*/\s*(\d+(\.\d+)?)\s*(\w+)'
-
-    # Use regular expression to find matches in both strings
-    f_matches = re.findall(pattern, f)
-    t_matches = re.findall(pattern, t)
-
-    if not f_matches or not t_matches:
-        print("Invalid medication strength format.")
-        return False
-
-    # Check if the number of strength/unit pairs is the same
-    if len(f_matches) != len(t_matches):
-        print("Number of medication strengths are different.")
-        return False
-
-    # Iterate over each strength/unit pair and compare them
-    for f_match, t_match in zip(f_matches, t_matches):
-        # Extract numbers and units and convert them to floats
-        f_num1 = float(f_match[0])
-        f_unit1 = f_match[2]
-        f_num2 = float(f_match[3])
-        f_unit2 = f_match[5]
-
-        t_num1 = float(t_match[0])
-        t_unit1 = t_match[2]
-        t_num2 = float(t_match[3])
-        t_unit2 = t_match[5]
-
-        # Check if units are the same
-        if f_unit1 != t_unit1 or f_unit2 != t_unit2:
-            print("Units are different.")
-            return False
-
-        # Calculate ratios
-        ratio_f = f_num1 / f_num2
-        ratio_t = t_num1 / t_num2
-
-        # Check if ratios are equal, half, or double
-        if ratio_f != ratio_t and ratio_f * 2 != ratio_t and ratio_f * 0.5 != ratio_t:
-            print("Medication strengths are different.")
-            return False
-
-    # If all comparisons pass, return True
-    print("Medications have equal strength.")
-    return True
-##########################################################################################################################################################################
+    return special_case_truth_table.contains(entry1, entry2)
+
 def main():
 
     ##This first step is done the first time only!
@@ -1244,23 +1052,13 @@ def main():
         dropbox_file_path = '/AHRQ_R18_Project_SAVERx/Processed/SaveRxCUIDetails.csv'
         #Look to see if the file exists already
         try:
-            # Get metadata for the file
-            metadata = dbx.files_get_metadata(dropbox_file_path)
-
-            # File exists, so download it
-            _, f = dbx.files_download(dropbox_file_path)
-
-            #Use DictReader to bring the information into a list of dictionaries called rxcui_data
-            rxcui_data = []
-            csv_reader = csv.DictReader(f.content.decode().splitlines(), delimiter=',')
-            for row in csv_reader:
-                rxcui_data.append(row)
-            print("Saved RxCUIData is Ready")
-            rxcui_data = [{key.lstrip('\ufeff'): value for key, value in row.items()} for row in rxcui_data]
-
-            print(rxcui_data)
-        #if the file doesn't exist, create it
-        except:
+            #Download it together with the journal files other runs added since the last compaction
+            rxcui_data = read_saved_rxcui_details(dbx, processed_path)
+            print(f"Saved RxCUIData is Ready, {len(rxcui_data)} RxCUIs")
+        #if the file doesn't exist, create it. Any other Dropbox error is raised, the starter file would hide the saved details
+        except dropbox.exceptions.ApiError as e:
+            if not is_not_found(e):
+                raise
             print(f"The file {dropbox_file_path} does not exist.")
             #write csv This should only have the first time this program is run.
             new_file_name = "SaveRxCUIDetails.csv"
@@ -1275,7 +1073,17 @@ def main():
             # Write the CSV data to the buffer
             csv_writer.writeheader()
             csv_writer.writerows(starter_data)
-            dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+            #"add" never replaces a SaveRxCUIDetails.csv another run may have just written
+            try:
+                dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("add"))
+                rxcui_data = starter_data
+            except dropbox.exceptions.ApiError as upload_error:
+                if not is_conflict(upload_error):
+                    raise
+                #Another run created it in the meantime, read that one instead
+                rxcui_data = read_saved_rxcui_details(dbx, processed_path)
+        #Index the saved details by RxCUI once for the whole run, new details get added to it as they are fetched
+        rxcui_index = build_rxcui_index(rxcui_data)
 
         ###This segment of code was built in case we wanted a csv file that would be active as a  "cache" for three months before being rebuilt
         # for folder in dbx.files_list_folder('/AHRQ_R18_Project_SAVERx/').entries:
@@ -1445,26 +1253,8 @@ def main():
 
                                         # Extend the all_data_dicts list with current page's dictionaries
                                         all_data_dicts.extend(current_page_dict_list)
-                                    for entry in all_data_dicts:
-                                        escript_ndc = entry.get('escript ndc')
-                                        dscript_ndc = entry.get('dispensed ndc')
-                                        # Check if the value is a number and not NaN
-                                        if isinstance(escript_ndc, float) and not math.isnan(escript_ndc):
-                                            # Convert to integer
-                                            print(type(escript_ndc))
-                                            entry['escript ndc'] = int(escript_ndc)
-                                            print(type(entry['escript ndc']))
-                                        else:
-                                            # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                            entry['escript ndc'] = None  # or some other default value, or don't modify the entry at all
-                                        if isinstance(dscript_ndc, float) and not math.isnan(dscript_ndc):
-                                            # Convert to integer
-                                            entry['dispensed ndc'] = int(dscript_ndc)
-                                        elif isinstance(dscript_ndc, int) and not math.isnan(dscript_ndc):
-                                            entry['dispensed ndc'] = dscript_ndc
-                                        else:
-                                            # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                            entry['dispensed ndc'] = None  # or some other default value, or don't modify the entry at all
+                                    # Put the NDCs tabula read (floats, ints or text) in their canonical 11 digit form, blank ones become ''
+                                    canonicalize_ndc_columns(all_data_dicts, ['escript ndc', 'dispensed ndc'])
                                     pp.pprint(all_data_dicts[0:3])
 
 
@@ -1503,46 +1293,14 @@ def main():
                                         all_data_dicts.extend(current_page_dict_list)
 
                                         pp.pprint(all_data_dicts)
-                                        for entry in all_data_dicts:
-                                            escript_ndc = entry.get('escript ndc')
-                                            dscript_ndc = entry.get('dispensed ndc')
-                                            # Check if the value is a number and not NaN
-                                            if isinstance(escript_ndc, float) and not math.isnan(escript_ndc):
-                                                # Convert to integer
-                                                entry['escript ndc'] = int(escript_ndc)
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['escript ndc'] = None  # or some other default value, or don't modify the entry at all
-                                            if isinstance(dscript_ndc, float) and not math.isnan(dscript_ndc):
-                                                # Convert to integer
-                                                entry['dispensed ndc'] = int(dscript_ndc)
-                                            elif isinstance(dscript_ndc, int) and not math.isnan(dscript_ndc):
-                                                entry['dispensed ndc'] = dscript_ndc
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['dispensed ndc'] = None  # or some other default value, or don't modify the entry at all
+                                        # Put the NDCs tabula read (floats, ints or text) in their canonical 11 digit form, blank ones become ''
+                                        canonicalize_ndc_columns(all_data_dicts, ['escript ndc', 'dispensed ndc'])
                                         # pp.pprint(all_data_dicts[100:200])
                                             # Raise an error or handle the case where the DataFrame has more columns than expected
                                     except:
                                         ValueError(f"DataFrame has more columns than expected. Page: {page}")
-                                        for entry in all_data_dicts:
-                                            escript_ndc = entry.get('escript ndc')
-                                            dscript_ndc = entry.get('dispensed ndc')
-                                            # Check if the value is a number and not NaN
-                                            if isinstance(escript_ndc, float) and not math.isnan(escript_ndc):
-                                                # Convert to integer
-                                                entry['escript ndc'] = int(escript_ndc)
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['escript ndc'] = None  # or some other default value, or don't modify the entry at all
-                                            if isinstance(dscript_ndc, float) and not math.isnan(dscript_ndc):
-                                                # Convert to integer
-                                                entry['dispensed ndc'] = int(dscript_ndc)
-                                            elif isinstance(dscript_ndc, int) and not math.isnan(dscript_ndc):
-                                                entry['dispensed ndc'] = dscript_ndc
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['dispensed ndc'] = None  # or some other default value, or don't modify the entry at all
+                                        # Put the NDCs tabula read (floats, ints or text) in their canonical 11 digit form, blank ones become ''
+                                        canonicalize_ndc_columns(all_data_dicts, ['escript ndc', 'dispensed ndc'])
 
                                 fieldnames = ['escript prescribed item', 'escript ndc', 'prescribed item', 'prescribed ndc', 'dispensed item', 'dispensed ndc', 'rxnumber', 'prescribed qty', 'quantity_unit', "recommended days' supply", 'prescribed refills', 'dispensed qty', "dispensed days' supply", 'page_number']
                                 pp.pprint(all_data_dicts[-10:])
@@ -1672,25 +1430,31 @@ def main():
                                 start_time2 = time.time()
                                 e_matching_info = []
                                 d_matching_info = []
+                                #Download the RxCUIs that are not saved yet, and the concepts they link to, in waves before going row by row
+                                new_rxcuis = [rxcui for item in addition for rxcui in (item.get('E_rxcui'), item.get('D_rxcui')) if rxcui not in ('', None) and str(rxcui) not in rxcui_index]
+                                concepts = CachingProcessSaveRx.resolve_linked_concepts(new_rxcuis, get_concept)
+                                #RxCUIs whose concepts could not be downloaded are reported as errors without asking RxNav again
+                                failed_rxcuis = CachingProcessSaveRx.concept_failures(new_rxcuis, concepts)
                                 for item in addition:
                                     if item.get('E_rxcui') != '' and item.get('E_rxcui') != None:
                                         #get the rxcui from the eprescription and use that to get drug info from rxnorm
                                         eRxCUI = item.get('E_rxcui')
                                         try:
                                             # Check if eRxCUI is in 'RxCUI' values in rxcui_data
-                                            matching_items = [data for data in rxcui_data if data.get('RxCUI') == eRxCUI]
-                                            # If there are matching items, add them to the result
-                                            if matching_items:
-                                                #print(matching_items)
-                                                e_info = matching_items[0]
+                                            matching_item = rxcui_index.get(str(eRxCUI))
+                                            # If there is a matching item, use it
+                                            if matching_item is not None:
+                                                e_info = matching_item
                                                 print(e_info)
 
                                             else:
                                                 # If information is not found, call the fetch_rxnorm_data_from_api function
+                                                if str(eRxCUI) in failed_rxcuis:
+                                                    raise failed_rxcuis[str(eRxCUI)]
                                                 e_info = fetch_rxnorm_data_from_api(eRxCUI)
                                                 print(e_info)
-                                                #Append the New info to new_rxcui_data for updating the CSV file.
-                                                new_rxcui_data.append({
+                                                #Append the New info to new_rxcui_data for updating the CSV file, and to the index so it is only fetched once
+                                                new_row = {
                                                     'RxCUI': eRxCUI,
                                                     'RxNorm Name': e_info["RxNorm Name"],
                                                     'RxNorm TTY': e_info["RxNorm TTY"],
@@ -1703,7 +1467,9 @@ def main():
                                                     'C RxNorm Ingredient': e_info['C RxNorm Ingredient'],
                                                     'C RxNorm Dose Form': e_info['C RxNorm Dose Form'],
                                                     'C RxNorm Strength Details': e_info['C RxNorm Strength Details']
-                                                })
+                                                }
+                                                new_rxcui_data.append(new_row)
+                                                rxcui_index[str(eRxCUI)] = new_row
 
                                         except:
                                             second_error_message = f"An error occured for RxCUI {item['E_rxcui']} at {item['rowID']}"
@@ -1730,36 +1496,34 @@ def main():
                                         #get the rxcui from the eprescription and use that to get drug info from rxnorm
                                         dRxCUI = item.get('D_rxcui')
                                         try:
-                                            # Check if dRxCUI is in 'RxCUI' values in rxcui_data
-                                            matching_items = [data for data in rxcui_data if data.get('RxCUI') == dRxCUI]
-                                            # If there are matching items, add them to the result
-                                            if matching_items:
-                                                #print(matching_items)
-                                                d_info = matching_items[0]
+                                            # Check if dRxCUI is in 'RxCUI' values in rxcui_data, this includes the ones fetched earlier in this run
+                                            matching_item = rxcui_index.get(str(dRxCUI))
+                                            # If there is a matching item, use it
+                                            if matching_item is not None:
+                                                d_info = matching_item
                                                 print(d_info)
-                                            elif not matching_items:
-                                                matching_items_new_rxcui_data = [data for data in new_rxcui_data if data.get('RxCUI') == dRxCUI]
-                                                if matching_items_new_rxcui_data:
-                                                    d_info = matching_items_new_rxcui_data[0]
-                                                else:
-                                                    # If information is not found, call the fetch_rxnorm_data_from_api function
-                                                    d_info = fetch_rxnorm_data_from_api(dRxCUI)
-                                                    #Append the New info to new_rxcui_data for updating the CSV file. if it wasn't just added with e_info above...
-                                                    # if d_info.get('RxCUI') not in [data.get('RxCUI') for data in new_rxcui_data]:
-                                                    new_rxcui_data.append({
-                                                        'RxCUI': dRxCUI,
-                                                        'RxNorm Name': d_info["RxNorm Name"],
-                                                        'RxNorm TTY': d_info["RxNorm TTY"],
-                                                        'RxNorm Ingredient': d_info["RxNorm Ingredient"],
-                                                        'RxNorm Dose Form': d_info["RxNorm Dose Form"],
-                                                        'RxNorm Strength Details': d_info["RxNorm Strength Details"],
-                                                        'C RxNorm Name': d_info['C RxNorm Name'],
-                                                        'C RxNorm TTY': d_info['C RxNorm TTY'],
-                                                        'C RxNorm RxCUI': d_info['C RxNorm RxCUI'],
-                                                        'C RxNorm Ingredient': d_info['C RxNorm Ingredient'],
-                                                        'C RxNorm Dose Form': d_info['C RxNorm Dose Form'],
-                                                        'C RxNorm Strength Details': d_info['C RxNorm Strength Details']
-                                                    })
+                                            else:
+                                                # If information is not found, call the fetch_rxnorm_data_from_api function
+                                                if str(dRxCUI) in failed_rxcuis:
+                                                    raise failed_rxcuis[str(dRxCUI)]
+                                                d_info = fetch_rxnorm_data_from_api(dRxCUI)
+                                                #Append the New info to new_rxcui_data for updating the CSV file, and to the index so it is only fetched once
+                                                new_row = {
+                                                    'RxCUI': dRxCUI,
+                                                    'RxNorm Name': d_info["RxNorm Name"],
+                                                    'RxNorm TTY': d_info["RxNorm TTY"],
+                                                    'RxNorm Ingredient': d_info["RxNorm Ingredient"],
+                                                    'RxNorm Dose Form': d_info["RxNorm Dose Form"],
+                                                    'RxNorm Strength Details': d_info["RxNorm Strength Details"],
+                                                    'C RxNorm Name': d_info['C RxNorm Name'],
+                                                    'C RxNorm TTY': d_info['C RxNorm TTY'],
+                                                    'C RxNorm RxCUI': d_info['C RxNorm RxCUI'],
+                                                    'C RxNorm Ingredient': d_info['C RxNorm Ingredient'],
+                                                    'C RxNorm Dose Form': d_info['C RxNorm Dose Form'],
+                                                    'C RxNorm Strength Details': d_info['C RxNorm Strength Details']
+                                                }
+                                                new_rxcui_data.append(new_row)
+                                                rxcui_index[str(dRxCUI)] = new_row
 
                                         except:
                                             second_error_message = f"An error occured for RxCUI {item['E_rxcui']} at {item['rowID']}"
@@ -1826,6 +1590,8 @@ def main():
                                 print("Finished Getting RxCUIs")
                                 elapsed_time2 = stop_time2 - start_time2
                                 print(f"The Time it took to get {len(addition)} rxnorm info is {elapsed_time2}")
+                                for stats in cache_stats():
+                                    print(f"Cache {stats['name']}: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, {stats['size']} of {stats['capacity']} entries")
                                 # pp.pprint(added_rxnorm)
                                 print("CSV with RxNorm Data DONE")
 
@@ -1871,16 +1637,14 @@ def main():
                                 non_compounds = [item for item in has_eNDCtoo if item not in compounds]
 
                                 ### Step 2.5 Add truth table of values for equivalent dose forms, and salt forms
-                                ing_truth_table = [
+                                ing_truth_table = EquivalenceClasses([
                                     {"hydroxyzine pamoate": "hydroxyzine hydrochloride"},
                                     {"doxycycline hyclate": "doxycycline monohydrate"},
                                     {"desvenlafaxine": "desvenlafaxine succinate"},
                                     {"bacitracin": "bacitracin zinc"}
-                                ]
+                                ])
 
-                                chewable_ing_truth_table = ["ascorbic acid", "loratadine", "melatonin", "cetrizine hydrochloride", "calcium ion, cholecalciferol"]
-
-                                df_truth_table = [
+                                df_truth_table = EquivalenceClasses([
                                     {"Auto-Injector, Injectable Product": "Cartridge, Injectable Product"},
                                     {'Auto-Injector, Injectable Product': 'Prefilled Syringe, Injectable Product'},
                                     {"Delayed Release Oral Tablet, Oral Product, Pill": "Delayed Release Oral Capsule, Oral Product, Pill"},
@@ -1907,14 +1671,14 @@ def main():
                                     {"Topical Foam, Topical Product": "Topical Gel, Topical Product"},
                                     {"Topical Lotion, Topical Product": "Topical Cream, Topical Product"},
                                     {"Topical Solution, Topical Product": "Topical Cream, Topical Product"}
-                                                ]
+                                                ])
 
-                                special_case_truth_table = [
+                                special_case_truth_table = DirectedPairs([
                                     {"Otic Solution, Otic Product": "Ophthalmic Solution, Ophthalmic Product"},
                                     {"Otic Solution, Otic Product": "Ophthalmic Suspension, Ophthalmic Product"},
                                     {"Otic Suspension, Otic Product": "Ophthalmic Solution, Ophthalmic Product"},
                                     {"Otic Suspension, Otic Product": "Ophthalmic Suspension, Ophthalmic Product"}
-                                ]
+                                ])
 
                                 schedule_2_table = ['alfentanil', 'alfentanil hydrochloride', 'alphaprodine', 'alphaprodine hydrochloride', 'amobarbital', 'amobarbital sodium',
                                                     'amphetamine', 'amphetamine aspirate', 'amphetamine aspirate monohydrate', 'amphetamine saccharate', 'amphetamine sulfate',
@@ -1931,6 +1695,8 @@ def main():
                                                     'remifentanil', 'remifentanil hydrochloride', 'secobarbital', 'secobarbital sodium', 'sufentanil', 'sufentanil citrate', 'tapentadol', 'tapentadol hydrochloride']
 
                             #Step 3 Get keys that we will to make matches with
+                                #Rows that repeat an (eRxCUI, dRxCUI) pair reuse the outcome worked out for the first one
+                                match_memo.use_rules(rules_fingerprint(ing_truth_table, df_truth_table, special_case_truth_table, schedule_2_table, match_rules))
                                 filtered_for_redcap_withSCDS = []
                                 for item in non_compounds:
                                     a = item.get('eNDC')
@@ -1959,7 +1725,14 @@ def main():
                                     incorrect_action2 = ''
                                     incorrect_action3 = ''
                                     incorrect_action4 = ''
-                                    if a == k: #If NDC's match, rxcuis match
+                                    match_key = (b, l, a == k)
+                                    found, outcome = match_memo.lookup(match_key)
+                                    if found:
+                                        if outcome is None:
+                                            non_compounds.remove(item)
+                                            continue
+                                        match_details, incorrect_action1, incorrect_action2, incorrect_action3, incorrect_action4 = outcome
+                                    elif a == k: #If NDC's match, rxcuis match
                                         incorrect_action1 = 0
                                         incorrect_action2 = 0
                                         incorrect_action3 = 0
@@ -1994,9 +1767,14 @@ def main():
                                         else:
                                             match_details = "1" #If none of the above matches, compare e to d Rx Ing, DF and Strength
                                             if d == '' or e == '' or f == '' or n == '' or o == '' or p == '':
+                                                match_memo.put(match_key, None)
                                                 non_compounds.remove(item)
                                                 continue
                                             else:
+                                                #The (prescribed, dispensed) pairs compared with the shared MatchRules
+                                                ingredient_pairs = [(d, n), (d, r), (h, n), (h, r)]
+                                                dose_form_pairs = [(e, o), (e, s), (i, o), (i, s)]
+                                                dose_form_exception = match_rules.dose_form_exception(ingredient_pairs, dose_form_pairs)  # None when no exception covers the ingredients
                                                 # Check if any of the ingredients are in schedule_2_table
                                                 ingredients = [d, h, n, r]
                                                 if any(ingredient.lower() in schedule_2_table for ingredient in ingredients):
@@ -2018,6 +1796,7 @@ def main():
                                                         match_details = 1
                                                     if incorrect_action1 == 0 and incorrect_action2 == 0 and incorrect_action3 == 0:
                                                         match_details = 2
+                                                    match_memo.put(match_key, (match_details, incorrect_action1, incorrect_action2, incorrect_action3, incorrect_action4))
                                                     filtered_for_redcap_withSCDS.append({
                                                         'record_id': item.get('uniqueID'),
                                                         'report_id': item.get('reportID'),
@@ -2047,8 +1826,7 @@ def main():
                                                     incorrect_action1 = 0 #if the ingredients match in any of the e/d esc/d, e/dscd, escd/dscd ways
                                                 elif entries_are_true(d, n, ing_truth_table) or entries_are_true(d, r, ing_truth_table) or entries_are_true(h, r, ing_truth_table) or entries_are_true(h, n, ing_truth_table):
                                                     incorrect_action1 = 0
-                                                elif (d.lower().startswith("influenza a virus") and n.lower().startswith("influenza a virus")) or (d.lower().startswith("influenza a virus") and r.lower().startswith("influenza a virus")) or\
-                                                (h.lower().startswith("influenza a virus") and n.lower().startswith("influenza a virus")) or (h.lower().startswith("influenza a virus") and r.lower().startswith("influenza a virus")):
+                                                elif match_rules.share_prefix(ingredient_pairs):
                                                     incorrect_action1 = 0
                                                 else:
                                                     incorrect_action1 = 1 #if there is no ingredient match
@@ -2059,47 +1837,9 @@ def main():
                                                     incorrect_action3 = 0 # if the does forms are equivalent via the truth table, these dose form match
                                                 elif check_entries_in_special_case_truth_table(e, o, special_case_truth_table) or check_entries_in_special_case_truth_table(i, s, special_case_truth_table) or check_entries_in_special_case_truth_table(i, o, special_case_truth_table) or check_entries_in_special_case_truth_table(e, s, special_case_truth_table):
                                                     incorrect_action3 = 0
-                                                ###Account for encenteric coated aspirin
-                                                elif (d.lower() == 'aspirin' and n.lower() == 'aspirin') or (d.lower() == 'aspirin' and r.lower() == 'aspirin') or (h.lower() == 'aspirin' and n.lower() == 'aspirin') or (h.lower() == 'aspirin' and r.lower() == 'aspirin'):
-                                                    if (e == 'Oral Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (e == 'Oral Capsule, Oral Product, Pill' and o == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (e == 'Oral Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (e == 'Oral Capsule, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (e == 'Chewable Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (e == 'Oral Tablet, Oral Product, Pill' and s == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (e == 'Oral Capsule, Oral Product, Pill' and s == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (e == 'Oral Tablet, Oral Product, Pill' and s == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (e == 'Oral Capsule, Oral Product, Pill' and s == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (e == 'Chewable Tablet, Oral Product, Pill' and s == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (i == 'Oral Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (i == 'Oral Capsule, Oral Product, Pill' and o == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (i == 'Oral Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (i == 'Oral Capsule, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (i == 'Chewable Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (i == 'Oral Tablet, Oral Product, Pill' and s == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (i == 'Oral Capsule, Oral Product, Pill' and s == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (i == 'Oral Tablet, Oral Product, Pill' and s == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                    (i == 'Oral Capsule, Oral Product, Pill' and s == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                    (i == 'Chewable Tablet, Oral Product, Pill' and s == 'Delayed Release Oral Tablet, Oral Product, Pill'):
-                                                        incorrect_action3 = 0
-                                                elif (d.lower() == "ondansetron hydrochloride" and n.lower() == "ondansetron hydrochloride") or (d.lower() == 'ondansetron hydrochloride' and r.lower() == 'ondansetron hydrochloride') or (h.lower() == 'ondansetron hydrochloride' and n.lower() == 'ondansetron hydrochloride') or (h.lower() == 'ondansetron hydrochloride' and r.lower() == 'ondansetron hydrochloride'):
-                                                    if (e == 'Oral Tablet, Oral Product, Pill' and o == 'Disintegrating Oral Tablet, Oral Product, Pill, Distintegrating Oral Product') or \
-                                                        (e == 'Oral Tablet, Oral Product, Pill' and s == 'Disintegrating Oral Tablet, Oral Product, Pill, Distintegrating Oral Product') or \
-                                                        (i == 'Oral Tablet, Oral Product, Pill' and o == 'Disintegrating Oral Tablet, Oral Product, Pill, Distintegrating Oral Product') or \
-                                                        (i == 'Oral Tablet, Oral Product, Pill' and s == 'Disintegrating Oral Tablet, Oral Product, Pill, Distintegrating Oral Product'):
-                                                        incorrect_action3 = 0
-                                                #If the ingredient is one in the chewable_ing_truth_table and the dose form goes from Chewable Tablet to Oral Tablet, dose form is equivalent.
-                                                elif d.lower() == n.lower() and d.lower() in chewable_ing_truth_table:
-                                                    if (e == "Chewable Tablet" and o == "Oral Tablet") or (o == "Chewable Tablet" and e == "Oral Tablet"):
-                                                        incorrect_action3 = 0
-                                                elif d.lower() == r.lower() and d.lower() in chewable_ing_truth_table:
-                                                    if (e == "Chewable Tablet" and s == "Oral Tablet") or (s == "Chewable Tablet" and e == "Oral Tablet"):
-                                                        incorrect_action3 = 0
-                                                elif h.lower() == n.lower() and h.lower() in chewable_ing_truth_table:
-                                                    if (i == "Chewable Tablet" and o == "Oral Tablet") or (o == "Chewable Tablet" and i == "Oral Tablet"):
-                                                        incorrect_action3 = 0
-                                                elif h.lower() == r.lower() and h.lower() in chewable_ing_truth_table:
-                                                    if (i == "Chewable Tablet" and s == "Oral Tablet") or (s == "Chewable Tablet" and i == "Oral Tablet"):
+                                                #Ingredient specific exceptions (enteric coated aspirin, ondansetron disintegrating tablets, chewables), see MatchRules.json
+                                                elif dose_form_exception is not None:
+                                                    if dose_form_exception:
                                                         incorrect_action3 = 0
                                                 else:
                                                     incorrect_action3 = 1 #if there is no dose form match
@@ -2114,7 +1854,7 @@ def main():
                                                     incorrect_action2 = 0
                                                 elif (j != "" and j is not None and t != "" and t is not None) and compare_medication_strengths(j.lower(), t.lower()) is True:
                                                     incorrect_action2 = 0
-                                                elif (d.lower() == 'melatonin' and n.lower() == 'melatonin') or (d.lower() == 'melatonin' and r.lower() == 'melatonin') or (h.lower() == 'melatonin' and n.lower() == 'melatonin') or (h.lower() == 'melatonin' and r.lower() == 'melatonin'):
+                                                elif match_rules.strength_exempt(ingredient_pairs):
                                                     incorrect_action2 = 0
                                                 else:
                                                     incorrect_action2 = 1 #if there is no strength match
@@ -2126,9 +1866,14 @@ def main():
                                     elif "b" not in c.lower(): #IF the TTY is not branded
                                         match_details = "1" #If neither eNDC = dNDC or eRxCUI = dRxCUI and its not branded, compare e to d Rx Ing, DF and Strength
                                         if d == '' or e == '' or f == '' or n == '' or o == '' or p == '':
+                                            match_memo.put(match_key, None)
                                             non_compounds.remove(item)
                                             continue
                                         else:
+                                            #The (prescribed, dispensed) pairs compared with the shared MatchRules
+                                            ingredient_pairs = [(d, n)]
+                                            dose_form_pairs = [(e, o)]
+                                            dose_form_exception = match_rules.dose_form_exception(ingredient_pairs, dose_form_pairs)  # None when no exception covers the ingredients
                                             # Check if any of the ingredients are in schedule_2_table
                                             ingredients = [d, h, n, r]
                                             if any(ingredient.lower() in schedule_2_table for ingredient in ingredients):
@@ -2150,6 +1895,7 @@ def main():
                                                     match_details = 1
                                                 if incorrect_action1 == 0 and incorrect_action2 == 0 and incorrect_action3 == 0:
                                                     match_details = 2
+                                                match_memo.put(match_key, (match_details, incorrect_action1, incorrect_action2, incorrect_action3, incorrect_action4))
                                                 filtered_for_redcap_withSCDS.append({
                                                     'record_id': item.get('uniqueID'),
                                                     'report_id': item.get('reportID'),
@@ -2178,7 +1924,7 @@ def main():
                                                 incorrect_action1 = 0 #if the ingredients match in any of the e/d esc/d, e/dscd, escd/dscd ways
                                             elif entries_are_true(d, n, ing_truth_table) or entries_are_true(d, r, ing_truth_table) or entries_are_true(h, r, ing_truth_table) or entries_are_true(h, n, ing_truth_table):
                                                 incorrect_action1 = 0
-                                            elif (d.lower().startswith("influenza a virus") and n.lower().startswith("influenza a virus")):
+                                            elif match_rules.share_prefix(ingredient_pairs):
                                                 incorrect_action1 = 0
                                             else:
                                                 incorrect_action1 = 1 #if there is no ingredient match
@@ -2189,23 +1935,9 @@ def main():
                                                 incorrect_action3 = 0 # if the does forms are equivalent via the truth table, these dose form match
                                             elif check_entries_in_special_case_truth_table(e, o, special_case_truth_table) or check_entries_in_special_case_truth_table(i, s, special_case_truth_table) or check_entries_in_special_case_truth_table(i, o, special_case_truth_table) or check_entries_in_special_case_truth_table(e, s, special_case_truth_table):
                                                 incorrect_action3 = 0
-                                            ###Account for encenteric coated aspirin
-                                            elif d.lower() == 'aspirin' and n.lower() == 'aspirin':
-                                                if (e == 'Oral Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                (e == 'Oral Capsule, Oral Product, Pill' and o == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                (e == 'Oral Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Capsule, Oral Product, Pill') or \
-                                                (e == 'Oral Capsule, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill') or \
-                                                (e == 'Chewable Tablet, Oral Product, Pill' and o == 'Delayed Release Oral Tablet, Oral Product, Pill'):
-                                                    incorrect_action3 = 0
-                                            #If the ingredient is ondansetron hydrochloride and the doseform is prescribed as oral tablet, allow dispensed ondansetron hydrochloride and the dose form of disintegrating oral tablet, these are a match on dose form.
-                                            elif d.lower() == "ondansetron hydrochloride" and n.lower() == "ondansetron hydrochloride":
-                                                if (e == 'Oral Tablet, Oral Product, Pill' and o == 'Disintegrating Oral Tablet, Oral Product, Pill, Disintegrating Oral Product'):
-                                                    incorrect_action3 = 0
-                                                # else: 
-                                                #     print (f"False, e = {e} and o ] {o}")
-                                            #If the ingredient is one in the chewable_ing_truth_table and the dose form goes from Chewable Tablet to Oral Tablet, dose form is equivalent.
-                                            elif d.lower() == n.lower() and d.lower() in chewable_ing_truth_table:
-                                                if (e == "Chewable Tablet, Oral Product, Pill, Chewable Product" and o == "Oral Tablet, Oral Product, Pill") or (o == "Chewable Tablet, Oral Product, Pill, Chewable Product" and e == "Oral Tablet, Oral Product, Pill"):
+                                            #Ingredient specific exceptions (enteric coated aspirin, ondansetron disintegrating tablets, chewables), see MatchRules.json
+                                            elif dose_form_exception is not None:
+                                                if dose_form_exception:
                                                     incorrect_action3 = 0
                                             else:
                                                 incorrect_action3 = 1 #if there is no dose form match
@@ -2217,8 +1949,8 @@ def main():
                                                     incorrect_action2 = 0
                                                 else:
                                                     incorrect_action2 = 1
-                                            elif d.lower() == 'melatonin' and n.lower() == 'melatonin':
-                                                    incorrect_action2 = 0
+                                            elif match_rules.strength_exempt(ingredient_pairs):
+                                                incorrect_action2 = 0
                                             else:
                                                 incorrect_action2 = 1 #if there is no strength match
 
@@ -2228,6 +1960,7 @@ def main():
 
 
                                     ###Step 4: Create the list of items with necessary keys to go to REDCAP
+                                    match_memo.put(match_key, (match_details, incorrect_action1, incorrect_action2, incorrect_action3, incorrect_action4))
                                     filtered_for_redcap_withSCDS.append({
                                             'record_id': item.get('uniqueID'),
                                             'report_id': item.get('reportID'),
@@ -2354,18 +2087,10 @@ def main():
                         # print(destination_path)
                         # dbx.files_move_v2(source_path, destination_path)
 
-                        #Append new_rxcui_data to the rxcui_data
-                        rxcui_data.extend(new_rxcui_data)
-                        fieldnames2 = ['RxCUI', 'RxNorm Name', 'RxNorm TTY', 'RxNorm Ingredient', 'RxNorm Dose Form', 'RxNorm Strength Details',
-                                         'C RxNorm Name', 'C RxNorm TTY', 'C RxNorm RxCUI', 'C RxNorm Ingredient', 'C RxNorm Dose Form', 'C RxNorm Strength Details']
-                        new_file_name = "SaveRxCUIDetails.csv"
-                        saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
-                        csv_buffer = StringIO()
-                        csv_writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames2)
-                        # Write the CSV data to the buffer
-                        csv_writer.writeheader()
-                        csv_writer.writerows(rxcui_data)
-                        dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+                        #Add the details fetched for this file as a journal file, SaveRxCUIDetails.csv itself is only rewritten when
+                        #UpdatedDirectoryWatcher compacts the journal
+                        if new_rxcui_data:
+                            upload_rxcui_journal(dbx, processed_path, new_rxcui_data)
     except AuthError as e:
         print("Error refreshing access token:", e)
 
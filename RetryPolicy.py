@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+
+#Retries for the calls to RxNav. A RetryPolicy retries a failed call with exponential backoff and full jitter, and gives
+#up once the attempts or the per-call deadline run out. Its CircuitBreaker counts consecutive failures across every
+#thread; once RxNav is clearly down it fails every call straight away with CircuitOpenError instead of sleeping through
+#the retries, then lets a single call through after reset_timeout to see if RxNav is back.
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling RxNav while the circuit breaker is open.
+    """
+
+def _status_code(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def is_transient(error):
+    """
+    Input: Exception raised by a call
+    Output: True if the call is worth retrying and counts against the circuit breaker: connection errors, timeouts,
+    answers that could not be read, 429 and 5xx responses. Other 4xx responses will not change on a retry.
+    """
+    status_code = _status_code(error)
+    if status_code is None:
+        return True
+    return status_code == 429 or status_code >= 500
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open every call fails fast, after reset_timeout seconds
+    one trial call is let through (half open): if it works the breaker closes, if not it opens again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half open'
+            return 'open'
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call should not be made.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout or self.trial_running:
+                raise CircuitOpenError(f"RxNav looks down after {self.failures} failures in a row, not calling it for "
+                                       f"{max(self.reset_timeout - waited, 0):.0f} more seconds")
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release(self):
+        #The call ended with an error that says nothing about RxNav, so a trial call can be tried again
+        with self.lock:
+            self.trial_running = False
+
+class RetryPolicy:
+    """
+    Parameters:
+        max_attempts (int): calls made before giving up
+        base_delay (float): seconds before the first retry, doubled for every retry after it
+        max_delay (float): longest wait between two attempts
+        deadline (float): seconds one call may take in total, retries and waits included (None for no limit)
+        breaker (CircuitBreaker): shared breaker, or None to always call
+    """
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=8, deadline=60, breaker=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker
+
+    def delay(self, attempt):
+        """
+        Input: Number of the attempt that just failed (1 for the first)
+        Output: Seconds to wait, picked at random up to the backoff (full jitter) so threads that failed together
+        do not all retry together
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def remaining(self, start):
+        """
+        Input: time.monotonic() when the call started
+        Output: Seconds left before the deadline (at least a millisecond, a timeout of 0 is not allowed), None if there is
+        no deadline
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - (time.monotonic() - start), 0.001)
+
+    def call(self, function, description='RxNav', pass_remaining=False):
+        """
+        Calls function until it returns, retrying the transient errors (see is_transient).
+
+        Input: Function (takes no arguments, or with pass_remaining the seconds left before the deadline, so one slow
+        attempt can be cut off at the deadline), String (what is being called, used in the messages), Boolean
+        Output: What function returns. Raises the last error once the attempts or the deadline run out,
+        and CircuitOpenError while the circuit breaker is open.
+        """
+        start = time.monotonic()
+        attempt = 1
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = function(self.remaining(start)) if pass_remaining else function()
+            except Exception as e:
+                transient = is_transient(e)
+                if self.breaker is not None:
+                    if transient:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.release()
+                if not transient or attempt >= self.max_attempts:
+                    raise
+                wait = self.delay(attempt)
+                if self.deadline is not None and time.monotonic() - start + wait > self.deadline:
+                    raise
+                print(f"API failed on {description} ({e}), Trying Again, attempt number {attempt} of {self.max_attempts}")
+                time.sleep(wait)
+                attempt += 1
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
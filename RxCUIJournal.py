@@ -0,0 +1,126 @@
+import csv
+import datetime
+import dropbox
+from LocalRxStore import rows_to_csv, compact_journal
+
+#SaveRxCUIDetails.csv on Dropbox and its journal, shared by every script that saves RxCUI details. A script only ever
+#adds its new rows as a small timestamped journal file next to the base file, so two scripts running at the same time
+#cannot overwrite each other's rows. Readers merge the base file with the journal (compact_journal), and only the
+#compaction in UpdatedDirectoryWatcher rewrites the base file.
+
+rxcui_journal_folder = 'SaveRxCUIDetailsJournal/'  # Folder inside Processed/ that holds the journal files
+
+def download_csv_rows(dbx, dropbox_path):
+    """
+    Downloads a csv file from Dropbox and reads it into a list of dictionaries.
+    Parameters:
+        dbx: enables dropbox access
+        dropbox_path (string): The path to the file
+    Returns:
+        rows (list): List of dictionaries, one per row
+    """
+    _, f = dbx.files_download(dropbox_path)
+    csv_reader = csv.DictReader(f.content.decode().splitlines(), delimiter=',')
+    return [{key.lstrip('\ufeff'): value for key, value in row.items()} for row in csv_reader]
+
+def is_not_found(api_error):
+    """
+    Input: dropbox.exceptions.ApiError
+    Output: True if the call failed because there is nothing at the path (a path/not_found lookup error)
+    """
+    error = getattr(api_error, 'error', None)
+    try:
+        return error.is_path() and error.get_path().is_not_found()
+    except AttributeError:
+        return False
+
+def is_conflict(api_error):
+    """
+    Input: dropbox.exceptions.ApiError (from files_upload)
+    Output: True if the upload failed because a file is already at the path (WriteMode("add") never replaces it)
+    """
+    error = getattr(api_error, 'error', None)
+    try:
+        return error.is_path() and error.get_path().reason.is_conflict()
+    except AttributeError:
+        return False
+
+def list_journal_files(dbx, processed_path):
+    """
+    Lists the SaveRxCUIDetails journal files that have not been compacted yet, oldest first (the names start with a timestamp).
+    Every page of the folder listing is read, however many journal files there are.
+    Parameters:
+        dbx: enables dropbox access
+        processed_path (string): The path to the Processed folder
+    Returns:
+        journal_files (list): Dropbox paths of the journal files, empty if the folder does not exist yet
+    """
+    journal_path = f'{processed_path}{rxcui_journal_folder}'
+    try:
+        result = dbx.files_list_folder(journal_path)
+    except dropbox.exceptions.ApiError as e:
+        if is_not_found(e):
+            return []
+        raise
+    files = [entry.name for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata)]
+    while result.has_more:
+        result = dbx.files_list_folder_continue(result.cursor)
+        files.extend(entry.name for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata))
+    return [f'{journal_path}{file}' for file in sorted(files) if file.endswith('.csv')]
+
+def download_journal_files(dbx, journal_files):
+    """
+    Downloads the rows of each journal file. A file compacted and deleted by another run after it was listed is skipped.
+    Parameters:
+        dbx: enables dropbox access
+        journal_files (list): Dropbox paths of the journal files, oldest first
+    Returns:
+        journal_rows (list): The rows of each journal file that was still there, oldest first
+        missing (bool): True if any of the files was gone
+    """
+    journal_rows = []
+    missing = False
+    for journal_file in journal_files:
+        try:
+            journal_rows.append(download_csv_rows(dbx, journal_file))
+        except dropbox.exceptions.ApiError as e:
+            if not is_not_found(e):
+                raise
+            missing = True
+    return journal_rows, missing
+
+def read_saved_rxcui_details(dbx, processed_path, attempts=3):
+    """
+    Downloads SaveRxCUIDetails.csv and merges the journal files into it, the way compaction would. If a journal file
+    was compacted away while it was being read, its rows are in a newer base file, so everything is read again.
+    Parameters:
+        dbx: enables dropbox access
+        processed_path (string): The path to the Processed folder
+        attempts (int): How many times to read the base file and journal before using what was found
+    Returns:
+        rows (list): List of dictionaries, one per RxCUI. Raises dropbox.exceptions.ApiError if the base file could not be
+        downloaded (is_not_found tells when it does not exist).
+    """
+    for attempt in range(attempts):
+        base_rows = download_csv_rows(dbx, f'{processed_path}SaveRxCUIDetails.csv')
+        journal_rows, missing = download_journal_files(dbx, list_journal_files(dbx, processed_path))
+        if not missing or attempt == attempts - 1:
+            return compact_journal(base_rows, journal_rows)
+        print("The RxCUI journal was compacted while it was being read, reading it again")
+
+def upload_rxcui_journal(dbx, processed_path, rows):
+    """
+    Uploads new RxCUI details as a journal file. The name starts with the time down to the microsecond, so the files
+    sort oldest first and two uploads in the same second do not share a name.
+    Parameters:
+        dbx: enables dropbox access
+        processed_path (string): The path to the Processed folder
+        rows (list): List of dictionaries with the SaveRxCUIDetails.csv columns
+    Returns:
+        journal_path (string): The Dropbox path of the uploaded journal file
+    """
+    journal_name = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}SaveRxCUIDetails.csv"
+    journal_path = f'{processed_path}{rxcui_journal_folder}{journal_name}'
+    dbx.files_upload(rows_to_csv(rows).encode(), journal_path, mode=dropbox.files.WriteMode("add"))
+    print(f"Uploaded {len(rows)} new RxCUI details to {journal_path}")
+    return journal_path
@@ -0,0 +1,235 @@
+import timeit
+
+#Turns an RxNav historystatus.json document into one flat RxConcept record, so the TTY handlers in CachingProcessSaveRx,
+#ProcessTysonData and ProcessBremoRetailData read plain attributes instead of walking rxcui_data["rxcuiStatusHistory"][...]
+#again for every value. Run this file to compare the two with a micro-benchmark.
+
+_absent = object()  # Slot value for a field the document does not have
+_empty = {}  # Stands in for a missing section while extracting, never written to
+
+def _concept_field(slot, field):
+    member = RxConcept.__dict__[slot]
+    def read(self):
+        value = member.__get__(self)
+        if value is _absent:
+            # The nested lookup this field replaces would have failed here, so the handler fails at the same place
+            raise KeyError(f"{field} is not in the historystatus document")
+        return value
+    return property(read)
+
+class RxConcept:
+    """
+    Everything the TTY handlers use from one historystatus document:
+        rxcui, name, tty, is_multiple_ingredient, status, source, history_status
+        ingredient, base_name, strength, dose_form (from the first ingredientAndStrength / doseFormConcept)
+        ingredient_count (activeIngredientNames in ingredientAndStrength)
+        ingredients, strengths, dose_forms (the same values get_multiple_ingredients, get_multiple_strengths and get_dose_forms give)
+        ingredient_name (first derived ingredientConcept)
+        scd_rxcui, pack_rxcui, remapped_rxcui (the first linked concept of each kind) and links (all of them)
+    Reading a field the document does not have raises a KeyError.
+    """
+    fields = ('rxcui', 'name', 'tty', 'is_multiple_ingredient', 'status', 'source', 'history_status',
+              'ingredient', 'base_name', 'strength', 'dose_form', 'ingredient_count', 'ingredients', 'strengths', 'dose_forms',
+              'ingredient_name', 'scd_rxcui', 'pack_rxcui', 'remapped_rxcui', 'links')
+    __slots__ = tuple('_' + field for field in fields)
+
+    def __repr__(self):
+        return f"RxConcept(rxcui={self._rxcui!r}, tty={self._tty!r}, name={self._name!r})"
+
+for _field in RxConcept.fields:
+    setattr(RxConcept, _field, _concept_field('_' + _field, _field))
+
+def _dict(value):
+    return value if type(value) is dict else _empty
+
+def _first(value):
+    return value[0] if type(value) is list and value and type(value[0]) is dict else _empty
+
+def _format_strength(item):
+    return f"{item['numeratorValue']} {item['numeratorUnit']}/{item['denominatorValue']} {item['denominatorUnit']}"
+
+def _dose_forms(features):
+    #Same result as get_dose_forms: the dose form name followed by the dose form group names
+    if 'doseFormConcept' in features:
+        dose_form_options = [features['doseFormConcept'][0]['doseFormName']]
+        if 'doseFormGroupName' in features['doseFormConcept'][0] or 'doseFormGroupName' in features['doseFormGroupConcept'][0]:
+            try:
+                groups = features['doseFormGroupConcept']
+                group_count = 0
+                for item in groups:
+                    if 'doseFormGroupName' in item:
+                        group_count += 1
+                for item in groups[:group_count]:
+                    dose_form_options.append(item['doseFormGroupName'])
+            except:
+                pass
+        return dose_form_options
+    return features['doseFormGroupConcept'][0]['doseFormGroupName']
+
+def _ingredient_count(features):
+    ingredient_count = 0
+    for item in features['ingredientAndStrength']:
+        if 'activeIngredientName' in item:
+            ingredient_count += 1
+    return ingredient_count
+
+def _ingredients_and_strengths(features):
+    #One walk over ingredientAndStrength for the count, the ingredients and the strengths. Raises if any of them
+    #can't be read, extract_concept then works them out one by one so the others are still filled in
+    ingredient_count = _ingredient_count(features)
+    ingredients = []
+    strengths = []
+    for item in features['ingredientAndStrength'][:ingredient_count]:
+        ingredients.append(item['activeIngredientName'])
+        strengths.append(f"{item['numeratorValue']} {item['numeratorUnit']}/{item['denominatorValue']} {item['denominatorUnit']}")
+    return ingredient_count, ingredients, strengths
+
+def _ingredients(features, derived):
+    #Same result as get_multiple_ingredients
+    if 'ingredientAndStrength' in features:
+        items = features['ingredientAndStrength']
+        return [items[n]['activeIngredientName'] for n in range(_ingredient_count(features))]
+    elif 'ingredientName' in derived['ingredientConcept'][0]:
+        return derived['ingredientConcept'][0]['ingredientName']
+    return ""
+
+def _strengths(features):
+    #Same result as get_multiple_strengths
+    if 'ingredientAndStrength' in features:
+        items = features['ingredientAndStrength']
+        return [_format_strength(items[n]) for n in range(_ingredient_count(features))]
+    return ['N/A']
+
+def _links(history, derived):
+    links = []
+    scd_concept = derived.get('scdConcept') or {}
+    if isinstance(scd_concept, dict) and scd_concept.get('scdConceptRxcui'):
+        links.append(scd_concept['scdConceptRxcui'])
+    for pack in (history.get('pack') or {}).get('packConcept') or []:
+        if pack.get('packRxcui'):
+            links.append(pack['packRxcui'])
+    for remapped in derived.get('remappedConcept') or []:
+        if remapped.get('remappedRxCui'):
+            links.append(remapped['remappedRxCui'])
+    return [str(link) for link in links]
+
+def _derive(function, *sections):
+    try:
+        return function(*sections)
+    except Exception:
+        return _absent
+
+def as_concept(rxcui_data):
+    """
+    Lets the handlers take either a historystatus document or the RxConcept already made from it.
+    """
+    if isinstance(rxcui_data, RxConcept):
+        return rxcui_data
+    return extract_concept(rxcui_data)
+
+def extract_concept(rxcui_data):
+    """
+    Reads a historystatus document once and returns its RxConcept. Each nested section is looked up a single time and
+    every field is worked out from them.
+
+    Input: Dictionary (parsed historystatus json)
+    Output: RxConcept
+    """
+    concept = RxConcept()
+    history = rxcui_data.get('rxcuiStatusHistory') if type(rxcui_data) is dict else None
+    if type(history) is not dict:
+        for slot in RxConcept.__slots__:
+            setattr(concept, slot, _absent)
+        concept._links = []
+        return concept
+    features = history.get('definitionalFeatures')
+    derived = history.get('derivedConcepts')
+    attributes = _dict(history.get('attributes'))
+    meta = _dict(history.get('metaData'))
+    feature_section = _dict(features)
+    derived_section = _dict(derived)
+    first_ingredient = _first(feature_section.get('ingredientAndStrength'))
+
+    concept._rxcui = attributes.get('rxcui', _absent)
+    concept._name = attributes.get('name', _absent)
+    concept._tty = attributes.get('tty', _absent)
+    concept._is_multiple_ingredient = attributes.get('isMultipleIngredient', _absent)
+    concept._status = meta.get('status', _absent)
+    concept._source = meta.get('source', _absent)
+    concept._history_status = history.get('status', _absent)
+    concept._ingredient = first_ingredient.get('activeIngredientName', _absent)
+    concept._base_name = first_ingredient.get('baseName', _absent)
+    concept._strength = _derive(_format_strength, first_ingredient)
+    concept._dose_form = _first(feature_section.get('doseFormConcept')).get('doseFormName', _absent)
+    try:
+        concept._ingredient_count, concept._ingredients, concept._strengths = _ingredients_and_strengths(features)
+    except Exception:
+        concept._ingredient_count = _derive(_ingredient_count, features)
+        concept._ingredients = _derive(_ingredients, features, derived)
+        concept._strengths = _derive(_strengths, features)
+    concept._dose_forms = _derive(_dose_forms, features)
+    concept._ingredient_name = _first(derived_section.get('ingredientConcept')).get('ingredientName', _absent)
+    concept._scd_rxcui = _dict(derived_section.get('scdConcept')).get('scdConceptRxcui', _absent)
+    concept._pack_rxcui = _first(_dict(history.get('pack')).get('packConcept')).get('packRxcui', _absent)
+    concept._remapped_rxcui = _first(derived_section.get('remappedConcept')).get('remappedRxCui', _absent)
+    concept._links = _derive(_links, history, derived_section)
+    return concept
+
+sample_document = {'rxcuiStatusHistory': {
+    'metaData': {'status': 'Active', 'source': 'RXNORM'},
+    'attributes': {'rxcui': '213269', 'name': 'acetaminophen 325 MG / hydrocodone bitartrate 5 MG Oral Tablet [Norco]',
+                   'tty': 'SBD', 'isMultipleIngredient': 'YES'},
+    'definitionalFeatures': {
+        'ingredientAndStrength': [
+            {'baseName': 'acetaminophen', 'activeIngredientName': 'acetaminophen', 'numeratorValue': '325', 'numeratorUnit': 'MG',
+             'denominatorValue': '1', 'denominatorUnit': 'EACH'},
+            {'baseName': 'hydrocodone', 'activeIngredientName': 'hydrocodone bitartrate', 'numeratorValue': '5', 'numeratorUnit': 'MG',
+             'denominatorValue': '1', 'denominatorUnit': 'EACH'}],
+        'doseFormConcept': [{'doseFormName': 'Oral Tablet', 'doseFormGroupName': 'Oral Product'}],
+        'doseFormGroupConcept': [{'doseFormGroupName': 'Oral Product'}, {'doseFormGroupName': 'Pill'}]},
+    'derivedConcepts': {'scdConcept': {'scdConceptRxcui': '856999', 'scdConceptName': 'acetaminophen 325 MG / hydrocodone bitartrate 5 MG Oral Tablet'},
+                        'ingredientConcept': [{'ingredientRxcui': '161', 'ingredientName': 'acetaminophen'}]}}}
+
+def _nested_lookups(rxcui_data):
+    #The access pattern the TTY handlers used before extract_concept, kept only for the benchmark
+    name = rxcui_data['rxcuiStatusHistory']['attributes']['name']
+    tty = rxcui_data['rxcuiStatusHistory']['attributes']['tty']
+    status = rxcui_data["rxcuiStatusHistory"]['metaData']['status']
+    ingredient_count = sum('activeIngredientName' in item for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'])
+    ingredients = []
+    strengths = []
+    for n in range(ingredient_count):
+        ingredients.append(rxcui_data["rxcuiStatusHistory"]["definitionalFeatures"]["ingredientAndStrength"][n]["activeIngredientName"])
+        x = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n]['numeratorValue']
+        y = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n]['numeratorUnit']
+        a = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n]['denominatorValue']
+        b = rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['ingredientAndStrength'][n]['denominatorUnit']
+        strengths.append(f"{x} {y}/{a} {b}")
+    dose_forms = [rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormConcept'][0]['doseFormName']]
+    for item in rxcui_data["rxcuiStatusHistory"]['definitionalFeatures']['doseFormGroupConcept']:
+        dose_forms.append(item['doseFormGroupName'])
+    scd_rxcui = rxcui_data['rxcuiStatusHistory']['derivedConcepts']['scdConcept']['scdConceptRxcui']
+    return name, tty, status, ingredients, strengths, dose_forms, scd_rxcui
+
+def _projection(concept):
+    return concept.name, concept.tty, concept.status, concept.ingredients, concept.strengths, concept.dose_forms, concept.scd_rxcui
+
+def benchmark(rxcui_data=sample_document, number=20000, repeat=5):
+    """
+    Times reading the values an SBD handler needs from one document: the old nested lookups, which run every time
+    a handler reads the document, against extract_concept, which runs once per RxCUI (the RxConcept is what
+    historystatus_cache keeps), and the projection every later read of that RxCUI costs.
+
+    Output: Dictionary with the best of repeat runs, in microseconds per document, for each approach
+    """
+    concept = extract_concept(rxcui_data)
+    timings = {
+        'nested lookups, every read': lambda: _nested_lookups(rxcui_data),
+        'extract_concept, once per RxCUI': lambda: extract_concept(rxcui_data),
+        'projection of a cached RxConcept, every read': lambda: _projection(concept),
+    }
+    return {label: round(min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6, 3) for label, function in timings.items()}
+
+if __name__ == "__main__":
+    for label, microseconds in benchmark().items():
+        print(f"{label}: {microseconds} microseconds per document")
@@ -0,0 +1,189 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from RetryPolicy import RetryPolicy, CircuitBreaker
+
+#Shared client for every call to the RxNav REST API (https://rxnav.nlm.nih.gov/REST).
+#All the RxNorm lookups in CachingProcessSaveRx, ProcessTysonData and ProcessBremoRetailData go through
+#rxnav_client so they reuse the same keep-alive connections instead of opening a new one for every call.
+#Every request to RxNav also takes a token from one shared TokenBucket, so running more worker threads never goes over rate_limit.
+#get_json retries failed requests with rxnav_retry (backoff with jitter, a deadline per call and a circuit breaker shared by
+#every thread), so the callers do not need retry loops of their own.
+#With use_local_index the ndcstatus and historystatus requests are answered from an RxNormRRFIndex instead.
+
+base_url = "https://rxnav.nlm.nih.gov/REST"
+connect_timeout = 10
+read_timeout = 100  # Seconds to wait for RxNav to answer, cut down to what is left of retry_deadline on every attempt
+pool_size = 16  # Number of keep-alive connections kept open to RxNav, should be at least the number of worker threads
+rate_limit = 20  # Requests per second sent to RxNav, NLM asks for no more than 20 per second from one IP address
+rate_burst = 20  # Requests that can go out back to back after the client has been idle
+retry_attempts = 5  # Calls made for one request before giving up
+retry_base_delay = 0.5  # Seconds before the first retry, doubled for each retry after it (with jitter)
+retry_max_delay = 8  # Longest wait between two attempts
+retry_deadline = 60  # Seconds one request may take with all its retries
+breaker_failure_threshold = 10  # Failures in a row, across all threads, that mark RxNav as down
+breaker_reset_timeout = 60  # Seconds to fail fast before trying RxNav again
+
+class TokenBucket:
+    """
+    Token bucket shared by every thread of the process. It fills with rate tokens per second up to burst, and each
+    request takes one, waiting for it if the bucket is empty.
+    """
+    def __init__(self, rate=rate_limit, burst=rate_burst):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def configure(self, rate=None, burst=None):
+        with self.lock:
+            self._refill()
+            if rate is not None:
+                self.rate = rate
+            if burst is not None:
+                self.burst = burst
+                self.tokens = min(self.tokens, burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Takes one token, sleeping until there is one. A rate of None (or 0) does not limit at all.
+        Output: Seconds spent waiting
+        """
+        if not self.rate:
+            return 0
+        waited = 0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            #Sleep outside the lock so the other threads can still check the bucket
+            time.sleep(wait)
+            waited += wait
+
+class RxNavClient:
+    def __init__(self, base_url=base_url, pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout):
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.session = None
+        self.local_index = None
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self.configure(pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout)
+
+    def configure(self, pool_size=None, connect_timeout=None, read_timeout=None, rate=None, burst=None):
+        """
+        Sets the connection pool size, the timeouts and the rate limit used for every request. Changing the pool size
+        replaces the session, so it is best done before any lookups start.
+
+        Parameters:
+            pool_size (int): number of keep-alive connections to keep open to RxNav
+            connect_timeout (int): seconds to wait for a connection
+            read_timeout (int): seconds to wait for RxNav to answer
+            rate (float): requests per second sent to RxNav, across all threads
+            burst (int): requests that can go out back to back before the rate applies
+        """
+        if rate is not None or burst is not None:
+            self.rate_limiter.configure(rate=rate, burst=burst)
+        with self.lock:
+            if connect_timeout is not None:
+                self.connect_timeout = connect_timeout
+            if read_timeout is not None:
+                self.read_timeout = read_timeout
+            if pool_size is not None or self.session is None:
+                self.pool_size = pool_size if pool_size is not None else self.pool_size
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                old_session, self.session = self.session, session
+                if old_session is not None:
+                    old_session.close()
+
+    def use_local_index(self, index):
+        """
+        Answers the requests an RxNormRRFIndex knows from it instead of RxNav. None goes back to RxNav only.
+
+        Parameters:
+            index (RxNormRRFIndex): index built from an RxNorm release, or None
+        """
+        self.local_index = index
+
+    def url(self, path):
+        """
+        Turns a path like 'rxcui/12345/historystatus.json' into a full RxNav url. Full urls are returned as is.
+        """
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, params=None, timeout=None):
+        """
+        Sends a GET request to RxNav over the pooled session.
+
+        Parameters:
+            path (str): full url or path relative to base_url
+            params (dict): optional query string parameters
+            timeout (float): optional seconds the request may take at most, the connect and read timeouts are cut down to it
+
+        Returns:
+            requests.Response, or the LocalResponse of the local index
+        """
+        if self.local_index is not None:
+            response = self.local_index.answer(self.url(path), params)
+            if response is not None:
+                return response
+        self.rate_limiter.acquire()
+        connect_timeout, read_timeout = self.connect_timeout, self.read_timeout
+        if timeout is not None:
+            connect_timeout, read_timeout = min(connect_timeout, timeout), min(read_timeout, timeout)
+        return self.session.get(self.url(path), params=params, timeout=(connect_timeout, read_timeout))
+
+    def get_json(self, path, params=None, description=None):
+        """
+        Sends a GET request with rxnav_retry and returns the parsed json. A response other than 200 counts as a failure.
+        Each attempt only waits for what is left of retry_deadline, so a slow answer cannot run past it.
+
+        Parameters:
+            path (str): full url or path relative to base_url
+            params (dict): optional query string parameters
+            description (str): what is being looked up, for the retry messages (defaults to the url)
+
+        Returns:
+            dict: the json RxNav answered with. Raises the last error once the retries run out,
+            or CircuitOpenError while RxNav is marked as down.
+        """
+        def request(remaining):
+            response = self.get(path, params, timeout=remaining)
+            response.raise_for_status()
+            return response.json()
+        return rxnav_retry.call(request, description or self.url(path), pass_remaining=True)
+
+    def ndc_status(self, ndc):
+        """
+        Returns the response of the ndcstatus endpoint for an 11 digit NDC.
+        """
+        return self.get(f"ndcstatus.json?ndc={ndc}")
+
+    def historystatus(self, rxcui):
+        """
+        Returns the response of the historystatus endpoint for an RxCUI.
+        """
+        return self.get(f"rxcui/{rxcui}/historystatus.json")
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+
+rxnav_retry = RetryPolicy(max_attempts=retry_attempts, base_delay=retry_base_delay, max_delay=retry_max_delay, deadline=retry_deadline,
+                          breaker=CircuitBreaker(breaker_failure_threshold, breaker_reset_timeout))
+rxnav_client = RxNavClient()
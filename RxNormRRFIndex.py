@@ -0,0 +1,396 @@
+import os
+import re
+import sys
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+#Optional offline backend for the RxNav lookups. It ingests an RxNorm monthly full release (the RRF files in its rrf/
+#folder: RXNCONSO, RXNSAT, RXNREL and, if it is there, RXNCUI) into an SQLite index, and answers ndcstatus.json and
+#rxcui/{rxcui}/historystatus.json with documents shaped like the RxNav ones, so get_rxnorm_rxcui, get_concept and the
+#TTY handlers read them without any change. Hand an index to rxnav_client.use_local_index to switch it on.
+#
+#Build an index once per release:
+#    python RxNormRRFIndex.py <folder with the RRF files> [index path]
+
+default_index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RxNormRRFIndex.sqlite')
+
+batch_size = 50000  # Rows inserted per executemany while ingesting
+
+#Atoms kept for the name of a concept, the first TTY found wins. Synonyms (SY, TMSY, PSN) are never the concept name
+concept_ttys = ['SCD', 'SBD', 'GPCK', 'BPCK', 'IN', 'PIN', 'MIN', 'SCDC', 'SBDC', 'SCDF', 'SBDF', 'SCDG', 'SBDG',
+                'SCDFP', 'SBDFP', 'SCDGP', 'BN', 'DF', 'DFG']
+
+#RXNSAT attributes kept, everything else in the file is skipped
+kept_attributes = ['RXN_BOSS_STRENGTH_NUM_VALUE', 'RXN_BOSS_STRENGTH_NUM_UNIT', 'RXN_BOSS_STRENGTH_DENOM_VALUE',
+                   'RXN_BOSS_STRENGTH_DENOM_UNIT', 'RXN_BOSS_FROM', 'RXN_AI', 'RXN_AM', 'RXN_STRENGTH']
+
+#RXNREL relationships kept, read as "subject rela object"
+kept_relations = ['consists_of', 'has_ingredient', 'has_precise_ingredient', 'has_ingredients', 'has_dose_form',
+                  'has_doseformgroup', 'isa', 'tradename_of', 'contains', 'form_of']
+
+historystatus_pattern = re.compile(r'/rxcui/([^/]+)/historystatus\.json$')
+
+class LocalResponse:
+    """
+    The parts of a requests.Response the RxNav callers use, for an answer that came from the local index.
+    """
+    def __init__(self, document, url, status_code=200):
+        self.document = document
+        self.url = url
+        self.status_code = status_code
+
+    def json(self):
+        return self.document
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise RuntimeError(f"{self.status_code} from the local RxNorm index for {self.url}")
+
+def _rrf_rows(path):
+    #RRF lines are | separated with a trailing |
+    with open(path, 'r', encoding='utf-8') as file_obj:
+        for line in file_obj:
+            yield line.rstrip('\r\n').split('|')
+
+def _rrf_file(folder, name):
+    for candidate in (os.path.join(folder, name), os.path.join(folder, 'rrf', name)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+class RxNormRRFIndex:
+    """
+    NDC -> RxCUI and RxCUI -> historystatus answers from one RxNorm release, kept in SQLite.
+
+    Parameters:
+        path (str): the index database, built with ingest
+        offline (bool): True answers every lookup from the index, the way RxNav answers an unknown NDC or RxCUI when the
+            release does not have it. False answers only what the index knows, so the rest still goes to RxNav.
+    """
+    def __init__(self, path=default_index_path, offline=True):
+        self.path = path
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS concepts (rxcui TEXT PRIMARY KEY, name TEXT, tty TEXT, rank INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS ndcs (ndc TEXT PRIMARY KEY, rxcui TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS attributes (rxcui TEXT, atn TEXT, atv TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS relations (subject TEXT, rela TEXT, object TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS remapped (rxcui TEXT, new_rxcui TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS release (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def ingest(self, folder):
+        """
+        Replaces the index with the RRF files of one RxNorm full release. Only the RXNORM source is kept.
+
+        Input: Path to the release folder (or its rrf/ folder)
+        Output: Dictionary with the number of concepts, NDCs, attributes, relations and remapped concepts ingested
+        """
+        conso_path = _rrf_file(folder, 'RXNCONSO.RRF')
+        sat_path = _rrf_file(folder, 'RXNSAT.RRF')
+        rel_path = _rrf_file(folder, 'RXNREL.RRF')
+        if conso_path is None or sat_path is None or rel_path is None:
+            raise FileNotFoundError(f"RXNCONSO.RRF, RXNSAT.RRF and RXNREL.RRF are needed in {folder}")
+        cui_path = _rrf_file(folder, 'RXNCUI.RRF')
+        ranks = {tty: rank for rank, tty in enumerate(concept_ttys)}
+        attributes = set(kept_attributes)
+        relations = set(kept_relations)
+        with self.lock:
+            with self.conn:
+                for table in ('concepts', 'ndcs', 'attributes', 'relations', 'remapped', 'release'):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.conn.execute("DROP INDEX IF EXISTS attributes_rxcui")
+                self.conn.execute("DROP INDEX IF EXISTS relations_subject")
+                self.conn.execute("DROP INDEX IF EXISTS remapped_rxcui")
+
+                #RXNCONSO: RXCUI|LAT|TS|LUI|STT|SUI|ISPREF|RXAUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|STR|SRL|SUPPRESS|CVF
+                names = {}
+                for row in _rrf_rows(conso_path):
+                    if row[11] != 'RXNORM' or row[12] not in ranks or row[16] not in ('N', ''):
+                        continue
+                    rank = ranks[row[12]]
+                    if row[0] not in names or rank < names[row[0]][2]:
+                        names[row[0]] = (row[14], row[12], rank)
+                self.conn.executemany("INSERT INTO concepts (rxcui, name, tty, rank) VALUES (?, ?, ?, ?)",
+                                      ((rxcui, name, tty, rank) for rxcui, (name, tty, rank) in names.items()))
+                counts = {'concepts': len(names)}
+                del names
+
+                #RXNSAT: RXCUI|LUI|SUI|RXAUI|STYPE|CODE|ATUI|SATUI|ATN|SAB|ATV|SUPPRESS|CVF
+                ndc_batch = []
+                attribute_batch = []
+                counts['ndcs'] = 0
+                counts['attributes'] = 0
+                for row in _rrf_rows(sat_path):
+                    if row[9] != 'RXNORM':
+                        continue
+                    if row[8] == 'NDC':
+                        ndc_batch.append((row[10], row[0]))
+                    elif row[8] in attributes:
+                        attribute_batch.append((row[0], row[8], row[10]))
+                    if len(ndc_batch) >= batch_size:
+                        self.conn.executemany("INSERT OR IGNORE INTO ndcs (ndc, rxcui) VALUES (?, ?)", ndc_batch)
+                        counts['ndcs'] += len(ndc_batch)
+                        ndc_batch = []
+                    if len(attribute_batch) >= batch_size:
+                        self.conn.executemany("INSERT INTO attributes (rxcui, atn, atv) VALUES (?, ?, ?)", attribute_batch)
+                        counts['attributes'] += len(attribute_batch)
+                        attribute_batch = []
+                self.conn.executemany("INSERT OR IGNORE INTO ndcs (ndc, rxcui) VALUES (?, ?)", ndc_batch)
+                self.conn.executemany("INSERT INTO attributes (rxcui, atn, atv) VALUES (?, ?, ?)", attribute_batch)
+                counts['ndcs'] += len(ndc_batch)
+                counts['attributes'] += len(attribute_batch)
+
+                #RXNREL: RXCUI1|RXAUI1|STYPE1|REL|RXCUI2|RXAUI2|STYPE2|RELA|RUI|SRUI|SAB|SL|RG|DIR|SUPPRESS|CVF
+                #The relationship reads "RXCUI2 RELA RXCUI1"
+                relation_batch = []
+                counts['relations'] = 0
+                for row in _rrf_rows(rel_path):
+                    if row[10] != 'RXNORM' or row[7] not in relations or not row[0] or not row[4]:
+                        continue
+                    relation_batch.append((row[4], row[7], row[0]))
+                    if len(relation_batch) >= batch_size:
+                        self.conn.executemany("INSERT INTO relations (subject, rela, object) VALUES (?, ?, ?)", relation_batch)
+                        counts['relations'] += len(relation_batch)
+                        relation_batch = []
+                self.conn.executemany("INSERT INTO relations (subject, rela, object) VALUES (?, ?, ?)", relation_batch)
+                counts['relations'] += len(relation_batch)
+
+                #RXNCUI: CUI1|VER_START|VER_END|CARDINALITY|CUI2, a retired RxCUI and the RxCUI it was remapped to
+                counts['remapped'] = 0
+                if cui_path is not None:
+                    remapped = [(row[0], row[4]) for row in _rrf_rows(cui_path) if len(row) > 4 and row[0]]
+                    self.conn.executemany("INSERT INTO remapped (rxcui, new_rxcui) VALUES (?, ?)", remapped)
+                    counts['remapped'] = len(remapped)
+
+                self.conn.execute("CREATE INDEX attributes_rxcui ON attributes (rxcui)")
+                self.conn.execute("CREATE INDEX relations_subject ON relations (subject, rela)")
+                self.conn.execute("CREATE INDEX remapped_rxcui ON remapped (rxcui)")
+                self.conn.executemany("INSERT INTO release (key, value) VALUES (?, ?)",
+                                      [('folder', os.path.abspath(folder)), ('ingested_at', str(time.time()))])
+        return counts
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM concepts").fetchone()[0]
+
+    def _concept(self, rxcui):
+        return self.conn.execute("SELECT rxcui, name, tty FROM concepts WHERE rxcui = ?", (rxcui,)).fetchone()
+
+    def _related(self, rxcui, rela):
+        return [row[0] for row in self.conn.execute("SELECT object FROM relations WHERE subject = ? AND rela = ? ORDER BY object",
+                                                    (rxcui, rela))]
+
+    def _related_concepts(self, rxcui, rela, tty=None):
+        concepts = []
+        for related in self._related(rxcui, rela):
+            concept = self._concept(related)
+            if concept is not None and (tty is None or concept[2] in tty):
+                concepts.append(concept)
+        return concepts
+
+    def _attributes(self, rxcui):
+        values = {}
+        for atn, atv in self.conn.execute("SELECT atn, atv FROM attributes WHERE rxcui = ?", (rxcui,)):
+            values.setdefault(atn, atv)
+        return values
+
+    def _ingredient_and_strength(self, scdc):
+        #One ingredientAndStrength entry from the strength attributes of an SCDC
+        values = self._attributes(scdc)
+        base = self._related_concepts(scdc, 'has_ingredient', ('IN',))
+        active = values.get('RXN_AI', '').strip('{} ')
+        moiety = values.get('RXN_AM', '').strip('{} ')
+        active_concept = self._concept(active) if active else None
+        moiety_concept = self._concept(moiety) if moiety else None
+        if active_concept is None:
+            precise = self._related_concepts(scdc, 'has_precise_ingredient', ('PIN',))
+            active_concept = precise[0] if precise else (base[0] if base else None)
+        numerator_value = values.get('RXN_BOSS_STRENGTH_NUM_VALUE')
+        numerator_unit = values.get('RXN_BOSS_STRENGTH_NUM_UNIT')
+        denominator_value = values.get('RXN_BOSS_STRENGTH_DENOM_VALUE', '1')
+        denominator_unit = values.get('RXN_BOSS_STRENGTH_DENOM_UNIT', 'EACH')
+        if numerator_value is None and values.get('RXN_STRENGTH'):
+            #Older releases only have RXN_STRENGTH, like "325 MG" or "5 MG/ML"
+            numerator, _, denominator = values['RXN_STRENGTH'].partition('/')
+            numerator_value, _, numerator_unit = numerator.strip().partition(' ')
+            if denominator:
+                denominator_value, denominator_unit = '1', denominator.strip()
+        entry = {
+            'baseRxcui': base[0][0] if base else '',
+            'baseName': base[0][1] if base else '',
+            'bossRxcui': active_concept[0] if active_concept is not None else '',
+            'bossName': active_concept[1] if active_concept is not None else '',
+            'activeIngredientRxcui': active_concept[0] if active_concept is not None else '',
+            'activeIngredientName': active_concept[1] if active_concept is not None else '',
+            'moietyRxcui': moiety_concept[0] if moiety_concept is not None else '',
+            'moietyName': moiety_concept[1] if moiety_concept is not None else '',
+        }
+        if numerator_value is not None:
+            entry.update({'numeratorValue': numerator_value, 'numeratorUnit': numerator_unit,
+                          'denominatorValue': denominator_value, 'denominatorUnit': denominator_unit})
+        return entry
+
+    def _clinical(self, rxcui, tty):
+        #The clinical (generic) concept whose ingredients, strengths and dose form a branded one shares
+        if tty in ('SBD', 'SBDC', 'SBDF', 'SBDG', 'BPCK'):
+            generic = self._related(rxcui, 'tradename_of')
+            if generic:
+                return generic[0]
+        return rxcui
+
+    def _definitional_features(self, rxcui, tty):
+        clinical = self._clinical(rxcui, tty)
+        features = {}
+        if tty in ('SCDC', 'SBDC'):
+            components = [clinical]
+        elif tty in ('GPCK', 'BPCK'):
+            #A pack is made of the components of the drugs it contains
+            components = []
+            for content in self._related(clinical, 'contains'):
+                content_tty = self._concept(content)
+                for component in self._related(self._clinical(content, content_tty[2] if content_tty else ''), 'consists_of'):
+                    if component not in components:
+                        components.append(component)
+        else:
+            components = self._related(clinical, 'consists_of')
+        ingredients = [self._ingredient_and_strength(component) for component in components]
+        if ingredients:
+            features['ingredientAndStrength'] = ingredients
+        dose_forms = self._related_concepts(rxcui, 'has_dose_form', ('DF',)) or self._related_concepts(clinical, 'has_dose_form', ('DF',))
+        groups = []
+        #The dose form groups come from the SCDGs a drug is, a pack has the ones of the drugs it contains
+        drugs = self._related(clinical, 'contains') if tty in ('GPCK', 'BPCK') else [clinical]
+        grouped = [group for drug in drugs for group in self._related_concepts(drug, 'isa', ('SCDG', 'SBDG'))]
+        for group in grouped + [self._concept(clinical)]:
+            if group is None:
+                continue
+            for dose_form_group in self._related_concepts(group[0], 'has_doseformgroup', ('DFG',)):
+                if dose_form_group not in groups:
+                    groups.append(dose_form_group)
+        if dose_forms:
+            dose_form = {'doseFormRxcui': dose_forms[0][0], 'doseFormName': dose_forms[0][1]}
+            if groups:
+                dose_form['doseFormGroupName'] = groups[0][1]
+            features['doseFormConcept'] = [dose_form]
+        if groups:
+            features['doseFormGroupConcept'] = [{'doseFormGroupRxcui': group[0], 'doseFormGroupName': group[1]} for group in groups]
+        return features, len(components) > 1
+
+    def _derived_concepts(self, rxcui, tty):
+        derived = {}
+        clinical = self._clinical(rxcui, tty)
+        if tty in ('IN', 'PIN'):
+            ingredients = [self._concept(rxcui)]
+            if tty == 'PIN':
+                ingredients = self._related_concepts(rxcui, 'form_of', ('IN',)) or ingredients
+        else:
+            ingredients = []
+            for component in self._related(clinical, 'consists_of') or [clinical]:
+                for ingredient in self._related_concepts(component, 'has_ingredient', ('IN',)):
+                    if ingredient not in ingredients:
+                        ingredients.append(ingredient)
+            for multiple in self._related_concepts(clinical, 'has_ingredients', ('MIN',)):
+                for ingredient in self._related_concepts(multiple[0], 'has_ingredient', ('IN',)):
+                    if ingredient not in ingredients:
+                        ingredients.append(ingredient)
+        if ingredients:
+            derived['ingredientConcept'] = [{'ingredientRxcui': ingredient[0], 'ingredientName': ingredient[1]} for ingredient in ingredients]
+        if tty == 'SBD' and clinical != rxcui:
+            scd = self._concept(clinical)
+            if scd is not None:
+                derived['scdConcept'] = {'scdConceptRxcui': scd[0], 'scdConceptName': scd[1]}
+        return derived
+
+    def historystatus(self, rxcui):
+        """
+        Input: RxCUI (string or integer)
+        Output: Dictionary shaped like RxNav's historystatus.json, or None if the index does not know the RxCUI
+        """
+        key = str(rxcui)
+        with self.lock:
+            concept = self._concept(key)
+            if concept is None:
+                remapped = [row[0] for row in self.conn.execute("SELECT new_rxcui FROM remapped WHERE rxcui = ? ORDER BY new_rxcui", (key,))]
+                remapped_concepts = [self._concept(new_rxcui) for new_rxcui in remapped if new_rxcui != key]
+                remapped_concepts = [remapped_concept for remapped_concept in remapped_concepts if remapped_concept is not None]
+                if not remapped:
+                    return None
+                history = {'metaData': {'status': 'Remapped' if remapped_concepts else 'NotCurrent', 'source': 'RXNORM'},
+                           'attributes': {'rxcui': key, 'name': '', 'tty': '', 'isMultipleIngredient': ''}}
+                if remapped_concepts:
+                    history['derivedConcepts'] = {'remappedConcept': [{'remappedRxCui': remapped_concept[0], 'remappedName': remapped_concept[1],
+                                                                       'remappedTTY': remapped_concept[2]} for remapped_concept in remapped_concepts]}
+                return {'rxcuiStatusHistory': history}
+            _, name, tty = concept
+            features, multiple = self._definitional_features(key, tty)
+            history = {'metaData': {'status': 'Active', 'source': 'RXNORM'},
+                       'attributes': {'rxcui': key, 'name': name, 'tty': tty, 'isMultipleIngredient': 'YES' if multiple else 'NO'},
+                       'definitionalFeatures': features,
+                       'derivedConcepts': self._derived_concepts(key, tty)}
+            if tty in ('GPCK', 'BPCK'):
+                contents = self._related_concepts(key, 'contains', ('SCD', 'SBD'))
+                if contents:
+                    history['pack'] = {'packConcept': [{'packRxcui': content[0], 'packName': content[1], 'packTTY': content[2]}
+                                                       for content in contents]}
+        return {'rxcuiStatusHistory': history}
+
+    def ndc_status(self, ndc):
+        """
+        Input: NDC (string, the 11 digit form RxNorm keeps)
+        Output: Dictionary shaped like RxNav's ndcstatus.json, or None if the index does not know the NDC
+        """
+        key = str(ndc).strip()
+        with self.lock:
+            found = self.conn.execute("SELECT rxcui FROM ndcs WHERE ndc = ?", (key,)).fetchone()
+            concept = self._concept(found[0]) if found is not None else None
+        if found is None:
+            return None
+        return {'ndcStatus': {'ndc11': key, 'status': 'ACTIVE', 'active': 'YES', 'rxnormNdc': 'YES', 'rxcui': found[0],
+                              'conceptName': concept[1] if concept is not None else '', 'conceptStatus': 'ACTIVE'}}
+
+    def answer(self, url, params=None):
+        """
+        Answers an RxNav request from the index.
+
+        Input: Full RxNav url, optional query string parameters
+        Output: LocalResponse, or None if the request is not one the index answers (or, when not offline, it does not know
+        the NDC or RxCUI) so it should go to RxNav
+        """
+        parts = urlsplit(url)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        query.update(params or {})
+        if parts.path.endswith('/ndcstatus.json') and 'ndc' in query:
+            document = self.ndc_status(query['ndc'])
+            if document is None:
+                if not self.offline:
+                    return None
+                document = {'ndcStatus': {'ndc11': str(query['ndc']), 'status': 'UNKNOWN', 'rxcui': '', 'conceptName': '', 'conceptStatus': 'UNKNOWN'}}
+            return LocalResponse(document, url)
+        found = historystatus_pattern.search(parts.path)
+        if found is not None:
+            document = self.historystatus(found.group(1))
+            if document is None:
+                if not self.offline:
+                    return None
+                document = {'rxcuiStatusHistory': {'metaData': {'status': 'UNKNOWN', 'source': ''},
+                                                   'attributes': {'rxcui': found.group(1), 'name': '', 'tty': '', 'isMultipleIngredient': ''}}}
+            return LocalResponse(document, url)
+        return None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python RxNormRRFIndex.py <folder with the RRF files> [index path]")
+        sys.exit(1)
+    index = RxNormRRFIndex(sys.argv[2] if len(sys.argv) > 2 else default_index_path)
+    start_time = time.time()
+    print(index.ingest(sys.argv[1]))
+    print(f"The Time it took to build the index is {time.time() - start_time}")
+    index.close()
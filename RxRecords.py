@@ -0,0 +1,138 @@
+from LocalRxStore import detail_fields
+
+#Compact records for the RxNorm details main_process carries around. A report used to hold a 12 key dictionary for
+#every RxCUI and a 32 key dictionary for every row. Now each distinct RxCUI is one RxNormDetails, shared by every row
+#that uses it, and each row is one RxNormRow. They only turn back into dictionaries at the edges: the
+#SaveRxCUIDetails rows (to_row) and the REDCap output built at the end of main_process.
+
+class RxNormDetails:
+    """
+    The RxNorm details of one RxCUI, the same values as the 12 SaveRxCUIDetails.csv columns.
+    Values can be strings or lists, the same as the dictionaries the TTY handlers return.
+    """
+    __slots__ = ('rxcui', 'name', 'tty', 'ingredient', 'dose_form', 'strength',
+                 'c_name', 'c_tty', 'c_rxcui', 'c_ingredient', 'c_dose_form', 'c_strength')
+
+    # SaveRxCUIDetails.csv column -> attribute, in the column order of detail_fields
+    columns = dict(zip(detail_fields, __slots__))
+
+    def __init__(self, rxcui='', name='', tty='', ingredient='', dose_form='', strength='',
+                 c_name='', c_tty='', c_rxcui='', c_ingredient='', c_dose_form='', c_strength=''):
+        self.rxcui = rxcui
+        self.name = name
+        self.tty = tty
+        self.ingredient = ingredient
+        self.dose_form = dose_form
+        self.strength = strength
+        self.c_name = c_name
+        self.c_tty = c_tty
+        self.c_rxcui = c_rxcui
+        self.c_ingredient = c_ingredient
+        self.c_dose_form = c_dose_form
+        self.c_strength = c_strength
+
+    @classmethod
+    def from_row(cls, row, rxcui=None):
+        """
+        Input: Dictionary with the detail_fields keys (a SaveRxCUIDetails row, or the dictionary a TTY handler returns,
+        which has no 'RxCUI' key so it is given as rxcui)
+        Output: RxNormDetails. A missing key raises a KeyError, the same as reading it from the dictionary did.
+        """
+        return cls(row['RxCUI'] if rxcui is None else rxcui,
+                   row['RxNorm Name'], row['RxNorm TTY'], row['RxNorm Ingredient'], row['RxNorm Dose Form'], row['RxNorm Strength Details'],
+                   row['C RxNorm Name'], row['C RxNorm TTY'], row['C RxNorm RxCUI'], row['C RxNorm Ingredient'], row['C RxNorm Dose Form'],
+                   row['C RxNorm Strength Details'])
+
+    def to_row(self):
+        """
+        Output: Dictionary with the detail_fields keys, the layout of SaveRxCUIDetails.csv and RxCUIDetailStore
+        """
+        return {column: getattr(self, attribute) for column, attribute in self.columns.items()}
+
+    def __repr__(self):
+        return repr(self.to_row())
+
+class RxNormRow:
+    """
+    One report row with its Escript and Dispensed RxNorm details, what main_process used to keep as a 32 key dictionary.
+    e and d point at the shared RxNormDetails of the two RxCUIs. get(key) still answers with the old dictionary keys,
+    so the matching rules read the rows the same way as before.
+    """
+    __slots__ = ('unique_id', 'row_id', 'report_id', 'endc', 'erxcui', 'erx_med_name', 'dndc', 'drxcui', 'dispensed_med', 'gcn', 'e', 'd')
+
+    # Old dictionary key -> (None for the row itself or 'e'/'d' for its details, attribute), in the old key order
+    keys = {
+        "uniqueID": (None, 'unique_id'),
+        "rowID": (None, 'row_id'),
+        "reportID": (None, 'report_id'),
+        "eNDC": (None, 'endc'),
+        "eRxCUI": (None, 'erxcui'),
+        "original_erx_med_name": (None, 'erx_med_name'),
+        "dNDC": (None, 'dndc'),
+        "dRxCUI": (None, 'drxcui'),
+        "pharm_Dispensed_med": (None, 'dispensed_med'),
+        "GCN": (None, 'gcn'),
+        "eRxNorm Name": ('e', 'name'),
+        "eRxNorm TTY": ('e', 'tty'),
+        "eRxNorm Ingredient": ('e', 'ingredient'),
+        "eRxNorm Dose Form": ('e', 'dose_form'),
+        "eRxNorm Strength Details": ('e', 'strength'),
+        "eSCD RxNorm Name": ('e', 'c_name'),
+        "eSCD RxNorm TTY": ('e', 'c_tty'),
+        "eSCD RxCUI": ('e', 'c_rxcui'),
+        "eSCD RxNorm Ingredient": ('e', 'c_ingredient'),
+        "eSCD RxNorm Dose Form": ('e', 'c_dose_form'),
+        "eSCD RxNorm Strength Details": ('e', 'c_strength'),
+        "dRxNorm Name": ('d', 'name'),
+        "dRxNorm TTY": ('d', 'tty'),
+        "dRxNorm Ingredient": ('d', 'ingredient'),
+        "dRxNorm Dose Form": ('d', 'dose_form'),
+        "dRxNorm Strength Details": ('d', 'strength'),
+        "dSCD RxNorm Name": ('d', 'c_name'),
+        "dSCD RxNorm TTY": ('d', 'c_tty'),
+        "dSCD RXCUI": ('d', 'c_rxcui'),
+        "dSCD RxNorm Ingredient": ('d', 'c_ingredient'),
+        "dSCD RxNorm Dose Form": ('d', 'c_dose_form'),
+        "dSCD RxNorm Strength Details": ('d', 'c_strength'),
+    }
+
+    def __init__(self, unique_id, row_id, report_id, endc, erxcui, erx_med_name, dndc, drxcui, dispensed_med, gcn, e, d):
+        self.unique_id = unique_id
+        self.row_id = row_id
+        self.report_id = report_id
+        self.endc = endc
+        self.erxcui = erxcui
+        self.erx_med_name = erx_med_name
+        self.dndc = dndc
+        self.drxcui = drxcui
+        self.dispensed_med = dispensed_med
+        self.gcn = gcn
+        self.e = e
+        self.d = d
+
+    def get(self, key, default=None):
+        """
+        Reads a value by its old dictionary key, keys the row never had give default like dict.get does.
+        """
+        found = self.keys.get(key)
+        if found is None:
+            return default
+        side, attribute = found
+        return getattr(self if side is None else getattr(self, side), attribute)
+
+    def __eq__(self, other):
+        # Rows compare by value like the dictionaries did, so list.remove still finds them the same way
+        if not isinstance(other, RxNormRow):
+            return NotImplemented
+        return all(self.get(key) == other.get(key) for key in self.keys)
+
+    __hash__ = None
+
+    def to_dict(self):
+        """
+        Output: Dictionary with the 32 old keys
+        """
+        return {key: self.get(key) for key in self.keys}
+
+    def __repr__(self):
+        return repr(self.to_dict())
@@ -0,0 +1,60 @@
+import math
+import re
+from functools import lru_cache
+
+#Strengths as RxNorm writes them ("5 mg/1 each", "0.5 mg/ml, 250 mcg/ml") parsed once into numeric tuples.
+#Every amount/unit over amount/unit part becomes (amount, unit, per amount, per unit) with the amounts scaled to one
+#unit of their kind (mass to mg, volume to ml), so 500 mcg/1 each and 0.5 mg/1 each give the same tuple. The same few
+#strength strings come back on every mismatched row, so the parses are cached and a comparison is a tuple operation.
+
+strength_pattern = re.compile(r'(\d+(\.\d+)?)\s*(\w+)\s*/\s*(\d+(\.\d+)?)\s*(\w+)')
+unit_scales = {
+    'g': ('mg', 1000), 'gm': ('mg', 1000), 'mg': ('mg', 1), 'mcg': ('mg', 0.001), 'ug': ('mg', 0.001),
+    'l': ('ml', 1000), 'ml': ('ml', 1),
+}  # Lowercase unit -> (unit it is scaled to, factor), other units (each, actuat, unt, meq, hr) are kept as they are
+parse_cache_size = 20000  # Distinct strength strings kept parsed
+
+def normalize_amount(amount, unit):
+    """
+    Input: Float, String (unit as written)
+    Output: (amount, unit) in the unit unit_scales scales it to
+    """
+    unit = unit.lower()
+    scaled_unit, factor = unit_scales.get(unit, (unit, 1))
+    return amount * factor, scaled_unit
+
+@lru_cache(maxsize=parse_cache_size)
+def parse_strength(strength):
+    """
+    Input: String (a strength, any case)
+    Output: Tuple of (amount, unit, per amount, per unit) tuples, one per strength in the string, empty if the string
+    has none
+    """
+    parts = []
+    for amount, _, unit, per_amount, _, per_unit in strength_pattern.findall(strength):
+        parts.append(normalize_amount(float(amount), unit) + normalize_amount(float(per_amount), per_unit))
+    return tuple(parts)
+
+def _same_ratio(ratio1, ratio2):
+    return math.isclose(ratio1, ratio2, rel_tol=1e-9)
+
+def compare_medication_strengths(f, t):
+    """
+    Input: Two strength strings
+    Output: True if both have the same number of strengths and each pair has the same units and a concentration that
+    is equal, half or double the other one, False otherwise (also when either string has no strength)
+    """
+    f_parts = parse_strength(f)
+    t_parts = parse_strength(t)
+    if not f_parts or not t_parts or len(f_parts) != len(t_parts):
+        return False
+    for (f_num1, f_unit1, f_num2, f_unit2), (t_num1, t_unit1, t_num2, t_unit2) in zip(f_parts, t_parts):
+        if f_unit1 != t_unit1 or f_unit2 != t_unit2:
+            return False
+        if f_num2 == 0 or t_num2 == 0:
+            return False
+        ratio_f = f_num1 / f_num2
+        ratio_t = t_num1 / t_num2
+        if not (_same_ratio(ratio_f, ratio_t) or _same_ratio(ratio_f * 2, ratio_t) or _same_ratio(ratio_f * 0.5, ratio_t)):
+            return False
+    return True
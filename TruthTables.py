@@ -0,0 +1,88 @@
+#The truth tables used when matching a prescribed drug to the dispensed one, compiled once into hashed lookups.
+#The tables are written as lists of one-entry dictionaries ({entry: equivalent entry}); checking a pair used to scan the
+#whole list and the match step checks up to twelve pairs for every mismatched row.
+#EquivalenceClasses groups the entries of a symmetric table (salt forms, dose forms) with union-find and gives every
+#entry the id of its group, so two entries are equivalent when their ids are the same. That also makes equivalence
+#transitive: if A = B and B = C are listed, A = C without listing it. DirectedPairs keeps a one-way table (special cases)
+#as a set of (entry1, entry2) pairs. rules_fingerprint hashes the compiled tables (and any lists the match step uses) so
+#outcomes remembered for one set of rules are not reused with another.
+
+import hashlib
+
+class EquivalenceClasses:
+    """
+    Parameters:
+        truth_table (list): One-entry dictionaries, each key is equivalent to its value (both ways)
+    """
+    def __init__(self, truth_table=()):
+        self.parent = {}
+        for row in truth_table:
+            for key, value in row.items():
+                self.union(key, value)
+        self.class_ids = {entry: self.find(entry) for entry in self.parent}
+
+    def find(self, entry):
+        self.parent.setdefault(entry, entry)
+        root = entry
+        while self.parent[root] != root:
+            root = self.parent[root]
+        #Path compression, every entry on the way now points at the root
+        while self.parent[entry] != root:
+            self.parent[entry], entry = root, self.parent[entry]
+        return root
+
+    def union(self, entry1, entry2):
+        root1 = self.find(entry1)
+        root2 = self.find(entry2)
+        if root1 != root2:
+            self.parent[root2] = root1
+
+    def equivalent(self, entry1, entry2):
+        """
+        Input: Two entries (dose forms or ingredients)
+        Output: True if the two are different entries of the same group. Like the lists, an entry is not paired with
+        itself, the match step compares equal entries before it looks at the truth tables.
+        """
+        class_id = self.class_ids.get(entry1)
+        return class_id is not None and entry1 != entry2 and class_id == self.class_ids.get(entry2)
+
+    def signature(self):
+        """
+        Output: The groups as sorted tuples, the same for two tables that list the same equivalences
+        """
+        groups = {}
+        for entry, class_id in self.class_ids.items():
+            groups.setdefault(class_id, []).append(repr(entry))
+        return tuple(sorted(tuple(sorted(group)) for group in groups.values()))
+
+    def __len__(self):
+        return len(self.class_ids)
+
+class DirectedPairs:
+    """
+    Parameters:
+        truth_table (list): One-entry dictionaries, each key may be given when its value was written (one way only)
+    """
+    def __init__(self, truth_table=()):
+        self.pairs = {(key, value) for row in truth_table for key, value in row.items()}
+
+    def contains(self, entry1, entry2):
+        """
+        Input: Two entries
+        Output: True if (entry1, entry2) is listed in that order
+        """
+        return (entry1, entry2) in self.pairs
+
+    def signature(self):
+        return tuple(sorted((repr(entry1), repr(entry2)) for entry1, entry2 in self.pairs))
+
+    def __len__(self):
+        return len(self.pairs)
+
+def rules_fingerprint(*rules):
+    """
+    Input: Compiled tables (EquivalenceClasses, DirectedPairs) and plain lists of entries
+    Output: String, sha1 of all of them, that changes whenever any table or list changes
+    """
+    parts = [rule.signature() if hasattr(rule, 'signature') else tuple(sorted(repr(entry) for entry in rule)) for rule in rules]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
@@ -8,6 +8,11 @@ from config import auth_url
 from config import stored_refresh_token
 from redcap import Project
 import CachingProcessSaveRx
+from LocalRxStore import RxCUIDetailStore, rows_to_csv, compact_journal
+from RxCUIJournal import download_csv_rows, list_journal_files, download_journal_files, upload_rxcui_journal, is_not_found
+from RxNavClient import rxnav_client
+from RxNormRRFIndex import RxNormRRFIndex
+from NDCUtils import canonicalize_ndc_columns
 import CleanExcelSaveRxFiles
 import BarrCleanExcelSaveRxFiles
 import LSCleanExcelSaveRxFiles
@@ -31,6 +36,12 @@ import math
 #Set Pretty Print Rules to make the dictionaries look nice and easier to read when printed
 pp = pprint.PrettyPrinter(indent=2, sort_dicts=False, width=100)
 
+rxcui_sync_mode = 'journal'  # 'journal' uploads only the RxCUI details learned in a run, 'snapshot' re-uploads all of SaveRxCUIDetails.csv
+journal_compact_after = 20  # Once there are this many journal files they get merged into SaveRxCUIDetails.csv
+rxnorm_rrf_index_path = None  # Path to an RxNormRRFIndex built from an RxNorm release, None looks everything up on RxNav
+prefetch_before_processing = True  # Resolve the NDCs of every pending CSV/XLSX report before the first one is processed
+rxnorm_rrf_offline = True  # With an index, True never calls RxNav, False still asks RxNav for what the release does not have
+
 def read_csv_to_dicts(filepath, encoding='utf-8', newline='', delimiter=','):
     """
     Accepts a file path for a .csv file to be read, creates a file object,
@@ -93,6 +104,155 @@ def list_files_in_folder(folder_path,dbx):
         print(f'Error listing folder contents: {e}')
         return []
 
+def list_pending_reports(dbx, main_dropbox_folder_path):
+    """
+    Lists the report files waiting in every pharmacy folder (all folders but Processed and ReadyForRedcap).
+    Parameters:
+        dbx: enables dropbox access
+        main_dropbox_folder_path (string): The path to the main SaveRx folder
+    Returns:
+        reports (list): Dropbox paths of the pending files
+    """
+    reports = []
+    for folder in dbx.files_list_folder(main_dropbox_folder_path).entries:
+        if folder.name != "Processed" and folder.name != "ReadyForRedcap":
+            dropbox_folder_path = f'{main_dropbox_folder_path}{folder.name}/'
+            reports.extend(f"{dropbox_folder_path}{nfile}" for nfile in list_files_in_folder(dropbox_folder_path, dbx))
+    return reports
+
+def report_ndcs(file_type, content):
+    """
+    Reads the Escript and Dispensed NDC columns of a downloaded CSV or XLSX report, the columns main_process looks up.
+    Parameters:
+        file_type (string): 'csv' or 'xlsx'
+        content (bytes): The file as downloaded
+    Returns:
+        ndcs (list): The NDC values as they are in the file (blanks included)
+    """
+    if file_type == 'csv':
+        rows = list(csv.reader(io.StringIO(content.decode())))
+    elif file_type == 'xlsx':
+        rows = list(openpyxl.load_workbook(BytesIO(content), read_only=True).active.iter_rows(values_only=True))
+    else:
+        return []
+    if not rows:
+        return []
+    headers = [str(header).lstrip('\ufeff').strip().lower() if header is not None else '' for header in rows[0]]
+    columns = [i for i, header in enumerate(headers) if header in ('escript ndc', 'dispensed ndc')]
+    return [row[i] for row in rows[1:] for i in columns if i < len(row)]
+
+def prefetch_pending_reports(dbx, reports, rxcui_store):
+    """
+    Downloads every pending CSV and XLSX report, collects the distinct NDCs of all of them and warms the lookup caches
+    with CachingProcessSaveRx.prefetch_ndcs before any report is matched. PDF reports are left out, tabula only reads
+    them once during processing. The downloads are kept so each file is only downloaded once.
+    Parameters:
+        dbx: enables dropbox access
+        reports (list): Dropbox paths of the pending files
+        rxcui_store (RxCUIDetailStore): The local store of RxCUI details
+    Returns:
+        downloads (dict): Dropbox path -> (metadata, response) of the files downloaded here
+    """
+    downloads = {}
+    ndcs = []
+    for dropbox_file_path in reports:
+        file_type = get_file_type(dropbox_file_path)
+        if file_type not in ('csv', 'xlsx'):
+            continue
+        try:
+            downloads[dropbox_file_path] = dbx.files_download(dropbox_file_path)
+            ndcs.extend(report_ndcs(file_type, downloads[dropbox_file_path][1].content))
+        except Exception as e:
+            #The file is downloaded and reported again when it is processed
+            print(f"Could not prefetch {dropbox_file_path}: {e}")
+    start_time = time.time()
+    summary = CachingProcessSaveRx.prefetch_ndcs(ndcs, rxcui_index=rxcui_store)
+    print(f"Prefetched {len(downloads)} reports in {time.time() - start_time} seconds: {summary['resolved']} of {summary['ndcs']} NDCs "
+          f"resolved ({summary['ndc_errors']} failed), {summary['fetched']} new RxCUIs fetched ({summary['rxcui_errors']} failed)")
+    return downloads
+
+def download_report(dbx, dropbox_file_path, downloads):
+    """
+    Returns the (metadata, response) of a report, from the prefetch downloads if it is there, otherwise from Dropbox.
+    """
+    if dropbox_file_path in downloads:
+        return downloads.pop(dropbox_file_path)
+    return dbx.files_download(dropbox_file_path)
+
+def compact_rxcui_journal(dbx, processed_path, journal_files):
+    """
+    Merges the journal files into SaveRxCUIDetails.csv so every RxCUI is in there once, then deletes the journal files.
+    Parameters:
+        dbx: enables dropbox access
+        processed_path (string): The path to the Processed folder
+        journal_files (list): Dropbox paths of the journal files, oldest first
+    """
+    saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
+    try:
+        base_rows = download_csv_rows(dbx, saved_rxcui_path)
+    except dropbox.exceptions.ApiError:
+        base_rows = []
+    journal_rows, _ = download_journal_files(dbx, journal_files)
+    compacted = compact_journal(base_rows, journal_rows)
+    dbx.files_upload(rows_to_csv(compacted).encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+    #Only delete the journal files once the base file with their rows is uploaded, another run may have deleted some already
+    for journal_file in journal_files:
+        try:
+            dbx.files_delete_v2(journal_file)
+        except dropbox.exceptions.ApiError as e:
+            if not is_not_found(e):
+                raise
+    print(f"Compacted {len(journal_files)} journal files into {saved_rxcui_path}, {len(compacted)} RxCUIs")
+
+def merge_dropbox_rxcui_details(dbx, rxcui_store, base_rows, processed_path):
+    """
+    Merges SaveRxCUIDetails.csv and its journal files into the local store, before every run. Rows the store already has
+    are left alone (INSERT OR IGNORE), so details saved locally but not synced yet are kept. The journal files are applied
+    newest first, so when several writers saved the same RxCUI the newest row is the one that gets in.
+    Parameters:
+        dbx: enables dropbox access
+        rxcui_store (RxCUIDetailStore): The local store of RxCUI details
+        base_rows (list): The rows of SaveRxCUIDetails.csv
+        processed_path (string): The path to the Processed folder
+    """
+    before = len(rxcui_store)
+    #Journal files compacted by another run since they were listed are skipped, their rows are in the next base file
+    journal_rows, _ = download_journal_files(dbx, list_journal_files(dbx, processed_path))
+    for rows in reversed(journal_rows):
+        rxcui_store.seed(list(reversed(rows)))
+    rxcui_store.seed(base_rows)
+    print(f"Merged {len(rxcui_store) - before} RxCUI details from Dropbox into the local store")
+
+def sync_rxcui_store(dbx, rxcui_store, processed_path):
+    """
+    Sends the RxCUI details learned during this run to Dropbox. In journal mode only the new rows are uploaded, as a
+    small timestamped csv file, and the journal gets compacted once it has journal_compact_after files. In snapshot
+    mode SaveRxCUIDetails.csv is downloaded, merged with the store and uploaded again.
+    Parameters:
+        dbx: enables dropbox access
+        rxcui_store (RxCUIDetailStore): The local store of RxCUI details
+        processed_path (string): The path to the Processed folder
+    """
+    new_rows = rxcui_store.unsynced_rows()
+    if rxcui_sync_mode == 'journal':
+        if new_rows:
+            upload_rxcui_journal(dbx, processed_path, new_rows)
+            rxcui_store.mark_synced(new_rows)
+        journal_files = list_journal_files(dbx, processed_path)
+        if len(journal_files) >= journal_compact_after:
+            compact_rxcui_journal(dbx, processed_path, journal_files)
+    elif new_rows:
+        #Download, merge and upload like compact_rxcui_journal, rows other writers added during the run are kept
+        saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
+        try:
+            base_rows = download_csv_rows(dbx, saved_rxcui_path)
+        except dropbox.exceptions.ApiError:
+            base_rows = []
+        merged = compact_journal(base_rows, [rxcui_store.rows()])
+        dbx.files_upload(rows_to_csv(merged).encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+        rxcui_store.mark_synced(new_rows)
+        print(f"Uploaded {len(merged)} saved RxCUI details to {saved_rxcui_path}")
+
 def main():
 
     ##This first step is done the first time only!
@@ -150,14 +310,19 @@ def main():
         # Specify the Dropbox folder path you want to check or create
         main_dropbox_folder_path = '/AHRQ_R18_Project_SAVERx/'
         processed_path = f'{main_dropbox_folder_path}Processed/'
-        file_prefix = 'NDCtoRXCUI'
-        ndc_data = []
         print(f"The path for the Processed folder is: {processed_path}")
 
         ###This section specifies a path where a saved file of RxCUI information previously pulled from RxNorm would be if it exists. There is a try/except that looks for it  and writes a file if it isn't there.
         # Specify the Dropbox path for the file
         # This file is a saved, and updated, list of previous RxCUI dose forms, strengths and ingredients to prevent repeating API calls.
         dropbox_file_path = '/AHRQ_R18_Project_SAVERx/Processed/SaveRxCUIDetails.csv'
+        #The details are kept in a local SQLite store between runs. Every run merges in the Dropbox file and journal, so rows
+        #other writers (ProcessTysonData, ProcessBremoRetailData, a watcher on another machine) added are not lost
+        rxcui_store = RxCUIDetailStore()
+        if rxnorm_rrf_index_path is not None:
+            #Answer the NDC and RxCUI lookups from the local copy of the RxNorm release
+            rxnav_client.use_local_index(RxNormRRFIndex(rxnorm_rrf_index_path, offline=rxnorm_rrf_offline))
+        rxcui_data = None
         #Look to see if the file exists already
         try:
             # Get metadata for the file
@@ -173,11 +338,13 @@ def main():
                 rxcui_data.append(row)
             print("Saved RxCUIData is Ready")
             rxcui_data = [{key.lstrip('\ufeff'): value for key, value in row.items()} for row in rxcui_data]
-
-            print(rxcui_data)
-        #if the file doesn't exist, create it
+        #if the file doesn't exist, create it (only when there is nothing saved locally, the upload would replace the file)
         except:
             print(f"The file {dropbox_file_path} does not exist.")
+        if rxcui_data is None and len(rxcui_store) > 0:
+            print(f"Keeping the {len(rxcui_store)} RxCUI details saved locally, they are uploaded at the end of the run")
+            rxcui_data = []
+        elif rxcui_data is None:
             #write csv This should only have the first time this program is run.
             new_file_name = "SaveRxCUIDetails.csv"
             saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
@@ -192,84 +359,23 @@ def main():
             csv_writer.writeheader()
             csv_writer.writerows(starter_data)
             dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+            rxcui_data = starter_data
+        merge_dropbox_rxcui_details(dbx, rxcui_store, rxcui_data, processed_path)
+        print(f"Saved RxCUI details ready, {len(rxcui_store)} RxCUIs in {rxcui_store.path}")
 
-        ###This segment of code was built in case we wanted a csv file that would be active as a  "cache" for three months before being rebuilt
-        # for folder in dbx.files_list_folder('/AHRQ_R18_Project_SAVERx/').entries:
-        #     if folder.name == "Processed":
-        #         #print("Yes, Processed Folder Exists")
-        #         # Get a list of files in the folder with the specified prefix
-        #         files_in_folder = list_files_in_folder(processed_path, dbx)
-        #         matching_files = [file for file in files_in_folder if file.startswith(file_prefix)]
-        #         print(matching_files)
-
-        #         # Check if any matching files are found
-        #         if matching_files:
-        #             # Extract and parse the dates from each file
-        #             file_dates = []
-        #             for file in matching_files:
-        #                 date_part = file[len(file_prefix):len(file_prefix) + 8]  # Assuming the date is 8 characters long
-        #                 file_date = datetime.datetime.strptime(date_part, '%Y%m%d')
-        #                 file_dates.append((file, file_date))
-
-        #             # Find the file with the most recent date
-        #             latest_file, latest_date = max(file_dates, key=lambda x: x[1])
-
-        #             # Calculate the difference in months
-        #             months_difference = (datetime.datetime.now().year - latest_date.year) * 12 + datetime.datetime.now().month - latest_date.month
-
-        #             # Check if the difference is greater than 3 months
-        #             if months_difference > 3:
-        #                 print("The current date is more than 3 months after the date in the latest file:", latest_file)
-        #                 #Erase Old File and Create a New One
-        #                 print(f'{processed_path}{latest_file}')
-        #                 dbx.files_delete(f'{processed_path}{latest_file}')
-        #                 print(f"File '{latest_file}' has been deleted.")
-
-        #                 #Create New File
-        #                 new_file_name = f"NDCtoRXCUI{datetime.datetime.now().strftime('%Y%m%d')}.csv"
-        #                 new_file_path = f'{processed_path}{new_file_name}'
-        #                 new_file_headers = ['NDC','RxCUI']
-        #                 starter_data = [{'NDC':'52268010001','RxCUI':'966922'}, {'NDC':'781555531','RxCUI':'242438'}]
-        #                 csv_buffer = StringIO()
-        #                 csv_writer = csv.DictWriter(csv_buffer, fieldnames=new_file_headers)
-        #                 # Write the CSV data to the buffer
-        #                 csv_writer.writeheader()
-        #                 csv_writer.writerows(starter_data)
-        #                 dbx.files_upload(csv_buffer.getvalue().encode(), new_file_path, mode=dropbox.files.WriteMode("overwrite"))
-
-        #                 print(f"New file '{new_file_name}' has been created and uploaded to Dropbox.")
-        #             else:
-        #                 print("The current date is not more than 3 months after the date in the latest file:", latest_file)
-        #                 saved_ndcs = f'{processed_path}{latest_file}'
-        #                 print(saved_ndcs)
-        #                 # Download the file from Dropbox directly into memory
-        #                 metadata, f = dbx.files_download(saved_ndcs)
-        #                 # Parse the CSV data into a list of dictionaries
-        #                 #ndc_data = []
-        #                 csv_reader = csv.DictReader(f.content.decode().splitlines(), delimiter=',')
-        #                 for row in csv_reader:
-        #                     ndc_data.append(row)
-        #                 print("Saved NDC/RxCUIData is Ready")
-        #                 ndc_data = [{key.lstrip('\ufeff'): value for key, value in row.items()} for row in ndc_data]
-        #                 print(ndc_data)
-        #                 #Continue and use this file in the process. Use 'a' function
-
-        #         else:
-        #             print("No matching files found.")
-        #             #Create New File
-        #             new_file_name = f"NDCtoRXCUI{datetime.datetime.now().strftime('%Y%m%d')}.csv"
-        #             new_file_path = f'{processed_path}{new_file_name}'
-        #             new_file_headers = ['NDC','RxCUI']
-        #             starter_data = [{'NDC':'52268010001','RxCUI':'966922'}, {'NDC':'781555531','RxCUI':'242438'}]
-        #             csv_buffer = StringIO()
-        #             csv_writer = csv.DictWriter(csv_buffer, fieldnames=new_file_headers)
-        #             # Write the CSV data to the buffer
-        #             csv_writer.writeheader()
-        #             csv_writer.writerows(starter_data)
-        #             dbx.files_upload(csv_buffer.getvalue().encode(), new_file_path, mode=dropbox.files.WriteMode("overwrite"))
+        ###NDC -> RxCUI mappings are saved between runs in CachingProcessSaveRx.get_ndc_store() (NDCRxCUIStore), each with the date it
+        ###was looked up. Entries older than three months (ndc_cache_ttl_days) are looked up again, so clear those out here.
+        ndc_store = CachingProcessSaveRx.get_ndc_store()
+        expired_ndcs = ndc_store.purge_expired()
+        print(f"Saved NDC/RxCUI Data is Ready, {len(ndc_store)} NDCs saved and {expired_ndcs} expired entries removed")
 
         #########################################
 
+        ###Resolve the NDCs of all the pending reports at once, so processing each file afterwards is mostly cache hits
+        downloads = {}
+        if prefetch_before_processing:
+            downloads = prefetch_pending_reports(dbx, list_pending_reports(dbx, main_dropbox_folder_path), rxcui_store)
+
         ####Start the process of looking for new files sent by pharmacies that we need to process!
         for folder in dbx.files_list_folder('/AHRQ_R18_Project_SAVERx/').entries: #Look in our main folder to see what folders exist, other than Process and ReadyforRedcap (these our ours, not pharmacies)
             if folder.name != "Processed" and folder.name != "ReadyForRedcap":
@@ -292,8 +398,8 @@ def main():
                     ###This still needs to fix the headers.
                     if file_type == 'csv':
                         try:
-                            # Download the file from Dropbox directly into memory
-                            metadata, f = dbx.files_download(dropbox_file_path)
+                            # Download the file from Dropbox directly into memory (or take the copy the prefetch downloaded)
+                            metadata, f = download_report(dbx, dropbox_file_path, downloads)
 
                             # Parse the CSV data into a list of dictionaries
                             data = []
@@ -325,11 +431,13 @@ def main():
                                     new_dict[key.lower()] = value
                                 # Replace the original dictionary with the modified one
                                 data[data.index(d)] = new_dict
+                            # Put every NDC column in its canonical 11 digit form
+                            canonicalize_ndc_columns(data, ['escript ndc', 'prescribed ndc', 'dispensed ndc'])
 
                             pp.pprint(data[0:10])
                             print("Data is Ready to Head to Process Through SaveRx")
                             # Send to CachingProcessSaveRx the data from the pharmacy file, the name of this redcap_group, the name of the file (without the extension, and the saved rxcui_data)
-                            ready_nfile, errors, second_errors, new_rxcui_data = CachingProcessSaveRx.main_process(data, redcap_group, name, rxcui_data)
+                            ready_nfile, errors, second_errors, new_rxcui_data = CachingProcessSaveRx.main_process(data, redcap_group, name, [], rxcui_index=rxcui_store)
                             print("Processing RxNorm information Complete! Onto uploading to Dropbox and Sending to Redcap")
 
                         except Exception as e:
@@ -359,25 +467,15 @@ def main():
                         # print(destination_path)
                         # dbx.files_move_v2(source_path, destination_path)
 
-                        #Append new_rxcui_data to the rxcui_data
-                        rxcui_data.extend(new_rxcui_data)
-                        fieldnames2 = ['RxCUI', 'RxNorm Name', 'RxNorm TTY', 'RxNorm Ingredient', 'RxNorm Dose Form', 'RxNorm Strength Details',
-                                         'C RxNorm Name', 'C RxNorm TTY', 'C RxNorm RxCUI', 'C RxNorm Ingredient', 'C RxNorm Dose Form', 'C RxNorm Strength Details']
-                        new_file_name = "SaveRxCUIDetails.csv"
-                        saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
-                        csv_buffer = StringIO()
-                        csv_writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames2)
-                        # Write the CSV data to the buffer
-                        csv_writer.writeheader()
-                        csv_writer.writerows(rxcui_data)
-                        dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+                        #new_rxcui_data is already saved in rxcui_store, it gets synced to Dropbox once at the end of the run
+                        print(f"{len(new_rxcui_data)} new RxCUI details saved locally")
 
 
                     elif file_type == 'xlsx':
                         data = []
                         try:
-                            # Download the XLSX file directly into memory
-                            metadata, response = dbx.files_download(dropbox_file_path)
+                            # Download the XLSX file directly into memory (or take the copy the prefetch downloaded)
+                            metadata, response = download_report(dbx, dropbox_file_path, downloads)
                             xlsx_data = BytesIO(response.content)
 
                             # Load the XLSX data into openpyxl
@@ -414,7 +512,7 @@ def main():
                                 cleaned_up_file = CleanExcelSaveRxFiles.main_process(data)
                             # print("Cleaned and ready to go")
                             #Send to CachingProcessSaveRx the cleanedup_data from the pharmacy file, the name of this redcap_group, the name of the file (without the extension, and the saved rxcui_data)
-                            ready_nfile, errors, second_errors, new_rxcui_data = CachingProcessSaveRx.main_process(cleaned_up_file, redcap_group, name, rxcui_data)
+                            ready_nfile, errors, second_errors, new_rxcui_data = CachingProcessSaveRx.main_process(cleaned_up_file, redcap_group, name, [], rxcui_index=rxcui_store)
                             print(type(ready_nfile))
                         except Exception as e:
                             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -444,18 +542,8 @@ def main():
                         print(destination_path)
                         dbx.files_move_v2(source_path, destination_path)
 
-                        #Append new_rxcui_data to the rxcui_data
-                        rxcui_data.extend(new_rxcui_data)
-                        fieldnames2 = ['RxCUI', 'RxNorm Name', 'RxNorm TTY', 'RxNorm Ingredient', 'RxNorm Dose Form', 'RxNorm Strength Details',
-                                         'C RxNorm Name', 'C RxNorm TTY', 'C RxNorm RxCUI', 'C RxNorm Ingredient', 'C RxNorm Dose Form', 'C RxNorm Strength Details']
-                        new_file_name = "SaveRxCUIDetails.csv"
-                        saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
-                        csv_buffer = StringIO()
-                        csv_writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames2)
-                        # Write the CSV data to the buffer
-                        csv_writer.writeheader()
-                        csv_writer.writerows(rxcui_data)
-                        dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+                        #new_rxcui_data is already saved in rxcui_store, it gets synced to Dropbox once at the end of the run
+                        print(f"{len(new_rxcui_data)} new RxCUI details saved locally")
 
                     ### Original Read in of PDF without page numbers
                     # elif file_type == 'pdf':
@@ -557,26 +645,8 @@ def main():
 
                                         # Extend the all_data_dicts list with current page's dictionaries
                                         all_data_dicts.extend(current_page_dict_list)
-                                    for entry in all_data_dicts:
-                                        escript_ndc = entry.get('escript ndc')
-                                        dscript_ndc = entry.get('dispensed ndc')
-                                        # Check if the value is a number and not NaN
-                                        if isinstance(escript_ndc, float) and not math.isnan(escript_ndc):
-                                            # Convert to integer
-                                            print(type(escript_ndc))
-                                            entry['escript ndc'] = int(escript_ndc)
-                                            print(type(entry['escript ndc']))
-                                        else:
-                                            # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                            entry['escript ndc'] = None  # or some other default value, or don't modify the entry at all
-                                        if isinstance(dscript_ndc, float) and not math.isnan(dscript_ndc):
-                                            # Convert to integer
-                                            entry['dispensed ndc'] = int(dscript_ndc)
-                                        elif isinstance(dscript_ndc, int) and not math.isnan(dscript_ndc):
-                                            entry['dispensed ndc'] = dscript_ndc
-                                        else:
-                                            # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                            entry['dispensed ndc'] = None  # or some other default value, or don't modify the entry at all
+                                    # Put the NDCs tabula read (floats, ints or text) in their canonical 11 digit form, blank ones become ''
+                                    canonicalize_ndc_columns(all_data_dicts, ['escript ndc', 'dispensed ndc'])
                                     pp.pprint(all_data_dicts[0:3])
 
 
@@ -621,46 +691,14 @@ def main():
                                         # # Extend the all_data_dicts list with current page's dictionaries
                                         # all_data_dicts.extend(current_page_dict_list)
                                         pp.pprint(all_data_dicts)
-                                        for entry in all_data_dicts:
-                                            escript_ndc = entry.get('escript ndc')
-                                            dscript_ndc = entry.get('dispensed ndc')
-                                            # Check if the value is a number and not NaN
-                                            if isinstance(escript_ndc, float) and not math.isnan(escript_ndc):
-                                                # Convert to integer
-                                                entry['escript ndc'] = int(escript_ndc)
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['escript ndc'] = None  # or some other default value, or don't modify the entry at all
-                                            if isinstance(dscript_ndc, float) and not math.isnan(dscript_ndc):
-                                                # Convert to integer
-                                                entry['dispensed ndc'] = int(dscript_ndc)
-                                            elif isinstance(dscript_ndc, int) and not math.isnan(dscript_ndc):
-                                                entry['dispensed ndc'] = dscript_ndc
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['dispensed ndc'] = None  # or some other default value, or don't modify the entry at all
+                                        # Put the NDCs tabula read (floats, ints or text) in their canonical 11 digit form, blank ones become ''
+                                        canonicalize_ndc_columns(all_data_dicts, ['escript ndc', 'dispensed ndc'])
                                         # pp.pprint(all_data_dicts[100:200])
                                             # Raise an error or handle the case where the DataFrame has more columns than expected
                                     except:
                                         ValueError(f"DataFrame has more columns than expected. Page: {page}")
-                                        for entry in all_data_dicts:
-                                            escript_ndc = entry.get('escript ndc')
-                                            dscript_ndc = entry.get('dispensed ndc')
-                                            # Check if the value is a number and not NaN
-                                            if isinstance(escript_ndc, float) and not math.isnan(escript_ndc):
-                                                # Convert to integer
-                                                entry['escript ndc'] = int(escript_ndc)
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['escript ndc'] = None  # or some other default value, or don't modify the entry at all
-                                            if isinstance(dscript_ndc, float) and not math.isnan(dscript_ndc):
-                                                # Convert to integer
-                                                entry['dispensed ndc'] = int(dscript_ndc)
-                                            elif isinstance(dscript_ndc, int) and not math.isnan(dscript_ndc):
-                                                entry['dispensed ndc'] = dscript_ndc
-                                            else:
-                                                # Handle NaN values (or any non-numeric values) here, for example, by setting to a default value or skipping the entry
-                                                entry['dispensed ndc'] = None  # or some other default value, or don't modify the entry at all
+                                        # Put the NDCs tabula read (floats, ints or text) in their canonical 11 digit form, blank ones become ''
+                                        canonicalize_ndc_columns(all_data_dicts, ['escript ndc', 'dispensed ndc'])
 
                                 fieldnames = ['escript prescribed item', 'escript ndc', 'prescribed item', 'prescribed ndc', 'dispensed item', 'dispensed ndc', 'prescribed qty', 'quantity_unit', "recommended days' supply", 'prescribed refills', 'dispensed qty', "dispensed days' supply", 'page_number']
                                 pp.pprint(all_data_dicts[-10:])
@@ -722,7 +760,7 @@ def main():
                                     data.append(row)
                                 print("Data is Ready to Head to Process Through SaveRx")
                                 #Send to CachingProcessSaveRx the cleanedup_data from the pharmacy file, the name of this redcap_group, the name of the file (without the extension, and the saved rxcui_data)
-                                ready_nfile, errors, second_errors, new_rxcui_data = CachingProcessSaveRx.main_process(data, redcap_group, name, rxcui_data)
+                                ready_nfile, errors, second_errors, new_rxcui_data = CachingProcessSaveRx.main_process(data, redcap_group, name, [], rxcui_index=rxcui_store)
                                 print(len(ready_nfile))
 
                                 fieldnames = ['record_id', 'report_id', 'redcap_data_access_group', 'report_row_number', 'match_status', 'incorrect_action___1', 'incorrect_action___2','incorrect_action___3','incorrect_action___4','erx_ndc', 'erx_ingredient', 'erx_dose_form', 'erx_strength', 'medication_prescribed', 'medication_dispensed', 'pharm_ndc', 'pharm_ingredient', 'pharm_dose_form', 'pharm_strength', 'page_number']
@@ -756,18 +794,8 @@ def main():
                                 # print(destination_path2)
                                 # dbx.files_move_v2(source_path, destination_path2)
 
-                                #Append new_rxcui_data to the rxcui_data
-                                rxcui_data.extend(new_rxcui_data)
-                                fieldnames2 = ['RxCUI', 'RxNorm Name', 'RxNorm TTY', 'RxNorm Ingredient', 'RxNorm Dose Form', 'RxNorm Strength Details',
-                                                    'C RxNorm Name', 'C RxNorm TTY', 'C RxNorm RxCUI', 'C RxNorm Ingredient', 'C RxNorm Dose Form', 'C RxNorm Strength Details']
-                                new_file_name = "SaveRxCUIDetails.csv"
-                                saved_rxcui_path = f'{processed_path}SaveRxCUIDetails.csv'
-                                csv_buffer = StringIO()
-                                csv_writer = csv.DictWriter(csv_buffer, fieldnames=fieldnames2)
-                                # Write the CSV data to the buffer
-                                csv_writer.writeheader()
-                                csv_writer.writerows(rxcui_data)
-                                dbx.files_upload(csv_buffer.getvalue().encode(), saved_rxcui_path, mode=dropbox.files.WriteMode("overwrite"))
+                                #new_rxcui_data is already saved in rxcui_store, it gets synced to Dropbox once at the end of the run
+                                print(f"{len(new_rxcui_data)} new RxCUI details saved locally")
 
                         except Exception as e:
                             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -775,6 +803,10 @@ def main():
                             # print(f"Error processing {ready_nfile.name}: {e}")
 
 
+        #Sync the saved RxCUI details to Dropbox once, now that every file has been processed
+        sync_rxcui_store(dbx, rxcui_store, processed_path)
+        rxcui_store.close()
+
     except AuthError as e:
             print("Error refreshing access token:", e)
     print("All Folders Checked, Process Complete")
@@ -0,0 +1,108 @@
+import itertools
+import unittest
+from MatchRules import match_rules
+
+#Regression test for moving the dose form exceptions of ProcessTysonData/ProcessBremoRetailData into MatchRules.json.
+#baseline_branded and baseline_unbranded are the elif chains the two pipelines had before, giving the incorrect_action3
+#they set: 0 (dose forms match), '' (an exception covered the ingredients but not the dose forms) or 1 (no exception).
+#Unbranded outcomes are unchanged. Branded outcomes change only for ondansetron and the chewable ingredients, listed in
+#BrandedChanges: the old branded checks compared strings RxNorm never gives ("Distintegrating", "Chewable Tablet") and
+#stopped at the first exception whose ingredient matched.
+
+chewable_ingredients = ["ascorbic acid", "loratadine", "melatonin", "cetrizine hydrochloride", "calcium ion, cholecalciferol"]
+aspirin_dose_forms = [('Oral Tablet, Oral Product, Pill', 'Delayed Release Oral Tablet, Oral Product, Pill'),
+                      ('Oral Capsule, Oral Product, Pill', 'Delayed Release Oral Capsule, Oral Product, Pill'),
+                      ('Oral Tablet, Oral Product, Pill', 'Delayed Release Oral Capsule, Oral Product, Pill'),
+                      ('Oral Capsule, Oral Product, Pill', 'Delayed Release Oral Tablet, Oral Product, Pill'),
+                      ('Chewable Tablet, Oral Product, Pill', 'Delayed Release Oral Tablet, Oral Product, Pill')]
+
+tablet = 'Oral Tablet, Oral Product, Pill'
+delayed_release_tablet = 'Delayed Release Oral Tablet, Oral Product, Pill'
+disintegrating_tablet = 'Disintegrating Oral Tablet, Oral Product, Pill, Disintegrating Oral Product'
+misspelled_disintegrating_tablet = 'Disintegrating Oral Tablet, Oral Product, Pill, Distintegrating Oral Product'
+chewable_tablet = 'Chewable Tablet, Oral Product, Pill, Chewable Product'
+
+def baseline_branded(d, n, h, r, e, o, i, s):
+    if (d.lower() == 'aspirin' and n.lower() == 'aspirin') or (d.lower() == 'aspirin' and r.lower() == 'aspirin') or (h.lower() == 'aspirin' and n.lower() == 'aspirin') or (h.lower() == 'aspirin' and r.lower() == 'aspirin'):
+        if any((x, y) in aspirin_dose_forms for x in (e, i) for y in (o, s)):
+            return 0
+        return ''
+    elif (d.lower() == "ondansetron hydrochloride" and n.lower() == "ondansetron hydrochloride") or (d.lower() == 'ondansetron hydrochloride' and r.lower() == 'ondansetron hydrochloride') or (h.lower() == 'ondansetron hydrochloride' and n.lower() == 'ondansetron hydrochloride') or (h.lower() == 'ondansetron hydrochloride' and r.lower() == 'ondansetron hydrochloride'):
+        if any(x == tablet and y == misspelled_disintegrating_tablet for x in (e, i) for y in (o, s)):
+            return 0
+        return ''
+    for ingredient1, ingredient2, form1, form2 in ((d, n, e, o), (d, r, e, s), (h, n, i, o), (h, r, i, s)):
+        if ingredient1.lower() == ingredient2.lower() and ingredient1.lower() in chewable_ingredients:
+            if (form1 == "Chewable Tablet" and form2 == "Oral Tablet") or (form2 == "Chewable Tablet" and form1 == "Oral Tablet"):
+                return 0
+            return ''
+    return 1
+
+def baseline_unbranded(d, n, e, o):
+    if d.lower() == 'aspirin' and n.lower() == 'aspirin':
+        return 0 if (e, o) in aspirin_dose_forms else ''
+    elif d.lower() == "ondansetron hydrochloride" and n.lower() == "ondansetron hydrochloride":
+        return 0 if (e == tablet and o == disintegrating_tablet) else ''
+    elif d.lower() == n.lower() and d.lower() in chewable_ingredients:
+        return 0 if (e == chewable_tablet and o == tablet) or (o == chewable_tablet and e == tablet) else ''
+    return 1
+
+def incorrect_action3(dose_form_exception):
+    #What the pipelines set from MatchRules.dose_form_exception
+    if dose_form_exception is None:
+        return 1
+    return 0 if dose_form_exception else ''
+
+def current_branded(d, n, h, r, e, o, i, s):
+    return incorrect_action3(match_rules.dose_form_exception([(d, n), (d, r), (h, n), (h, r)], [(e, o), (e, s), (i, o), (i, s)]))
+
+def current_unbranded(d, n, e, o):
+    return incorrect_action3(match_rules.dose_form_exception([(d, n)], [(e, o)]))
+
+ingredients = ['aspirin', 'Ondansetron Hydrochloride', 'melatonin', 'ibuprofen']
+prescribed_forms = [tablet, 'Oral Capsule, Oral Product, Pill', chewable_tablet, 'Chewable Tablet', 'Oral Tablet']
+dispensed_forms = [tablet, delayed_release_tablet, disintegrating_tablet, misspelled_disintegrating_tablet, chewable_tablet, 'Oral Tablet', 'Chewable Tablet']
+
+class UnbrandedUnchanged(unittest.TestCase):
+    def test_every_pair(self):
+        for d, n in itertools.product(ingredients + ['loratadine'], repeat=2):
+            for e, o in itertools.product(prescribed_forms + dispensed_forms, repeat=2):
+                self.assertEqual(current_unbranded(d, n, e, o), baseline_unbranded(d, n, e, o), (d, n, e, o))
+
+class BrandedChanges(unittest.TestCase):
+    def test_only_ondansetron_and_chewables_change(self):
+        for d, n, h, r in itertools.product(ingredients, repeat=4):
+            for e, i in itertools.product(prescribed_forms, repeat=2):
+                for o, s in itertools.product(dispensed_forms, repeat=2):
+                    before = baseline_branded(d, n, h, r, e, o, i, s)
+                    after = current_branded(d, n, h, r, e, o, i, s)
+                    if before != after:
+                        matched = {x.lower() for x, y in ((d, n), (d, r), (h, n), (h, r)) if x.lower() == y.lower()}
+                        self.assertTrue(matched & {'ondansetron hydrochloride', 'melatonin'}, (d, n, h, r, e, o, i, s, before, after))
+
+    def test_before_and_after(self):
+        #(d, n, h, r, e, o, i, s), incorrect_action3 before, incorrect_action3 after
+        cases = [
+            #Aspirin is unchanged, any of its dose form pairs in any position
+            (('aspirin', 'aspirin', 'x', 'y', tablet, tablet, tablet, delayed_release_tablet), 0, 0),
+            (('aspirin', 'aspirin', 'x', 'y', tablet, tablet, tablet, tablet), '', ''),
+            #Ondansetron compared the misspelled dose form, so an ODT never matched before
+            (('ondansetron hydrochloride', 'ondansetron hydrochloride', 'x', 'y', tablet, disintegrating_tablet, tablet, tablet), '', 0),
+            (('ondansetron hydrochloride', 'ondansetron hydrochloride', 'x', 'y', tablet, misspelled_disintegrating_tablet, tablet, tablet), 0, ''),
+            #Chewables compared the bare names RxNorm never gives, the full dose forms of the matching pair now match
+            (('melatonin', 'melatonin', 'x', 'y', chewable_tablet, tablet, tablet, tablet), '', 0),
+            (('melatonin', 'melatonin', 'x', 'y', 'Chewable Tablet', 'Oral Tablet', tablet, tablet), 0, ''),
+            #Only the dose forms paired with the matching ingredients count for a chewable
+            (('melatonin', 'melatonin', 'x', 'y', tablet, tablet, chewable_tablet, tablet), '', ''),
+            (('x', 'y', 'melatonin', 'melatonin', tablet, tablet, chewable_tablet, tablet), '', 0),
+            #Every exception that covers the ingredients is checked, not only the first one
+            (('aspirin', 'aspirin', 'melatonin', 'melatonin', tablet, tablet, chewable_tablet, tablet), '', 0),
+            #No exception covers the ingredients
+            (('ibuprofen', 'ibuprofen', 'x', 'y', tablet, delayed_release_tablet, tablet, tablet), 1, 1),
+        ]
+        for values, before, after in cases:
+            self.assertEqual(baseline_branded(*values), before, values)
+            self.assertEqual(current_branded(*values), after, values)
+
+if __name__ == '__main__':
+    unittest.main()